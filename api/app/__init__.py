@@ -1,23 +1,59 @@
 import os
-from flask import Flask
+from flask import Flask, g, request
 from flask_cors import CORS
 
 from app.config import config
 from app.auth import auth_bp
 from app.routes import routes_bp
+from app.health import health_bp, metrics_bp
 from app.events import socketio
 from app.config import get_db
+from app.extensions import Services
+from app.logs import setup_logging
+from app.metrics import metrics, track
+from app.protocol import outbound
+from app.serializers import FastJSONProvider
 
-def create_app():
+def create_app(db=None):
+  """Build the app; ``db`` defaults to the configured MongoDB database."""
+  setup_logging(config['log_level'])
   app = Flask(__name__)
+  app.json = FastJSONProvider(app)
   app.config['SECRET_KEY'] = config['secret_key']
 
   CORS(app, resources={r"/api/*": {"origins": "*"}})
   app.register_blueprint(auth_bp, url_prefix='/api/auth')
   app.register_blueprint(routes_bp, url_prefix='/api/diskuss')
+  app.register_blueprint(health_bp, url_prefix='/health')
+  app.register_blueprint(metrics_bp)
 
-  get_db()
+  services = Services(db if db is not None else get_db())
+  app.extensions['diskuss'] = services
+  services.register_gauges(metrics)
+  if config['ensure_indexes']:
+    services.ensure_indexes_in_background()
 
-  socketio.init_app(app)
+  @app.before_request
+  def start_route_timer():
+    rule = request.url_rule.rule if request.url_rule else "unmatched"
+    g.route_timer = track("route", f"{request.method} {rule}", config['db_ops_warning'])
+    g.route_timer.__enter__()
 
-  return app
\ No newline at end of file
+  @app.teardown_request
+  def stop_route_timer(error=None):
+    timer = g.pop('route_timer', None)
+    if timer is not None:
+      if error is not None:
+        timer.__exit__(type(error), error, error.__traceback__)
+      else:
+        timer.__exit__(None, None, None)
+
+  socketio.init_app(
+    app,
+    message_queue=config['socketio_message_queue'],
+    async_mode=config['async_mode'],
+  )
+  # slow consumers get coalesced or dropped instead of buffering without bound
+  outbound.install(socketio.server)
+
+  return app
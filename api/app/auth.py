@@ -1,19 +1,45 @@
 import datetime
 import jwt
-import bcrypt
 from flask import Blueprint, request, jsonify
 from app.config import config
+from app.extensions import user_handler
+from app.passwords import HasherBusy, PasswordHasher
+from app.ratelimit import RateLimiter, create_rate_limit_store
+from app.serializers import serialize_user
+from app.sockets import socketio
 
 
-user_db = config['db'].users
-
 auth_bp = Blueprint('auth', __name__)
 
+# bcrypt runs on OS threads so a login never stalls the event loop serving sockets
+hasher = PasswordHasher(
+    rounds=config['bcrypt_rounds'],
+    workers=config['password_hash_workers'],
+    max_waiting=config['password_hash_queue'],
+    get_async_mode=lambda: socketio.async_mode or 'threading',
+)
+
+# every attempt costs a hash, so attempts are limited before hashing
+_limits = create_rate_limit_store(config['rate_limit_backend'], config['redis_url'])
+login_ip_limit = RateLimiter('login_ip', _limits, config['login_limit_per_ip'], config['rate_limit_window'])
+login_username_limit = RateLimiter(
+    'login_username', _limits, config['login_limit_per_username'], config['rate_limit_window']
+)
+signup_ip_limit = RateLimiter('signup_ip', _limits, config['signup_limit_per_ip'], config['rate_limit_window'])
+signup_username_limit = RateLimiter(
+    'signup_username', _limits, config['signup_limit_per_username'], config['rate_limit_window']
+)
+
 def hash_password(password):
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+    return hasher.hash(password)
 
 def check_password(hashed_password, password):
-    return bcrypt.checkpw(password.encode('utf-8'), hashed_password.encode('utf-8'))
+    return hasher.check(hashed_password, password)
+
+def retry_later(message, status, retry_after):
+    response = jsonify({'message': message})
+    response.headers['Retry-After'] = str(retry_after)
+    return response, status
 
 @auth_bp.route('/login', methods=['POST'])
 def login():
@@ -23,12 +49,22 @@ def login():
 
     if not all([username, password]):
         return jsonify({'message': 'Missing credentials'}), 400
-    
-    user = user_db.find_one({"username": username})
-    if not user or not check_password(user['password'], password):
-        return jsonify({'message': 'Invalid credentials'}), 401
-    
-    user_db.update_one({"_id": user['_id']}, {"$set": {"last_login": datetime.datetime.now(datetime.timezone.utc)}})
+
+    retry_after = login_ip_limit.hit(request.remote_addr) or login_username_limit.hit(username)
+    if retry_after:
+        return retry_later('Too many login attempts', 429, retry_after)
+
+    user = user_handler.get_user_by_username(username)
+    try:
+        if not user or not check_password(user['password'], password):
+            return jsonify({'message': 'Invalid credentials'}), 401
+        # upgrade hashes made with an older cost while the password is at hand
+        if hasher.needs_rehash(user['password']):
+            user_handler.set_password(user['_id'], hash_password(password))
+    except HasherBusy:
+        return retry_later('Server busy', 503, 1)
+
+    user_handler.touch_last_login(user['_id'])
     user_id = str(user['_id'])
 
     token = jwt.encode({
@@ -37,12 +73,8 @@ def login():
         'exp': datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(hours=10000)
     }, config['secret_key'], algorithm='HS256')
 
-    # make sure to remove the password from the user object before returning and to make user  JSON serializable
-    user['_id'] = str(user['_id'])
-    
-    del user['password']
-
-    return jsonify({'token': token, 'user': user, 'message': 'SUCCESS'}), 200
+    # only public fields leave; never the password hash or search keys
+    return jsonify({'token': token, 'user': serialize_user(user), 'message': 'SUCCESS'}), 200
 
 
 @auth_bp.route('/signup', methods=['POST'])
@@ -51,19 +83,21 @@ def signup():
     username = data.get('username')
     password = data.get('password')
 
-    data = request.get_json()
-    username = data.get('username')
-    password = data.get('password')
-
     if not all([username, password]):
         return jsonify({'message': 'Missing credentials'}), 400
 
-    if user_db.find_one({"username": username}):
+    retry_after = signup_ip_limit.hit(request.remote_addr) or signup_username_limit.hit(username)
+    if retry_after:
+        return retry_later('Too many signups', 429, retry_after)
+
+    if user_handler.get_user_by_username(username):
         return jsonify({'message': 'Username already exists'}), 400
 
-    user = {"username": username, "password": hash_password(password)}
-    result = user_db.insert_one(user)
-    user_id = str(result.inserted_id)
+    try:
+        password_hash = hash_password(password)
+    except HasherBusy:
+        return retry_later('Server busy', 503, 1)
+    user_id = str(user_handler.create_user(username, password_hash))
 
     token = jwt.encode({
         'user_id': user_id,
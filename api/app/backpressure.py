@@ -0,0 +1,139 @@
+"""Bounds on what the server buffers for slow Socket.IO consumers.
+
+Every packet for a socket waits in its Engine.IO queue until the socket's
+transport writes it out. A client that reads slower than it is sent to
+makes that queue, and the worker's memory, grow without end. The guard
+watches the queue length of each socket of this worker as packets are sent:
+
+- past ``soft_limit`` packets, emits that a later one supersedes (typing,
+  inbox deltas) are held back for the socket, latest per event and room,
+  and sent once the queue is back under the limit;
+- at ``max_queued`` packets, the socket is disconnected and its queue
+  freed. The client reconnects and catches up through ``sync``.
+"""
+import logging
+import threading
+from app.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+metrics.counter(
+    "diskuss_backpressure_total",
+    "Emits held back for slow sockets, sent after they caught up, and slow sockets disconnected.",
+)
+
+
+class OutboundGuard:
+    """Per-socket outbound queue limits, installed on a Socket.IO server.
+
+    ``resend(event, payload, sid)`` emits a held payload to one socket in
+    its own format.
+    """
+
+    def __init__(self, soft_limit, max_queued, resend, interval=0.1):
+        self.soft_limit = soft_limit
+        self.max_queued = max_queued
+        self.resend = resend
+        self.interval = interval
+        self.server = None
+        self._send_packet = None
+        # engine.io sids seen past the soft limit, and those being dropped
+        self._backlogged = set()
+        self._dropping = set()
+        # socket sid -> {(event, room): payload}
+        self._held = {}
+        self._draining = False
+        self._lock = threading.Lock()
+
+    def install(self, server):
+        """Route every packet ``server`` sends through the queue limits."""
+        self.server = server
+        self._send_packet = server.eio.send_packet
+        server.eio.send_packet = self._send
+
+    def queued(self, eio_sid):
+        socket = self.server.eio.sockets.get(eio_sid)
+        return socket.queue.qsize() if socket is not None else None
+
+    def _send(self, eio_sid, pkt):
+        if eio_sid in self._dropping:
+            return
+        queued = self.queued(eio_sid) or 0
+        if self.max_queued and queued >= self.max_queued:
+            self._drop(eio_sid, queued)
+            return
+        if self.soft_limit and queued >= self.soft_limit:
+            self._backlogged.add(eio_sid)
+        self._send_packet(eio_sid, pkt)
+
+    def _drop(self, eio_sid, queued):
+        with self._lock:
+            if eio_sid in self._dropping:
+                return
+            self._dropping.add(eio_sid)
+        logger.warning("Disconnecting slow socket %s with %d packets queued", eio_sid, queued)
+        metrics.inc("diskuss_backpressure_total", action="disconnected")
+        # closing runs the disconnect handlers; keep them off the emitting thread
+        self.server.start_background_task(self._disconnect, eio_sid)
+
+    def _disconnect(self, eio_sid):
+        eio = self.server.eio
+        socket = eio.sockets.get(eio_sid)
+        try:
+            if socket is not None:
+                socket.close(wait=False, abort=True)
+                eio.sockets.pop(eio_sid, None)
+        finally:
+            with self._lock:
+                self._dropping.discard(eio_sid)
+                self._backlogged.discard(eio_sid)
+
+    def hold(self, event, payload, rooms):
+        """Hold ``payload`` back for the backlogged sockets in ``rooms``.
+
+        ``rooms`` are the variants of one room, one per protocol. Returns the
+        sids of the sockets held for, for the emit to skip, or None.
+        """
+        if not self._backlogged:
+            return None
+        manager = self.server.manager
+        skipped = []
+        with self._lock:
+            for sid, eio_sid in manager.get_participants("/", rooms):
+                if eio_sid not in self._backlogged:
+                    continue
+                if (self.queued(eio_sid) or 0) < self.soft_limit:
+                    self._backlogged.discard(eio_sid)
+                    continue
+                self._held.setdefault(sid, {})[(event, rooms[0])] = payload
+                skipped.append(sid)
+            start = bool(skipped) and not self._draining
+            self._draining = self._draining or start
+        if skipped:
+            metrics.inc("diskuss_backpressure_total", len(skipped), action="held")
+        if start:
+            self.server.start_background_task(self._drain)
+        return skipped or None
+
+    def _drain(self):
+        manager = self.server.manager
+        while True:
+            self.server.sleep(self.interval)
+            ready = []
+            with self._lock:
+                for sid in list(self._held):
+                    eio_sid = manager.eio_sid_from_sid(sid, "/")
+                    queued = self.queued(eio_sid) if eio_sid else None
+                    if queued is None:
+                        # gone; it will sync when it comes back
+                        del self._held[sid]
+                    elif queued < self.soft_limit:
+                        ready.append((sid, self._held.pop(sid)))
+                        self._backlogged.discard(eio_sid)
+                self._draining = bool(self._held)
+            for sid, held in ready:
+                for (event, _), payload in held.items():
+                    self.resend(event, payload, sid)
+                metrics.inc("diskuss_backpressure_total", len(held), action="resent")
+            if not self._draining:
+                return
@@ -0,0 +1,94 @@
+import threading
+import time
+from app.metrics import metrics
+
+metrics.counter("diskuss_coalesced_events_total", "Ephemeral events by kind, emitted or folded into a later emit.")
+
+
+class Coalescer:
+    """Emits at most once per ``interval`` per key; the latest payload wins.
+
+    The first event for a key goes out immediately. Events arriving within
+    the interval replace each other and the last one is sent when it ends,
+    so a burst of keystrokes costs two emits and the final state is never lost.
+    ``start_task(fn, *args)`` and ``sleep(seconds)`` come from the Socket.IO
+    server so the trailing emit runs on the right kind of thread.
+    """
+
+    def __init__(self, kind, interval, send, start_task, sleep):
+        self.kind = kind
+        self.interval = interval
+        self.send = send
+        self.start_task = start_task
+        self.sleep = sleep
+        self._last = {}
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def submit(self, key, payload=None):
+        now = time.monotonic()
+        with self._lock:
+            if key in self._pending:
+                self._pending[key] = payload
+                wait = None
+            else:
+                wait = self._last.get(key, float("-inf")) + self.interval - now
+                if wait <= 0:
+                    self._last[key] = now
+                    self._prune(now)
+                else:
+                    self._pending[key] = payload
+
+        if wait is None:
+            metrics.inc("diskuss_coalesced_events_total", kind=self.kind, result="coalesced")
+        elif wait <= 0:
+            metrics.inc("diskuss_coalesced_events_total", kind=self.kind, result="emitted")
+            self.send(key, payload)
+        else:
+            metrics.inc("diskuss_coalesced_events_total", kind=self.kind, result="coalesced")
+            self.start_task(self._send_later, key, wait)
+
+    def _send_later(self, key, wait):
+        self.sleep(wait)
+        with self._lock:
+            payload = self._pending.pop(key)
+            self._last[key] = time.monotonic()
+        self.send(key, payload)
+
+    def _prune(self, now):
+        # keys idle for a full interval need no memory of their last emit
+        if len(self._last) > 10000:
+            self._last = {key: at for key, at in self._last.items() if now - at < self.interval}
+
+
+class TypingState:
+    """Who is typing in each discussion; entries lapse after ``timeout`` seconds."""
+
+    def __init__(self, timeout=5.0):
+        self.timeout = timeout
+        self._typing = {}
+        self._lock = threading.Lock()
+
+    def update(self, discussion_id, user_id, typing):
+        """Record a typing start or stop; returns False when nothing changed."""
+        now = time.monotonic()
+        with self._lock:
+            users = self._typing.setdefault(discussion_id, {})
+            was_typing = users.get(user_id, 0) > now
+            if typing:
+                users[user_id] = now + self.timeout
+            else:
+                users.pop(user_id, None)
+                if not users:
+                    del self._typing[discussion_id]
+        return typing or was_typing
+
+    def typing_users(self, discussion_id):
+        now = time.monotonic()
+        with self._lock:
+            users = self._typing.get(discussion_id, {})
+            for user_id in [u for u, expires in users.items() if expires <= now]:
+                del users[user_id]
+            if not users:
+                self._typing.pop(discussion_id, None)
+            return sorted(users)
@@ -1,6 +1,7 @@
 import os
+import threading
 from dotenv import load_dotenv
-from pymongo import MongoClient, errors
+from pymongo import MongoClient
 
 load_dotenv()
 
@@ -11,29 +12,146 @@ secret_key = os.getenv("SECRET_KEY")
 if not secret_key:
     raise ValueError("SECRET_KEY environment variable not set.")
 
-try:
-    mongo_uri = os.getenv("MONGO_URI", "mongodb://localhost:27017/diskuss")
-    client = MongoClient(mongo_uri, serverSelectionTimeoutMS=5000)
+def mongo_client_options():
+    """Connection pool, timeout and write concern settings for MongoClient."""
+    options = {
+        "maxPoolSize": int(os.getenv("MONGO_MAX_POOL_SIZE", "100")),
+        "minPoolSize": int(os.getenv("MONGO_MIN_POOL_SIZE", "0")),
+        "maxIdleTimeMS": int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "60000")),
+        "waitQueueTimeoutMS": int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "5000")),
+        "connectTimeoutMS": int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "5000")),
+        "socketTimeoutMS": int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", "10000")),
+        "serverSelectionTimeoutMS": int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000")),
+    }
+    # e.g. MONGO_WRITE_CONCERN=majority or 1
+    write_concern = os.getenv("MONGO_WRITE_CONCERN")
+    if write_concern:
+        options["w"] = int(write_concern) if write_concern.isdigit() else write_concern
+        if os.getenv("MONGO_WTIMEOUT_MS"):
+            options["wTimeoutMS"] = int(os.getenv("MONGO_WTIMEOUT_MS"))
+    return options
 
-    # Force actual connection test
-    client.admin.command("ping")
+# rate/burst of each client action, in actions per second; shared by the
+# Socket.IO event and the REST route that do the same work
+DEFAULT_EVENT_RATE_LIMITS = (
+    "send_message=5/20,send_messages=1/5,get_discussions=2/10,get_discussion_messages=5/20,"
+    "start_discussion=1/10,edit_message=2/10,delete_message=2/10,sync=1/5,"
+    "get_discussion_changes=2/10,typing=5/10,mark_read=5/20,search_users=2/10,search_messages=2/10,"
+    "export=0.05/2"
+)
 
-    db = client.get_database()
-    config["db"] = db
-    print("✅ MongoDB connection established successfully for diskuss api.")
-except errors.ServerSelectionTimeoutError as e:
-    raise ConnectionError(f"Could not connect to MongoDB: {e}")
-except Exception as e:
-    raise RuntimeError(f"MongoDB configuration failed: {e}")
+def event_rate_limits(spec=None):
+    """Token bucket budgets by action, from "action=rate/burst,..." (EVENT_RATE_LIMITS).
+
+    Entries override the defaults one by one; a rate of 0 removes an action's limit.
+    """
+    budgets = {}
+    for source in (DEFAULT_EVENT_RATE_LIMITS, spec if spec is not None else os.getenv("EVENT_RATE_LIMITS", "")):
+        for entry in filter(None, (part.strip() for part in source.split(","))):
+            action, _, budget = entry.partition("=")
+            rate, _, burst = budget.partition("/")
+            budgets[action.strip()] = (float(rate), int(burst or max(1, float(rate))))
+    return budgets
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_client():
+    """Shared MongoClient, created on first use.
+
+    Creating the client does not block: pymongo connects in the background
+    and the first operation waits for a server, so importing the app and
+    building it never touch the network.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                from app.metrics import CommandTimer
+                mongo_uri = os.getenv("MONGO_URI", "mongodb://localhost:27017/diskuss")
+                _client = MongoClient(
+                    mongo_uri, event_listeners=[CommandTimer()], **mongo_client_options()
+                )
+    return _client
 
-# write a function to connect to db to be used in the app __init__.py file
 def get_db():
-    try:
-        return config["db"]
-    except KeyError:
-        raise RuntimeError("Database connection not established.")
+    return get_client().get_database()
 
 config["secret_key"] = secret_key
+# "memory" for a single worker, "redis" to share presence across workers
+config["presence_backend"] = os.getenv("PRESENCE_BACKEND", "memory")
+# seconds a socket stays in shared presence after its worker last refreshed it
+config["presence_ttl"] = int(os.getenv("PRESENCE_TTL", "60"))
+config["redis_url"] = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+# message queue Socket.IO uses to emit to rooms across workers, e.g. the redis url
+config["socketio_message_queue"] = os.getenv("SOCKETIO_MESSAGE_QUEUE")
+# "eventlet" or "gevent" in production, "threading" for the dev server
+config["async_mode"] = os.getenv("ASYNC_MODE") or None
+# ids of the last K messages kept on each discussion document; 0 keeps none
+# and leaves the messages collection as the only source of truth
+config["discussion_recent_messages"] = int(os.getenv("DISCUSSION_RECENT_MESSAGES", "0"))
+# background batching of non-critical user writes such as last_login
+config["write_behind_flush_interval"] = float(os.getenv("WRITE_BEHIND_FLUSH_INTERVAL", "1.0"))
+config["write_behind_max_pending"] = int(os.getenv("WRITE_BEHIND_MAX_PENDING", "500"))
+# caches of verified JWT claims and user profiles
+config["jwt_cache_size"] = int(os.getenv("JWT_CACHE_SIZE", "10000"))
+config["jwt_cache_ttl"] = float(os.getenv("JWT_CACHE_TTL", "300"))
+config["user_cache_size"] = int(os.getenv("USER_CACHE_SIZE", "10000"))
+config["user_cache_ttl"] = float(os.getenv("USER_CACHE_TTL", "60"))
+# hot username search results
+config["search_cache_size"] = int(os.getenv("SEARCH_CACHE_SIZE", "1000"))
+config["search_cache_ttl"] = float(os.getenv("SEARCH_CACHE_TTL", "30"))
+# read cache for discussions, inbox pages and participant profiles: "memory"
+# for a single worker, "redis" (REDIS_URL) when several workers serve writes, or "none"
+config["cache_backend"] = os.getenv("CACHE_BACKEND", "memory")
+config["cache_size"] = int(os.getenv("CACHE_SIZE", "10000"))
+config["cache_ttl"] = float(os.getenv("CACHE_TTL", "300"))
+# typing indicators and read receipts are emitted at most once per interval
+# per discussion; typing entries lapse after TYPING_TIMEOUT seconds
+config["typing_interval"] = float(os.getenv("TYPING_INTERVAL", "0.5"))
+config["typing_timeout"] = float(os.getenv("TYPING_TIMEOUT", "5"))
+config["read_receipt_interval"] = float(os.getenv("READ_RECEIPT_INTERVAL", "1.0"))
+# inbox deltas (discussion_updated) are batched per discussion over this interval
+config["inbox_update_interval"] = float(os.getenv("INBOX_UPDATE_INTERVAL", "0.25"))
+# bcrypt cost of new hashes; stored hashes of another cost are upgraded at login
+config["bcrypt_rounds"] = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# OS threads hashing passwords, and how many more hashes may wait for one
+# before logins are refused with a 503
+config["password_hash_workers"] = int(os.getenv("PASSWORD_HASH_WORKERS", "4"))
+config["password_hash_queue"] = int(os.getenv("PASSWORD_HASH_QUEUE", "32"))
+# "memory" for a single worker, "redis" (REDIS_URL) to share limits across workers
+config["rate_limit_backend"] = os.getenv("RATE_LIMIT_BACKEND", "memory")
+# login and signup attempts allowed per RATE_LIMIT_WINDOW seconds; 0 disables a limit
+config["rate_limit_window"] = float(os.getenv("RATE_LIMIT_WINDOW", "60"))
+config["login_limit_per_ip"] = int(os.getenv("LOGIN_LIMIT_PER_IP", "30"))
+config["login_limit_per_username"] = int(os.getenv("LOGIN_LIMIT_PER_USERNAME", "10"))
+config["signup_limit_per_ip"] = int(os.getenv("SIGNUP_LIMIT_PER_IP", "10"))
+config["signup_limit_per_username"] = int(os.getenv("SIGNUP_LIMIT_PER_USERNAME", "5"))
+# per-user budgets of client actions, see event_rate_limits; RATE_LIMIT_BACKEND
+# decides whether a user's budget is shared by every worker
+config["event_rate_limits"] = event_rate_limits()
+# all events of one socket together, rate/burst; 0 disables
+config["socket_event_rate"] = float(os.getenv("SOCKET_EVENT_RATE", "20"))
+config["socket_event_burst"] = int(os.getenv("SOCKET_EVENT_BURST", "40"))
+# packets waiting for a slow socket: past the soft limit superseded events such as
+# typing are held back and only the latest is sent once it catches up; at the
+# max the socket is disconnected and reconnects through sync. 0 disables either
+config["socket_queue_soft_limit"] = int(os.getenv("SOCKET_QUEUE_SOFT_LIMIT", "100"))
+config["socket_queue_max"] = int(os.getenv("SOCKET_QUEUE_MAX", "1000"))
+# message search: "mongo" uses a text index on messages.text; "memory" keeps an
+# inverted index in the process, only complete with a single worker.
+# SEARCH_LANGUAGE sets stemming and stop words of the text index
+config["search_backend"] = os.getenv("SEARCH_BACKEND", "mongo")
+config["search_language"] = os.getenv("SEARCH_LANGUAGE", "english")
+# compact protocol frames at least this large are deflated
+config["compact_deflate_min_bytes"] = int(os.getenv("COMPACT_DEFLATE_MIN_BYTES", "1024"))
+# create indexes in the background when an app is built
+config["ensure_indexes"] = os.getenv("ENSURE_INDEXES", "1") == "1"
+# how long the readiness probe waits for MongoDB
+config["health_check_timeout"] = float(os.getenv("HEALTH_CHECK_TIMEOUT", "1.0"))
+config["log_level"] = os.getenv("LOG_LEVEL", "INFO").upper()
+# log a warning when one handler call issues more MongoDB operations than this
+config["db_ops_warning"] = int(os.getenv("DB_OPS_WARNING", "20"))
 config["sample_db"] = {
     "user1": {"password": "password", "first_name": "John", "last_name": "Doe"},
     "user2": {"password": "password", "first_name": "Jane", "last_name": "Smith"},
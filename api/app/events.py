@@ -1,78 +1,132 @@
 import json
+import time
+import logging
+import threading
 from functools import wraps
 from flask import request, session
 from flask_socketio import emit, disconnect
 from app.sockets import socketio
 from app.utils import decode_jwt_token
-from app.messages import message_handler
-from app.user import user_handler
+from app.extensions import message_handler, user_handler
+from app.messages import later_read
+from app.presence import discussion_room
+from app.fanout import add_members, join_discussions, publish_batch, publish_delete, publish_edit, publish_message
+from app.metrics import timed_event
+from app.config import config
+from app.coalesce import Coalescer, TypingState
+from app.protocol import broadcast, forget, negotiate, reply
+from app.ratelimit import MemoryRateLimitStore, TokenBucket, create_rate_limit_store
+
+logger = logging.getLogger(__name__)
 
 
 def socket_jwt_required(f):
+    """Require the socket to have authenticated at connect time.
+
+    The token is verified once in handle_connect; per event we only check
+    that the session is authenticated and its token has not expired.
+    """
     @wraps(f)
     def wrapped(*args, **kwargs):
-        try:
-            token = request.headers.get("Authorization")
-            if not token:
-                emit("error", {"message": "Missing token"})
-                disconnect()
-                return False
-
-            # Decode token
-            user_data, error_message = decode_jwt_token(token)
-            if error_message:
-                print(f"Token decoding failed: {error_message}")
-                emit("error", {"message": error_message})
-                disconnect()
-                return False
-
-            request.user = user_data
+        user = session.get("user")
+        if not user:
+            emit("error", {"message": "Missing token"})
+            disconnect()
+            return False
 
-        except Exception as e:
-            print(f"Exception in socket_jwt_required: {e}")
-            emit("error", {"message": "Authentication failed"})
+        token_exp = session.get("token_exp")
+        if token_exp is not None and token_exp <= time.time():
+            emit("error", {"message": "Token has expired"})
             disconnect()
             return False
 
+        request.user = user
         return f(*args, **kwargs)
 
     return wrapped
 
 
+# a user's budget per action, shared with the REST routes doing the same work
+_limits = create_rate_limit_store(config["rate_limit_backend"], config["redis_url"])
+event_limits = {
+    action: TokenBucket(action, _limits, rate, burst)
+    for action, (rate, burst) in config["event_rate_limits"].items()
+}
+# a socket lives on one worker, so its own budget never needs sharing
+socket_limit = TokenBucket(
+    "socket", MemoryRateLimitStore(), config["socket_event_rate"], config["socket_event_burst"]
+)
+
+
+def rate_limited(action):
+    """Refuse the event when its socket or user is over budget.
+
+    Goes after socket_jwt_required. The client gets an ``error`` with code
+    429 and ``retry_after`` in seconds.
+    """
+    def decorator(f):
+        @wraps(f)
+        def wrapped(*args, **kwargs):
+            bucket = event_limits.get(action)
+            retry_after = socket_limit.take(request.sid) or (bucket.take(request.user["user_id"]) if bucket else 0)
+            if retry_after:
+                emit("error", {"message": "Too many requests.", "code": 429, "retry_after": round(retry_after, 3)})
+                return False
+            return f(*args, **kwargs)
+
+        return wrapped
+
+    return decorator
+
+
 @socketio.on("connect")
+@timed_event("connect")
 def handle_connect(auth):
     try:
         token = request.headers.get("Authorization") or auth.get("token")
 
         if not token:
-            print("Missing token")
+            logger.info("Connection rejected: missing token")
             return False
 
         user_data, error_message = decode_jwt_token(token)
         if error_message:
-            print(f"Token error: {error_message}")
+            logger.info("Connection rejected: %s", error_message)
             return False
 
-        _, user = user_handler.get_user(user_data["user_id"])
-        session["user"] = {**user, "user_id": str(user["_id"])}
-        user_handler.connect_user(user_data["user_id"], request.sid)
-        print(f"Connected users: {user_handler.connected_users}")
+        found, user = user_handler.get_user_profile(user_data["user_id"])
+        if not found:
+            logger.info("Connection rejected: unknown user %s", user_data["user_id"])
+            return False
+        session["user"] = {**user, "user_id": user["_id"]}
+        session["token_exp"] = user_data.get("exp")
+        protocol = None
+        if auth and auth.get("protocol"):
+            protocol = negotiate(request.sid, auth["protocol"])
+            emit("protocol", {"protocol": protocol})
+        # presence keeps the protocol so any worker adds the socket to the right room variant
+        user_handler.connect_user(user_data["user_id"], request.sid, protocol)
+        join_discussions(message_handler.get_discussion_ids(user_data["user_id"]))
+        logger.debug("User %s connected with socket %s", user_data["user_id"], request.sid)
     except Exception as e:
-        print(f"Error in handle_connect: {e}")
+        logger.exception("Error in handle_connect: %s", e)
         emit("error", {"message": "Connection failed"})
         return False
 
 
 @socketio.on("disconnect")
+@timed_event("disconnect")
 def handle_disconnect():
     user_id = session.get("user")["user_id"]
     user_handler.disconnect_user(request.sid)
-    print(f"User ({user_id}) with socket: {request.sid} disconnected")
-    print(f"Connected users: {user_handler.connected_users}")
+    forget(request.sid)
+    logger.debug("User %s with socket %s disconnected", user_id, request.sid)
 
 
 @socketio.on("start_discussion")
+@timed_event("start_discussion")
 @socket_jwt_required
+@rate_limited("start_discussion")
 def start_discussion(data):
     user_id = session.get("user")["user_id"]
     if not user_id:
@@ -80,26 +134,44 @@ def start_discussion(data):
         return False
 
     data = json.loads(data) if isinstance(data, str) else data
-    status, discussion = message_handler.create_or_get_discussion(user_id, data)
+    participants = data.get("participants")
+    status, discussion = message_handler.create_or_get_discussion(
+        user_id,
+        data,
+        is_group=bool(participants) and len(set(participants) - {user_id}) > 1,
+        participants=participants,
+    )
 
     if status:
-        emit("start_discussion", discussion)
+        if discussion.pop("created"):
+            add_members(discussion["data"]["_id"], discussion["data"]["participants"], user_handler.presence)
+        reply("start_discussion", discussion, request.sid)
     else:
         emit("error", {"message": "error starting discussion"})
 
 
 @socketio.on("get_discussions")
+@timed_event("get_discussions")
+@socket_jwt_required
+@rate_limited("get_discussions")
 def get_discussions(data):
     user_id = session.get("user")["user_id"]
-    discussions = message_handler.get_discussions(user_id)
-    emit("get_discussions", discussions)
+    data = json.loads(data) if isinstance(data, str) else (data or {})
+    status, discussions = message_handler.get_discussions(
+        user_id, data.get("limit", 20), before=data.get("before")
+    )
+    if status:
+        reply("get_discussions", discussions, request.sid)
+    else:
+        emit("error", discussions)
 
 
 @socketio.on("send_message")
-# @socket_jwt_required
+@timed_event("send_message")
+@socket_jwt_required
+@rate_limited("send_message")
 def handle_send_message(data):
-    # user = request.user
-    user = session.get("user")
+    user = request.user
     data = json.loads(data) if isinstance(data, str) else data
 
     user_id = user.get("user_id")
@@ -109,37 +181,253 @@ def handle_send_message(data):
         emit("error", result)
         return False
 
-    # emit to socket ids of both sender and recipient
-    sender_socket_ids = user_handler.get_user_socket_ids(user_id)
+    message = result["data"]
+    # only the new message and a small inbox delta go out, never the full history
+    publish_message(message)
+
+    # a sent message ends the sender's typing indicator
+    if typing_state.update(message["discussion_id"], user_id, False):
+        typing_emits.submit(message["discussion_id"])
+
+    # acknowledge the sender with the id of the stored message
+    return {"status": "ok", "message_id": message["_id"], "timestamp": message["timestamp"]}
+
 
-    discussions = message_handler.get_discussions(user_id)
-    for socket_id in sender_socket_ids:
-        emit("receive_message", result, room=socket_id)
-        emit("get_discussions", discussions, room=socket_id)
+def broadcast_new_messages(messages):
+    """Push stored messages to their participants, one batch per discussion."""
+    by_discussion = {}
+    for message in messages:
+        by_discussion.setdefault(message["discussion_id"], []).append(message)
 
-    if recipient_id := data.get("recipient_id"):
-        # emit to recipient
-        discussions = message_handler.get_discussions(recipient_id)
-        recipient_socket_ids = user_handler.get_user_socket_ids(recipient_id)
-        for socket_id in recipient_socket_ids:
-            emit("receive_message", result, room=socket_id)
-            emit("get_discussions", discussions, room=socket_id)
+    for discussion_id, batch in by_discussion.items():
+        publish_batch(discussion_id, batch)
+
+
+@socketio.on("send_messages")
+@timed_event("send_messages")
+@socket_jwt_required
+@rate_limited("send_messages")
+def handle_send_messages(data):
+    data = json.loads(data) if isinstance(data, str) else (data or {})
+    status, result = message_handler.send_messages(request.user["user_id"], data.get("messages"))
+    if not status:
+        emit("error", result)
+        return False
+
+    broadcast_new_messages(result["data"])
+    return {"status": "ok", "results": result["results"]}
 
 
 @socketio.on("get_discussion_messages")
-# @socket_jwt_required
+@timed_event("get_discussion_messages")
+@socket_jwt_required
+@rate_limited("get_discussion_messages")
 def get_discussion_messages(data):
     data = json.loads(data) if isinstance(data, str) else data
     if not data.get("discussion_id", None):
         emit("error", {"message": "Missing discussion_id"})
         return False
 
+    user_id = session.get("user")["user_id"]
     status, messages = message_handler.get_discussion_messages(
         data.get("discussion_id"),
-        int(data.get("limit", 20)),
-        int(data.get("offset", 0)),
+        data.get("limit", 20),
+        before=data.get("before"),
+        after=data.get("after"),
+        user_id=user_id,
+    )
+    if status:
+        reply("get_discussion_messages", messages, request.sid)
+    else:
+        emit("error", messages)
+
+
+@socketio.on("edit_message")
+@timed_event("edit_message")
+@socket_jwt_required
+@rate_limited("edit_message")
+def handle_edit_message(data):
+    """Edit one of the user's messages: {"message_id", "text"}.
+
+    Participants receive ``message_updated`` with only the changed fields.
+    """
+    data = json.loads(data) if isinstance(data, str) else (data or {})
+    if not data.get("message_id"):
+        emit("error", {"message": "Missing message_id"})
+        return False
+
+    status, result = message_handler.update_message(data["message_id"], data, user_id=request.user["user_id"])
+    if not status:
+        emit("error", result)
+        return False
+
+    if "last_message" in result:
+        publish_edit(result["data"], result["last_message"])
+    else:
+        publish_edit(result["data"])
+    return {"status": "ok", "message_id": result["data"]["_id"]}
+
+
+@socketio.on("delete_message")
+@timed_event("delete_message")
+@socket_jwt_required
+@rate_limited("delete_message")
+def handle_delete_message(data):
+    """Delete one of the user's messages: {"message_id"}.
+
+    Participants receive ``message_deleted`` with the tombstone.
+    """
+    data = json.loads(data) if isinstance(data, str) else (data or {})
+    if not data.get("message_id"):
+        emit("error", {"message": "Missing message_id"})
+        return False
+
+    status, result = message_handler.delete_message(data["message_id"], user_id=request.user["user_id"])
+    if not status:
+        emit("error", result)
+        return False
+
+    if "last_message" in result:
+        publish_delete(result["data"], result["last_message"])
+    else:
+        publish_delete(result["data"])
+    return {"status": "ok", "message_id": result["data"]["_id"]}
+
+
+@socketio.on("sync")
+@timed_event("sync")
+@socket_jwt_required
+@rate_limited("sync")
+def handle_sync(data):
+    """Changes since {"since": token}, instead of reloading discussions and history on reconnect."""
+    data = json.loads(data) if isinstance(data, str) else (data or {})
+    status, changes = message_handler.sync(
+        request.user["user_id"], since=data.get("since"), limit=data.get("limit", 500)
+    )
+    if status:
+        reply("sync", changes, request.sid)
+    else:
+        emit("error", changes)
+
+
+@socketio.on("get_discussion_changes")
+@timed_event("get_discussion_changes")
+@socket_jwt_required
+@rate_limited("get_discussion_changes")
+def get_discussion_changes(data):
+    """Messages edited or deleted since {"discussion_id", "since"}, for clients catching up."""
+    data = json.loads(data) if isinstance(data, str) else (data or {})
+    if not data.get("discussion_id"):
+        emit("error", {"message": "Missing discussion_id"})
+        return False
+
+    status, changes = message_handler.get_discussion_changes(
+        data["discussion_id"],
+        since=data.get("since"),
+        limit=data.get("limit", 100),
+        user_id=request.user["user_id"],
     )
     if status:
-        emit("get_discussion_messages", messages)
+        reply("get_discussion_changes", changes, request.sid)
     else:
-        emit("error", {"message": "error getting messages"})
+        emit("error", changes)
+
+
+@socketio.on("search_messages")
+@timed_event("search_messages")
+@socket_jwt_required
+@rate_limited("search_messages")
+def search_messages(data):
+    """Search the user's messages: {"query", "discussion_id"?, "limit"?, "cursor"?}."""
+    data = json.loads(data) if isinstance(data, str) else (data or {})
+    status, results = message_handler.search_messages(
+        request.user["user_id"],
+        data.get("query"),
+        discussion_id=data.get("discussion_id"),
+        limit=data.get("limit", 20),
+        cursor=data.get("cursor"),
+    )
+    if status:
+        reply("search_messages", results, request.sid)
+    else:
+        emit("error", results)
+
+
+typing_state = TypingState(config["typing_timeout"])
+
+
+def _send_typing(discussion_id, _):
+    payload = {"discussion_id": discussion_id, "user_ids": typing_state.typing_users(discussion_id)}
+    broadcast("typing", payload, discussion_room(discussion_id), latest=True)
+
+
+def _send_read_receipts(discussion_id, _):
+    with _receipts_lock:
+        receipts = _pending_receipts.pop(discussion_id, {})
+    if receipts:
+        payload = {"discussion_id": discussion_id, "receipts": list(receipts.values())}
+        broadcast("read_receipts", payload, discussion_room(discussion_id))
+
+
+typing_emits = Coalescer(
+    "typing", config["typing_interval"], _send_typing, socketio.start_background_task, socketio.sleep
+)
+receipt_emits = Coalescer(
+    "read_receipts", config["read_receipt_interval"], _send_read_receipts,
+    socketio.start_background_task, socketio.sleep,
+)
+# receipts waiting for their discussion's next emit, latest per user
+_pending_receipts = {}
+_receipts_lock = threading.Lock()
+
+
+@socketio.on("typing")
+@timed_event("typing")
+@socket_jwt_required
+@rate_limited("typing")
+def handle_typing(data):
+    """Start ({"discussion_id", "typing": true}) or stop a typing indicator.
+
+    Participants receive ``typing`` with everyone currently typing, at most
+    once per TYPING_INTERVAL per discussion however often clients send.
+    """
+    data = json.loads(data) if isinstance(data, str) else (data or {})
+    discussion_id = data.get("discussion_id")
+    user_id = request.user["user_id"]
+    meta = message_handler.discussion_meta(discussion_id) if discussion_id else None
+    if not meta or user_id not in meta["participants"]:
+        emit("error", {"message": "Discussion not found."})
+        return False
+
+    if typing_state.update(discussion_id, user_id, bool(data.get("typing", True))):
+        typing_emits.submit(discussion_id)
+
+
+@socketio.on("mark_read")
+@timed_event("mark_read")
+@socket_jwt_required
+@rate_limited("mark_read")
+def handle_mark_read(data):
+    """Move the read cursor to {"discussion_id", "message_id"}.
+
+    The cursor is persisted in the background; participants receive
+    ``read_receipts`` at most once per READ_RECEIPT_INTERVAL per discussion.
+    """
+    data = json.loads(data) if isinstance(data, str) else (data or {})
+    if not data.get("discussion_id") or not data.get("message_id"):
+        emit("error", {"message": "Missing discussion_id or message_id"})
+        return False
+
+    discussion_id = data["discussion_id"]
+    status, result = message_handler.mark_read(request.user["user_id"], discussion_id, data["message_id"])
+    if not status:
+        emit("error", result)
+        return False
+
+    receipt = result["data"]
+    with _receipts_lock:
+        receipts = _pending_receipts.setdefault(discussion_id, {})
+        previous = receipts.get(receipt["user_id"])
+        receipts[receipt["user_id"]] = later_read(previous, receipt) if previous else receipt
+    receipt_emits.submit(discussion_id)
+    return {"status": "ok"}
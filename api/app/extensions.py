@@ -0,0 +1,78 @@
+import logging
+import threading
+from flask import current_app
+from werkzeug.local import LocalProxy
+from app.config import config
+from app.messages import MessageHandler
+from app.readcache import create_read_cache
+from app.search import create_search_index
+from app.user import UserHandler
+
+logger = logging.getLogger(__name__)
+
+
+class Services:
+    """The database handlers of one app, built by create_app."""
+
+    def __init__(self, db):
+        self.db = db
+        self.cache = create_read_cache(
+            config["cache_backend"], config["cache_size"], config["cache_ttl"], config["redis_url"]
+        )
+        self.search = create_search_index(config["search_backend"], db.messages, config["search_language"])
+        self.message_handler = MessageHandler(
+            db, config["discussion_recent_messages"], cache=self.cache, search=self.search
+        )
+        self.user_handler = UserHandler(db)
+        # cached profiles carry last_login, which reaches MongoDB through the write-behind queue
+        self.user_handler.pending_updates.on_flush = (
+            lambda updates: self.cache.invalidate_profiles(str(user_id) for user_id in updates)
+        )
+        self.indexes_ready = False
+        self.index_error = None
+
+    def ensure_indexes(self):
+        try:
+            self.message_handler.ensure_indexes()
+            self.user_handler.ensure_indexes()
+            self.indexes_ready = True
+            self.index_error = None
+        except Exception as e:
+            self.index_error = str(e)
+            logger.exception("Error creating indexes: %s", e)
+
+    def register_gauges(self, metrics):
+        presence = self.user_handler.presence
+        metrics.gauge("diskuss_connected_users", "Users with at least one open socket.", presence.count_users)
+        metrics.gauge("diskuss_connected_sockets", "Open Socket.IO connections.", presence.count_sockets)
+        metrics.gauge(
+            "diskuss_write_behind_depth", "Documents waiting in the write-behind queue.",
+            self.user_handler.pending_updates.depth,
+        )
+        metrics.gauge(
+            "diskuss_write_behind_last_flush_ms", "Duration of the last write-behind flush.",
+            lambda: self.user_handler.pending_updates.last_flush_ms,
+        )
+        metrics.gauge(
+            "diskuss_read_cursors_pending", "Discussions with read cursors waiting to be written.",
+            self.message_handler.pending_reads.depth,
+        )
+        metrics.gauge(
+            "diskuss_read_cache_hit_ratio", "Read cache hit ratio by kind since startup.",
+            lambda: {(("kind", kind),): stats["hit_rate"] for kind, stats in self.cache.stats().items()},
+        )
+
+    def ensure_indexes_in_background(self):
+        """Create indexes without holding up startup; readiness reports the outcome."""
+        thread = threading.Thread(target=self.ensure_indexes, name="ensure-indexes", daemon=True)
+        thread.start()
+        return thread
+
+
+def get_services():
+    return current_app.extensions["diskuss"]
+
+
+# resolved against the current app, so handlers are never bound at import time
+message_handler = LocalProxy(lambda: get_services().message_handler)
+user_handler = LocalProxy(lambda: get_services().user_handler)
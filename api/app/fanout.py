@@ -0,0 +1,88 @@
+"""Delivery of discussion events through one Socket.IO room per discussion.
+
+Every socket joins the rooms of its user's discussions when it connects,
+and the sockets of all participants join a discussion's room when it is
+created. An event then costs one emit per discussion, encoded once, however
+many members and sockets the discussion has; with a message queue it is one
+publish, and each worker delivers to its own sockets.
+"""
+from flask import request
+from flask_socketio import join_room
+from app.config import config
+from app.coalesce import Coalescer
+from app.presence import discussion_room
+from app.protocol import COMPACT, broadcast, compact_room, room_for
+from app.sockets import socketio
+
+# marks an edit or delete that left the discussion's last message as it was
+_UNCHANGED = object()
+
+
+def join_discussions(discussion_ids):
+    """Add the current socket to the rooms of ``discussion_ids``."""
+    for discussion_id in discussion_ids:
+        join_room(room_for(request.sid, discussion_room(discussion_id)))
+
+
+def add_members(discussion_id, participants, presence):
+    """Add every connected socket of ``participants``, on any worker, to the room.
+
+    Sockets of other workers are joined through the message queue, so the
+    room variant comes from the protocol presence recorded for the socket.
+    """
+    room = discussion_room(discussion_id)
+    for user_id in participants:
+        for socket_id, protocol in presence.get_socket_protocols(user_id).items():
+            variant = compact_room(room) if protocol == COMPACT else room
+            socketio.server.enter_room(socket_id, variant, namespace="/")
+
+
+def publish_message(message):
+    """Send a new, already serialized message to its discussion's room."""
+    broadcast("receive_message", message, discussion_room(message["discussion_id"]))
+    _queue_inbox_update(message)
+
+
+def publish_batch(discussion_id, messages):
+    """Send a batch of new messages of one discussion to its room in one event."""
+    broadcast(
+        "receive_messages", {"discussion_id": discussion_id, "data": messages}, discussion_room(discussion_id)
+    )
+    _queue_inbox_update(messages[-1])
+
+
+def publish_edit(change, last_message=_UNCHANGED):
+    """Send an edit delta to the room, and an inbox delta if the summary moved."""
+    broadcast("message_updated", change, discussion_room(change["discussion_id"]))
+    if last_message is not _UNCHANGED:
+        _queue_inbox_update(last_message, change["discussion_id"])
+
+
+def publish_delete(change, last_message=_UNCHANGED):
+    """Send a delete delta to the room, and an inbox delta if the summary moved.
+
+    ``last_message`` is None when the discussion has no messages left.
+    """
+    broadcast("message_deleted", change, discussion_room(change["discussion_id"]))
+    if last_message is not _UNCHANGED:
+        _queue_inbox_update(last_message, change["discussion_id"])
+
+
+def _queue_inbox_update(last_message, discussion_id=None):
+    discussion_id = discussion_id or last_message["discussion_id"]
+    inbox_updates.submit(discussion_id, {
+        "discussion_id": discussion_id,
+        "last_message": last_message or {},
+        "last_message_timestamp": last_message["timestamp"] if last_message else "",
+    })
+
+
+def _send_inbox_update(discussion_id, update):
+    broadcast("discussion_updated", update, discussion_room(discussion_id), latest=True)
+
+
+# a burst of messages to one discussion moves each member's inbox once per interval
+inbox_updates = Coalescer(
+    "discussion_updated", config["inbox_update_interval"], _send_inbox_update,
+    socketio.start_background_task, socketio.sleep,
+)
@@ -0,0 +1,34 @@
+import pymongo
+from flask import Blueprint, Response, jsonify
+from app.config import config
+from app.extensions import get_services
+from app.metrics import metrics
+
+health_bp = Blueprint('health', __name__)
+metrics_bp = Blueprint('metrics', __name__)
+
+@health_bp.route('/live', methods=['GET'])
+def live():
+    """The process is up and serving requests."""
+    return jsonify({"status": "ok"}), 200
+
+@health_bp.route('/ready', methods=['GET'])
+def ready():
+    """MongoDB answers within the health check timeout."""
+    services = get_services()
+    try:
+        with pymongo.timeout(config["health_check_timeout"]):
+            services.db.client.admin.command("ping")
+    except Exception as e:
+        return jsonify({"status": "unavailable", "database": str(e)}), 503
+
+    return jsonify({
+        "status": "ok",
+        "database": "ok",
+        "indexes": "ok" if services.indexes_ready else (services.index_error or "pending"),
+    }), 200
+
+@metrics_bp.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Metrics in the Prometheus text exposition format."""
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
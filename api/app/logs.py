@@ -0,0 +1,30 @@
+import atexit
+import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
+
+_listener = None
+
+
+def setup_logging(level="INFO"):
+    """Route the app's log records through a queue so handlers never block on I/O.
+
+    Request threads only enqueue records; a background listener formats and
+    writes them. Safe to call more than once.
+    """
+    global _listener
+    logger = logging.getLogger("app")
+    logger.setLevel(level)
+    if _listener is not None:
+        return logger
+
+    records = queue.SimpleQueue()
+    stream = logging.StreamHandler()
+    stream.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    _listener = QueueListener(records, stream, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+    logger.addHandler(QueueHandler(records))
+    logger.propagate = False
+    return logger
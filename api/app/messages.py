@@ -1,150 +1,544 @@
+import hashlib
+import logging
+import time
 from datetime import datetime, timezone
 from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 from app.config import config
-from app.utils import serialize_datetime_fields
+from app.readcache import ReadCache
+from app.search import MongoTextSearch, highlight, query_terms
+from app.serializers import (
+    DISCUSSION_PROJECTION, MESSAGE_PROJECTION, USER_PROJECTION,
+    serialize_discussion, serialize_message, serialize_profile,
+)
+from app.writebehind import WriteBehindQueue
+from app.utils import encode_cursor, decode_cursor, encode_sync_token, decode_sync_token
+
+logger = logging.getLogger(__name__)
+
+
+MAX_PAGE_SIZE = 100
+MAX_BATCH_SIZE = 500
+MAX_SYNC_CHANGES = 500
+# changes logged on a discussion for sync to check whether their message is stored
+RECENT_CHANGES = 50
+# a logged change whose message is not stored after this long is taken as failed
+IN_FLIGHT_SECONDS = 30
+MAX_SEARCH_QUERY = 200
+# deepest result a search pages to; relevance order has no keyset to resume from
+MAX_SEARCH_RESULTS = 1000
+
+
+def later_read(old, new):
+    return new if new["seq"] >= old["seq"] else old
+
+
+def participants_key(participants):
+    """Canonical key of a participant set: the same for any order, fixed length for any size."""
+    return hashlib.sha256(",".join(sorted(set(map(str, participants)))).encode("utf-8")).hexdigest()
+
+
+def inbox_projection(user_id):
+    """Fields of a discussion an inbox entry is built from."""
+    return {
+        "participants": 1, "is_group": 1, "last_message": 1, "last_message_at": 1,
+        "message_seq": 1, f"reads.{user_id}": 1,
+    }
+
+
+def reserve_numbers(discussions, discussion_id, message_id, versions=1, messages=0, update=None):
+    """Take ``versions`` change numbers and ``messages`` message numbers of a discussion.
+
+    The change is logged on the discussion with the id of the message that
+    will carry its last number, so sync can hold its token back until that
+    message is stored. Every version increment goes through here, which
+    keeps the log in version order. Returns the first of each number.
+    """
+    update = dict(update or {})
+    update["$inc"] = {"version": versions, "message_seq": messages}
+    update["$push"] = {
+        **update.get("$push", {}),
+        "changes": {
+            "$each": [{"message_id": message_id, "count": versions, "at": time.time()}],
+            "$slice": -RECENT_CHANGES,
+        },
+    }
+    discussion = discussions.find_one_and_update(
+        {"_id": ObjectId(discussion_id)}, update,
+        projection={"version": 1, "message_seq": 1}, return_document=ReturnDocument.AFTER,
+    )
+    return discussion["version"] - versions + 1, discussion.get("message_seq", 0) - messages + 1
 
 
 class MessageHandler:
     """Handles message-related operations."""
 
-    def __init__(self, db):
+    def __init__(self, db, recent_messages=0, cache=None, search=None):
         self.users = db.users
         self.messages = db.messages
         self.discussions = db.discussions
+        self.recent_messages = recent_messages
+        self.cache = cache or ReadCache()
+        self.search = search if search is not None else MongoTextSearch(db.messages)
+        # read cursors live on the discussion as reads.<user id> = {seq, message_id};
+        # $max keeps them moving forward (embedded documents compare by seq first)
+        self.pending_reads = WriteBehindQueue(
+            db.discussions,
+            flush_interval=config["write_behind_flush_interval"],
+            max_pending=config["write_behind_max_pending"],
+            on_flush=self._reads_flushed,
+            operator="$max",
+            combine=later_read,
+        )
+
+    def ensure_indexes(self):
+        """Create the indexes the message queries rely on."""
+        # serves keyset pagination of a discussion's history
+        self.messages.create_index(
+            [("discussion_id", ASCENDING), ("timestamp", ASCENDING), ("_id", ASCENDING)]
+        )
+        # serves the inbox: a user's discussions, most recently active first
+        self.discussions.create_index(
+            [("participants", ASCENDING), ("last_message_at", DESCENDING), ("_id", DESCENDING)]
+        )
+        # one discussion per participant set; discussions older than the key are left out
+        self.discussions.create_index(
+            [("participants_key", ASCENDING)], unique=True,
+            partialFilterExpression={"participants_key": {"$exists": True}},
+        )
+        # serves sync: a discussion's messages changed after a version
+        self.messages.create_index([("discussion_id", ASCENDING), ("version", ASCENDING)])
+        # serves the change feed; only edited and deleted messages are indexed
+        self.messages.create_index(
+            [("discussion_id", ASCENDING), ("updated_at", ASCENDING), ("_id", ASCENDING)],
+            partialFilterExpression={"updated_at": {"$exists": True}},
+        )
+        self.search.ensure_indexes()
+
+    def discussion_meta(self, discussion_id):
+        """Participants and group flag of a discussion, which never change once created."""
+        if not ObjectId.is_valid(discussion_id):
+            return None
+        meta = self.cache.get_discussion(discussion_id)
+        if meta is None:
+            meta = self.discussions.find_one(
+                {"_id": ObjectId(discussion_id)}, {"_id": 0, "participants": 1, "is_group": 1}
+            )
+            if meta:
+                self.cache.set_discussion(discussion_id, meta)
+        return meta
+
+    def _invalidate(self, discussion_id):
+        meta = self.discussion_meta(discussion_id)
+        if meta:
+            self.cache.invalidate_discussion(discussion_id, meta["participants"])
+
+    def _reserve(self, discussion_id, message_id, versions=1, messages=0, update=None):
+        return reserve_numbers(self.discussions, discussion_id, message_id, versions, messages, update)
+
+    def get_discussion_ids(self, user_id):
+        """Ids of every discussion the user takes part in, read from the inbox index alone."""
+        return [
+            str(discussion["_id"])
+            for discussion in self.discussions.find({"participants": str(user_id)}, {"_id": 1})
+        ]
+
+    def mark_read(self, user_id, discussion_id, message_id):
+        """Move the user's read cursor in a discussion up to ``message_id``.
+
+        The cursor is written by a background batch, so a burst of receipts
+        from many users costs one write per discussion per flush.
+        """
+        try:
+            user_id = str(user_id)
+            meta = self.discussion_meta(discussion_id)
+            if not meta or user_id not in meta["participants"]:
+                return False, {"message": "Discussion not found.", "code": 404}
+            if not ObjectId.is_valid(message_id):
+                return False, {"message": "Message not found.", "code": 404}
+            message = self.messages.find_one(
+                {"_id": ObjectId(message_id), "discussion_id": discussion_id}, {"seq": 1}
+            )
+            if not message or message.get("seq") is None:
+                return False, {"message": "Message not found.", "code": 404}
+            self._queue_read(user_id, discussion_id, message["seq"], message["_id"])
+            return True, {
+                "message": "Successful.",
+                "data": {
+                    "discussion_id": discussion_id, "user_id": user_id,
+                    "message_id": message_id, "seq": message["seq"],
+                },
+            }
+        except Exception as e:
+            logger.exception("Error marking discussion read: %s", e)
+            return False, {"message": "Error marking discussion read.", "code": 500}
+
+    def _queue_read(self, user_id, discussion_id, seq, message_id):
+        self.pending_reads.set_fields(
+            ObjectId(discussion_id), {f"reads.{user_id}": {"seq": seq, "message_id": message_id}}
+        )
+
+    def _reads_flushed(self, updates):
+        # unread counts are part of the readers' cached inbox pages
+        self.cache.invalidate_inboxes(
+            {field.split(".", 1)[1] for fields in updates.values() for field in fields}
+        )
 
     def create_or_get_discussion(self, user_id, data=None, is_group=False, participants=None):
         # data -> {discussion_id, recipient_id}
-        """Create or retrieve a discussion between two users."""
+        """Create or retrieve a discussion between two users, or a group.
+
+        A participant set maps to one discussion through its canonical key,
+        so concurrent calls for the same set never create two. A discussion
+        asked for by id is only returned to its participants.
+        """
         try:
             if data and data.get("discussion_id"):
-                discussion = self.discussions.find_one({"_id": data["discussion_id"]})
+                discussion_id = data["discussion_id"]
+                meta = self.discussion_meta(discussion_id)
+                if not meta or str(user_id) not in meta["participants"]:
+                    return False, {"message": "Discussion not found.", "code": 404}
             else:
                 if not participants:
                     participants = sorted([str(user_id), str(data["recipient_id"])])
                 else:
-                    participants = sorted([str(user_id)] + participants)
-                discussion = self.discussions.find_one({"participants": participants})
+                    participants = sorted({str(user_id), *map(str, participants)})
+                discussion_id = self.cache.get_discussion_id(participants)
+
+            # the version is read before querying so a racing message invalidates our copy
+            version = None
+            if discussion_id:
+                cached, version = self.cache.get_summary(discussion_id)
+                if cached is not None:
+                    return True, {"message": "Sucessfuly retrieved discussion", "data": cached, "created": False}
 
+            created = False
+            if data and data.get("discussion_id"):
+                discussion = self.discussions.find_one({"_id": ObjectId(discussion_id)}, DISCUSSION_PROJECTION)
                 if not discussion:
-                    discussion = {
-                        "participants": participants,
-                        "is_group": is_group,
-                        "messages": [],
-                    }
-                    inserted = self.discussions.insert_one(discussion)
-                    discussion = self.discussions.find_one(
-                        {"_id": inserted.inserted_id}
-                    )
-            discussion["_id"] = str(discussion["_id"])
+                    return False, {"message": "Discussion not found.", "code": 404}
+            else:
+                discussion, created = self._upsert_discussion(participants, is_group)
+                if created:
+                    # the new discussion now heads every participant's inbox
+                    self.cache.invalidate_inboxes(participants)
+                self.cache.set_discussion_id(participants, str(discussion["_id"]))
+            discussion = serialize_discussion(discussion)
+            self.cache.set_discussion(
+                discussion["_id"],
+                {"participants": discussion["participants"], "is_group": discussion["is_group"]},
+            )
+            if version is not None:
+                self.cache.set_summary(discussion["_id"], version, discussion)
             return True, {
                 "message": "Sucessfuly retrieved discussion",
                 "data": discussion,
+                "created": created,
             }
 
         except Exception as e:
-            print(f"Error retrieving discussion: {e}")
+            logger.exception("Error retrieving discussion: %s", e)
             return False, {"message": "Error retrieving discussion."}
 
-    def get_discussions(self, user_id):
-        """Retrieve discussions for a specific user, with last message and participant info."""
-        # Find discussions where user is a participant
-        discussions_cursor = self.discussions.find(
-            {"participants": {"$in": [str(user_id)]}},
-            {
-                "participants": 1,
-                "is_group": 1,
-                "messages": {"$slice": -1},  # Only fetch the last message
+    def _upsert_discussion(self, participants, is_group):
+        """Find or create the discussion of a participant set in one atomic round trip.
+
+        The unique index on ``participants_key`` makes concurrent calls agree
+        on one discussion. Returns the discussion and whether this call created it.
+        """
+        new_id = ObjectId()
+        query = {"participants_key": participants_key(participants)}
+        update = {"$setOnInsert": {
+            "_id": new_id,
+            "participants": participants,
+            "is_group": is_group,
+            "last_message": None,
+            "last_message_at": datetime.now(timezone.utc),
+            "version": 1,
+        }}
+        try:
+            discussion = self.discussions.find_one_and_update(
+                query, update, projection=DISCUSSION_PROJECTION,
+                upsert=True, return_document=ReturnDocument.AFTER,
+            )
+        except DuplicateKeyError:
+            # a concurrent upsert inserted first; the discussion is there now
+            discussion = self.discussions.find_one(query, DISCUSSION_PROJECTION)
+        return discussion, discussion["_id"] == new_id
+
+    def get_discussions(self, user_id, limit=20, before=None):
+        """Retrieve a page of a user's discussions, most recently active first.
+
+        Each discussion carries its denormalized ``last_message`` snapshot, so
+        the page is one indexed query plus one bulk fetch of participant profiles.
+        Pages and profiles are served from the read cache when it has them.
+        Unread counts come from the discussion's message counter and the
+        user's read cursor on the same document, so they cost no extra query.
+        Deleted messages still count until a later message is read.
+        """
+        try:
+            limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+            user_id = str(user_id)
+            page, version = self.cache.get_inbox(user_id, limit, before)
+            if page is None:
+                query = {"participants": user_id}
+                if before:
+                    try:
+                        last_message_at, last_id = decode_cursor(before)
+                    except ValueError:
+                        return False, {"message": "Invalid cursor.", "code": 400}
+                    query["$or"] = [
+                        {"last_message_at": {"$lt": last_message_at}},
+                        {"last_message_at": last_message_at, "_id": {"$lt": last_id}},
+                    ]
+
+                discussions = list(
+                    self.discussions.find(query, inbox_projection(user_id))
+                    .sort([("last_message_at", DESCENDING), ("_id", DESCENDING)])
+                    .limit(limit + 1)
+                )
+                has_more = len(discussions) > limit
+                discussions = discussions[:limit]
+
+                next_cursor = None
+                if has_more and discussions[-1].get("last_message_at"):
+                    edge = discussions[-1]
+                    next_cursor = encode_cursor(edge["last_message_at"], edge["_id"])
+                page = {"discussions": discussions, "next_cursor": next_cursor}
+                self.cache.set_inbox(user_id, version, limit, before, page)
+            discussions, next_cursor = page["discussions"], page["next_cursor"]
+
+            result = self._format_discussions(user_id, discussions)
+
+            return True, {
+                "message": "Discussions retrieved successfully",
+                "data": result,
+                "next_cursor": next_cursor,
             }
-        ).sort("timestamp", 1)
+        except Exception as e:
+            logger.exception("Error retrieving discussions: %s", e)
+            return False, {"message": "Error retrieving discussions."}
+
+    def _format_discussions(self, user_id, discussions):
+        """Inbox entries for ``discussions``, with participant profiles fetched in one query."""
+        # Bulk fetch the user profiles the cache does not have
+        user_ids_to_fetch = {pid for d in discussions for pid in d.get("participants", [])}
+        users_map, missing, versions = self.cache.get_profiles(user_ids_to_fetch)
+        if missing:
+            for user in self.users.find(
+                {"_id": {"$in": [ObjectId(uid) for uid in missing]}}, USER_PROJECTION
+            ):
+                uid = str(user.pop("_id"))
+                users_map[uid] = user
+                self.cache.set_profile(uid, versions[uid], user)
 
         result = []
-        user_ids_to_fetch = set()
-
-        discussions = list(discussions_cursor)
-        
-        # Collect all user_ids from all discussions
         for d in discussions:
-            for pid in d.get("participants", []):
-                user_ids_to_fetch.add(pid)
+            last_message = serialize_message(d["last_message"]) if d.get("last_message") else {}
+            read = d.get("reads", {}).get(user_id, {})
+            result.append({
+                "_id": str(d["_id"]),
+                "is_group": d.get("is_group", False),
+                "participants": [serialize_profile(pid, users_map.get(pid, {})) for pid in d.get("participants", [])],
+                "last_message": last_message,
+                "last_message_timestamp": last_message.get("timestamp", ""),
+                "unread_count": max(0, d.get("message_seq", 0) - read.get("seq", 0)),
+                "last_read_message_id": str(read["message_id"]) if read else None,
+            })
+        return result
 
-        # Bulk fetch user profiles
-        users_map = {
-            str(user["_id"]): user
-            for user in self.users.find(
-                {"_id": {"$in": [ObjectId(uid) for uid in user_ids_to_fetch]}},
-                {"username": 1, "last_login": 1}
+    def _settled_versions(self, discussions):
+        """The version of each discussion up to which every change is stored.
+
+        A change takes its number before its message is written. Until that
+        message is stored, or IN_FLIGHT_SECONDS have passed, the discussion
+        settles just below the change. The logged changes are numbered by
+        walking back from the discussion's version; their messages are looked
+        up with one query.
+        """
+        settled, waiting = {}, {}
+        oldest = time.time() - IN_FLIGHT_SECONDS
+        for discussion in discussions:
+            discussion_id = str(discussion["_id"])
+            version = settled[discussion_id] = discussion.get("version", 0)
+            for change in reversed(discussion.get("changes") or []):
+                if change["at"] >= oldest:
+                    waiting.setdefault(change["message_id"], []).append(
+                        (discussion_id, version, version - change["count"])
+                    )
+                version -= change["count"]
+        if waiting:
+            stored = {
+                message["_id"]: message.get("version", 0)
+                for message in self.messages.find({"_id": {"$in": list(waiting)}}, {"version": 1})
+            }
+            for message_id, changes in waiting.items():
+                for discussion_id, last, before in changes:
+                    if stored.get(message_id, 0) < last:
+                        settled[discussion_id] = min(settled[discussion_id], before)
+        return settled
+
+    def sync(self, user_id, since=None, limit=MAX_SYNC_CHANGES):
+        """Everything that changed for a user after the ``since`` token.
+
+        Every discussion numbers its own changes: each sent, edited or deleted
+        message takes the next ``version`` of its discussion, and the
+        discussion keeps the last one. The token holds the version reached in
+        each of the user's discussions. A sync reads the user's discussions,
+        returns those past their token version as inbox entries, and fetches
+        their newer messages, full or as tombstones, with one indexed query.
+
+        The token never passes a change whose message is still being written,
+        so a sync racing a send returns that message on the next call.
+
+        At most ``limit`` discussions and ``limit`` messages are returned;
+        ``has_more`` then asks for another call with the returned ``token``.
+        Without ``since`` nothing is returned but the current token and
+        ``reset``: the client loads its state in full, then syncs from there.
+        Sockets should sync after joining their rooms, so a change stored
+        while the sync runs is delivered live if the token already passed it.
+        """
+        try:
+            limit = max(1, min(int(limit), MAX_SYNC_CHANGES))
+            user_id = str(user_id)
+            known = {}
+            if since:
+                try:
+                    known = decode_sync_token(since)
+                except ValueError:
+                    return False, {"message": "Invalid token.", "code": 400}
+
+            discussions = list(
+                self.discussions.find({"participants": user_id}, {"version": 1, "changes": 1})
             )
-        }
-
-        # For each discussion, build response object
-        for d in discussions:
-            d["_id"] = str(d["_id"])
-            d["is_group"] = d.get("is_group", False)
-
-            # Format participants
-            d["participants"] = [
-                {
-                    "_id": pid,
-                    "username": users_map.get(pid, {}).get("username", ""),
-                    "last_login": users_map.get(pid, {}).get("last_login", "").isoformat()
-                    if users_map.get(pid, {}).get("last_login") else ""
+            settled = self._settled_versions(discussions)
+            if not since:
+                return True, {
+                    "message": "Successful.",
+                    "reset": True,
+                    "token": encode_sync_token(settled),
+                    "discussions": [],
+                    "messages": [],
+                    "has_more": False,
                 }
-                for pid in d.get("participants", [])
-            ]
 
-            # Format last message
-            last_msg = d.get("messages", [{}])
-            if len(last_msg) > 0:
-                last_msg = last_msg[0]
-            else: last_msg = ""
+            changed = sorted(
+                str(d["_id"]) for d in discussions if d.get("version", 0) > known.get(str(d["_id"]), 0)
+            )
+            has_more = len(changed) > limit
+            changed = changed[:limit]
+            messages = []
+            if changed:
+                messages = list(
+                    self.messages.find(
+                        {"$or": [
+                            {"discussion_id": d, "version": {"$gt": known.get(d, 0)}} for d in changed
+                        ]},
+                        MESSAGE_PROJECTION,
+                    )
+                    .sort([("discussion_id", ASCENDING), ("version", ASCENDING)])
+                    .limit(limit + 1)
+                )
+
+            # stop in the discussion where the messages were cut short so nothing is skipped
+            cut = None
+            if len(messages) > limit:
+                has_more = True
+                messages = messages[:limit]
+                cut = messages[-1]
+                changed = [d for d in changed if d <= cut["discussion_id"]]
+            token = dict(known)
+            for discussion_id in changed:
+                version = settled[discussion_id]
+                if cut and discussion_id == cut["discussion_id"]:
+                    version = min(version, cut["version"])
+                token[discussion_id] = max(known.get(discussion_id, 0), version)
+            # a page held back by a change still in flight comes back on a later sync
+            has_more = has_more and token != known
+
+            summaries = []
+            if changed:
+                summaries = list(
+                    self.discussions.find(
+                        {"_id": {"$in": [ObjectId(d) for d in changed]}}, inbox_projection(user_id)
+                    ).sort("_id", ASCENDING)
+                )
+            return True, {
+                "message": "Successful.",
+                "reset": False,
+                "token": encode_sync_token(token),
+                "discussions": self._format_discussions(user_id, summaries),
+                "messages": [serialize_message(message) for message in messages],
+                "has_more": has_more,
+            }
+        except Exception as e:
+            logger.exception("Error syncing changes: %s", e)
+            return False, {"message": "Error syncing changes."}
 
-            if isinstance(last_msg, ObjectId):
-                msg_doc = self.messages.find_one({"_id": last_msg})
-            else:
-                msg_doc = last_msg
+    def get_discussion_messages(self, discussion_id, limit=20, before=None, after=None, user_id=None):
+        """Retrieve a page of messages for a discussion using (timestamp, _id) cursors.
 
-            if msg_doc:
-                msg_doc["_id"] = str(msg_doc["_id"])
-                msg_doc = serialize_datetime_fields(msg_doc)
-                d["last_message"] = msg_doc
-                d["last_message_timestamp"] = msg_doc.get("timestamp", "")
+        Without a cursor the most recent page is returned. ``before`` pages
+        towards older messages and ``after`` towards newer ones. Messages are
+        always returned oldest first, and ``next_cursor`` is set when more
+        messages exist in the requested direction.
+        """
+        try:
+            limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+            meta = self.discussion_meta(discussion_id)
+            if not meta or (user_id and str(user_id) not in meta["participants"]):
+                return False, {"message": "Discussion not found.", "code": 404}
+
+            if before and after:
+                return False, {"message": "Use either before or after, not both.", "code": 400}
+
+            try:
+                cursor = decode_cursor(before or after) if (before or after) else None
+            except ValueError:
+                return False, {"message": "Invalid cursor.", "code": 400}
+
+            query = {"discussion_id": discussion_id}
+            if after:
+                timestamp, last_id = cursor
+                query["$or"] = [
+                    {"timestamp": {"$gt": timestamp}},
+                    {"timestamp": timestamp, "_id": {"$gt": last_id}},
+                ]
+                direction = ASCENDING
             else:
-                d["last_message"] = {}
-                d["last_message_timestamp"] = {}
-
-            # Remove raw messages field
-            d.pop("messages", None)
-
-            result.append(d)
-
-        # Sort discussions by the timestamp of the last message (descending order)
-        result.sort(key=lambda x: x.get("last_message_timestamp", ""), reverse=True)
+                if cursor:
+                    timestamp, last_id = cursor
+                    query["$or"] = [
+                        {"timestamp": {"$lt": timestamp}},
+                        {"timestamp": timestamp, "_id": {"$lt": last_id}},
+                    ]
+                direction = DESCENDING
+
+            # fetch one extra document to know whether another page exists
+            messages = list(
+                self.messages.find(query, MESSAGE_PROJECTION)
+                .sort([("timestamp", direction), ("_id", direction)])
+                .limit(limit + 1)
+            )
+            has_more = len(messages) > limit
+            messages = messages[:limit]
 
-        return result
+            next_cursor = None
+            if has_more:
+                edge = messages[-1]
+                next_cursor = encode_cursor(edge["timestamp"], edge["_id"])
 
-    def get_discussion_messages(self, discussion_id, limit=20, offset=0):
-        """Retrieve messages for a specific discussion with optional pagination."""
-        try:
-            discussion = self.discussions.find_one({"_id": ObjectId(discussion_id)})
-            if not discussion:
-                return False, {"message": "Discussion not found."}
+            if direction == DESCENDING:
+                messages.reverse()
 
-            messages_cursor = (
-                self.messages.find({"discussion_id": discussion_id})
-                .sort("timestamp", 1)
-            )
-            messages = []
-
-            for msg in messages_cursor:
-                msg["_id"] = str(msg["_id"])
-                msg["discussion_id"] = str(msg["discussion_id"])
-                msg["sender_id"] = str(msg["sender_id"])
-                msg["recipient_id"] = str(msg["recipient_id"])
-                msg["timestamp"] = msg["timestamp"].isoformat()  # Optional: ISO string
-                messages.append(msg)
-            return True, messages
+            return True, {
+                "message": "Successful.",
+                "data": [serialize_message(msg) for msg in messages],
+                "next_cursor": next_cursor,
+            }
         except Exception as e:
-            print(f"Error retrieving messages: {e}")
+            logger.exception("Error retrieving messages: %s", e)
             return False, {"message": "Error retrieving messages."}
 
     def send_message(self, data):
@@ -158,12 +552,15 @@ class MessageHandler:
             if not all([discussion_id, sender_id, text]):
                 return False, {"message": "Missing required fields.", "code": 404}
 
-            discussion = self.discussions.find_one({"_id": ObjectId(discussion_id)})
-            if not discussion:
+            discussion = self.discussion_meta(discussion_id)
+            if not discussion or sender_id not in discussion["participants"]:
                 return False, {"message": "Discussion not found."}
-            
-            if not recipient_id:
-                participants = discussion.get("participants", [])
+
+            if discussion.get("is_group"):
+                # everyone in the room receives it
+                recipient_id = None
+            elif not recipient_id:
+                participants = list(discussion.get("participants", []))
                 if sender_id in participants:
                     participants.remove(sender_id)
                 recipient_id = participants[0] if participants else None
@@ -172,73 +569,388 @@ class MessageHandler:
                     return False, {"message": "No recipient found."}
 
             message = {
+                "_id": ObjectId(),
                 "discussion_id": discussion_id,
                 "sender_id": sender_id,
                 "recipient_id": recipient_id,
                 "text": text,
-                "timestamp": datetime.now(),
+                "timestamp": datetime.now(timezone.utc),
             }
+            update = {"$set": {"last_message": dict(message), "last_message_at": message["timestamp"]}}
+            if self.recent_messages:
+                # keep only a capped ring of the latest ids so the document stays bounded
+                update["$push"] = {
+                    "messages": {"$each": [message["_id"]], "$slice": -self.recent_messages}
+                }
+            # one write numbers the message and updates the summary
+            message["version"], message["seq"] = self._reserve(discussion_id, message["_id"], 1, 1, update)
             self.messages.insert_one(message)
-            # limit by 50 messages
-            self.discussions.update_one(
-                {"_id": ObjectId(discussion_id)},
-                {"$push": {"messages": message["_id"]}},
-            )
-            messages_cursor = (
-                self.messages.find({"discussion_id": discussion_id})
-                .sort("timestamp", 1)
-            )
-            messages = []
-
-            for msg in messages_cursor:
-                msg["_id"] = str(msg["_id"])
-                msg["discussion_id"] = str(msg["discussion_id"])
-                msg["sender_id"] = str(msg["sender_id"])
-                msg["recipient_id"] = str(msg["recipient_id"])
-                msg["timestamp"] = msg["timestamp"].isoformat()  # Optional: ISO string
-                messages.append(msg)
+            self.search.add(message)
+            self.cache.invalidate_discussion(discussion_id, discussion["participants"])
+            # senders have read their own messages
+            self._queue_read(sender_id, discussion_id, message["seq"], message["_id"])
 
             return True, {
                 "message": "Successful.",
-                "data": messages,
+                "data": serialize_message(message),
                 "code": 200,
             }
         except Exception as e:
-            print(f"Error sending message: {e}")
+            logger.exception("Error sending message: %s", e)
             return False, {"message": f"Error sending message: {e}", "code": 500}
 
-    def update_message(self, message_id, data):
-        """Update message"""
+    def send_messages(self, sender_id, items):
+        """Send many messages, possibly across several discussions, in one batch.
+
+        Membership is checked once per discussion, and each discussion takes
+        one write that numbers its messages and sets its summary. Messages
+        are then written with a single unordered insert_many. Returns one
+        result per item, in order.
+        """
+        try:
+            if not isinstance(items, list) or not items:
+                return False, {"message": "No messages to send.", "code": 400}
+            if len(items) > MAX_BATCH_SIZE:
+                return False, {"message": f"At most {MAX_BATCH_SIZE} messages per batch.", "code": 400}
+
+            sender_id = str(sender_id)
+            results = [None] * len(items)
+            discussion_ids = set()
+            for index, item in enumerate(items):
+                if not isinstance(item, dict) or not item.get("discussion_id") or not item.get("text"):
+                    results[index] = {"status": "error", "message": "Missing required fields."}
+                elif not ObjectId.is_valid(item["discussion_id"]):
+                    results[index] = {"status": "error", "message": "Discussion not found."}
+                else:
+                    discussion_ids.add(item["discussion_id"])
+
+            recipients, members = {}, {}
+            for discussion in self.discussions.find(
+                {"_id": {"$in": [ObjectId(d) for d in discussion_ids]}, "participants": sender_id},
+                {"participants": 1, "is_group": 1},
+            ):
+                others = [p for p in discussion["participants"] if p != sender_id]
+                if discussion.get("is_group"):
+                    recipients[str(discussion["_id"])] = None
+                else:
+                    recipients[str(discussion["_id"])] = others[0] if others else sender_id
+                members[str(discussion["_id"])] = discussion["participants"]
+
+            now = datetime.now(timezone.utc)
+            documents, positions = [], []
+            for index, item in enumerate(items):
+                if results[index] is not None:
+                    continue
+                if item["discussion_id"] not in recipients:
+                    results[index] = {"status": "error", "message": "Discussion not found."}
+                    continue
+                documents.append({
+                    "_id": ObjectId(),
+                    "discussion_id": item["discussion_id"],
+                    "sender_id": sender_id,
+                    "recipient_id": recipients[item["discussion_id"]],
+                    "text": item["text"],
+                    "timestamp": now,
+                })
+                positions.append(index)
+
+            batches = {}
+            for message in documents:
+                batches.setdefault(message["discussion_id"], []).append(message)
+
+            # one write per discussion numbers its messages and makes the last one its summary
+            for discussion_id, batch in batches.items():
+                update = {"$set": {"last_message": dict(batch[-1]), "last_message_at": now}}
+                if self.recent_messages:
+                    update["$push"] = {
+                        "messages": {"$each": [m["_id"] for m in batch], "$slice": -self.recent_messages}
+                    }
+                version, seq = self._reserve(discussion_id, batch[-1]["_id"], len(batch), len(batch), update)
+                for message in batch:
+                    message["version"], message["seq"] = version, seq
+                    version += 1
+                    seq += 1
+
+            failed = set()
+            if documents:
+                try:
+                    self.messages.insert_many(documents, ordered=False)
+                except BulkWriteError as e:
+                    for error in e.details.get("writeErrors", []):
+                        failed.add(error["index"])
+                        results[positions[error["index"]]] = {
+                            "status": "error", "message": error.get("errmsg", "Write failed."),
+                        }
+
+            latest = {}
+            for offset, message in enumerate(documents):
+                if offset in failed:
+                    continue
+                self.search.add(message)
+                latest[message["discussion_id"]] = message
+
+            for discussion_id, batch in batches.items():
+                message = latest.get(discussion_id)
+                if message is not batch[-1]:
+                    # the summary went out ahead of a message that failed to store
+                    self._restore_summary(discussion_id, batch[-1]["_id"], message)
+                self.cache.invalidate_discussion(discussion_id, members[discussion_id])
+                if message is not None:
+                    self._queue_read(sender_id, discussion_id, message["seq"], message["_id"])
+
+            stored = []
+            for offset, message in enumerate(documents):
+                if offset in failed:
+                    continue
+                message = serialize_message(message)
+                results[positions[offset]] = {"status": "ok", "message_id": message["_id"]}
+                stored.append(message)
+
+            return True, {
+                "message": "Successful.",
+                "results": results,
+                "data": stored,
+                "code": 200,
+            }
+        except Exception as e:
+            logger.exception("Error sending messages: %s", e)
+            return False, {"message": f"Error sending messages: {e}", "code": 500}
+
+    def _restore_summary(self, discussion_id, message_id, latest=None):
+        """Replace a summary showing ``message_id`` with ``latest``, or the newest remaining message."""
+        if latest is None:
+            latest = self.messages.find_one(
+                {"discussion_id": discussion_id, "_id": {"$ne": message_id}, "deleted": {"$ne": True}},
+                MESSAGE_PROJECTION,
+                sort=[("timestamp", DESCENDING), ("_id", DESCENDING)],
+            )
+        summary = {"last_message": latest}
+        if latest:
+            summary["last_message_at"] = latest["timestamp"]
+        result = self.discussions.update_one(
+            {"_id": ObjectId(discussion_id), "last_message._id": message_id}, {"$set": summary}
+        )
+        return result.modified_count, latest
+
+    def update_message(self, message_id, data, user_id=None):
+        """Edit the text of a message.
+
+        Only the sender may edit when ``user_id`` is given. The discussion
+        summary is patched in place, with one targeted update, when the edited
+        message is the discussion's last one; ``last_message`` is then part of
+        the response.
+        """
         # data -> {text}
         try:
-            update_data = {"$set": data}
-            result = self.messages.update_one(
-                {"_id": ObjectId(message_id)}, update_data
+            text = (data or {}).get("text")
+            if not text:
+                return False, {"message": "Missing required fields.", "code": 400}
+            if not ObjectId.is_valid(message_id):
+                return False, {"message": "Message not found.", "code": 404}
+
+            query = {"_id": ObjectId(message_id), "deleted": {"$ne": True}}
+            if user_id:
+                query["sender_id"] = str(user_id)
+            message = self.messages.find_one(query, {"discussion_id": 1})
+            if not message:
+                return False, {"message": "Message not found.", "code": 404}
+            discussion_id = message["discussion_id"]
+            now = datetime.now(timezone.utc)
+            # the summary is patched before the version below publishes the edit
+            result = self.discussions.update_one(
+                {"_id": ObjectId(discussion_id), "last_message._id": message["_id"]},
+                {"$set": {"last_message.text": text, "last_message.edited_at": now}},
+            )
+            version, _ = self._reserve(discussion_id, message["_id"])
+            message = self.messages.find_one_and_update(
+                query,
+                {"$set": {"text": text, "edited_at": now, "updated_at": now, "version": version}},
+                projection=MESSAGE_PROJECTION,
+                return_document=ReturnDocument.AFTER,
             )
-            if result.matched_count == 0:
+            if not message:
                 return False, {"message": "Message not found.", "code": 404}
-            return True, {"message": "Message updated successfully."}
+            self.search.add(message)
+
+            message = serialize_message(message)
+            response = {
+                "message": "Message updated successfully.",
+                "data": {
+                    "_id": message["_id"],
+                    "discussion_id": message["discussion_id"],
+                    "text": text,
+                    "edited_at": message["edited_at"],
+                },
+            }
+            if result.modified_count:
+                self._invalidate(message["discussion_id"])
+                response["last_message"] = message
+            return True, response
         except Exception as e:
-            print(f"Error updating message: {e}")
+            logger.exception("Error updating message: %s", e)
             return False, {"message": "Error updating message.", "code": 500}
 
-    def delete_message(self, message_id):
-        """Delete message"""
+    def delete_message(self, message_id, user_id=None):
+        """Delete a message, leaving a tombstone for clients to sync.
+
+        The text is cleared and the document stays, flagged ``deleted``, so
+        paginated clients see the deletion in the change feed. When it was
+        the discussion's last message, the summary falls back to the newest
+        remaining message with one indexed query; ``last_message`` is then
+        part of the response (None if nothing is left).
+        """
         try:
-            message = self.messages.find_one({"_id": ObjectId(message_id)})
-            if not message:
+            if not ObjectId.is_valid(message_id):
                 return False, {"message": "Message not found", "code": 404}
 
-            self.messages.delete_one({"_id": ObjectId(message_id)})
-            self.discussions.update_one(
-                {"_id": ObjectId(message.discussion_id)},
-                {"$pull": {"messages": message_id}},
+            query = {"_id": ObjectId(message_id), "deleted": {"$ne": True}}
+            if user_id:
+                query["sender_id"] = str(user_id)
+            message = self.messages.find_one(query, {"discussion_id": 1})
+            if not message:
+                return False, {"message": "Message not found", "code": 404}
+            discussion_id = message["discussion_id"]
+            now = datetime.now(timezone.utc)
+
+            # the summary falls back before the version below publishes the deletion
+            restored, latest = 0, None
+            if self.discussions.find_one(
+                {"_id": ObjectId(discussion_id), "last_message._id": message["_id"]}, {"_id": 1}
+            ):
+                restored, latest = self._restore_summary(discussion_id, message["_id"])
+            version, _ = self._reserve(
+                discussion_id, message["_id"], update={"$pull": {"messages": message["_id"]}}
             )
-
-            return True, {"message": "Message deleted successfully."}
+            if not self.messages.find_one_and_update(
+                query,
+                {"$set": {"deleted": True, "text": "", "deleted_at": now, "updated_at": now, "version": version}},
+                projection={"_id": 1},
+            ):
+                return False, {"message": "Message not found", "code": 404}
+            self.search.remove(message["_id"], version)
+
+            response = {
+                "message": "Message deleted successfully.",
+                "data": {
+                    "_id": str(message["_id"]),
+                    "discussion_id": discussion_id,
+                    "deleted": True,
+                    "deleted_at": now.isoformat(),
+                },
+            }
+            if restored:
+                self._invalidate(discussion_id)
+                response["last_message"] = serialize_message(latest) if latest else None
+            return True, response
         except Exception as e:
-            print(f"Error deleting message: {e}")
+            logger.exception("Error deleting message: %s", e)
             return False, {"message": "Error deleting message.", "code": 500}
 
+    def get_discussion_changes(self, discussion_id, since=None, limit=MAX_PAGE_SIZE, user_id=None):
+        """Messages edited or deleted in a discussion after the ``since`` cursor.
 
-message_handler = MessageHandler(config["db"])
+        Deleted messages come back as tombstones. ``cursor`` in the response
+        is the position to pass as ``since`` next time, and ``has_more`` says
+        whether another page is waiting. Served from a partial index that
+        holds only changed messages.
+        """
+        try:
+            limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+            meta = self.discussion_meta(discussion_id)
+            if not meta or (user_id and str(user_id) not in meta["participants"]):
+                return False, {"message": "Discussion not found.", "code": 404}
+
+            query = {"discussion_id": discussion_id, "updated_at": {"$exists": True}}
+            if since:
+                try:
+                    updated_at, last_id = decode_cursor(since)
+                except ValueError:
+                    return False, {"message": "Invalid cursor.", "code": 400}
+                query["updated_at"] = {"$gte": updated_at}
+                query["$or"] = [
+                    {"updated_at": {"$gt": updated_at}},
+                    {"updated_at": updated_at, "_id": {"$gt": last_id}},
+                ]
+
+            changes = list(
+                self.messages.find(query, MESSAGE_PROJECTION)
+                .sort([("updated_at", ASCENDING), ("_id", ASCENDING)])
+                .limit(limit + 1)
+            )
+            has_more = len(changes) > limit
+            changes = changes[:limit]
+            cursor = encode_cursor(changes[-1]["updated_at"], changes[-1]["_id"]) if changes else since
+
+            return True, {
+                "message": "Successful.",
+                "data": [serialize_message(message) for message in changes],
+                "cursor": cursor,
+                "has_more": has_more,
+            }
+        except Exception as e:
+            logger.exception("Error retrieving message changes: %s", e)
+            return False, {"message": "Error retrieving message changes."}
+
+    def search_messages(self, user_id, query, discussion_id=None, limit=20, cursor=None):
+        """Messages of the user's discussions matching ``query``, best match first.
+
+        Searches one discussion when ``discussion_id`` is given, else all of
+        the user's. Each result is the message with its ``score``, a
+        ``snippet`` of the text around the first match and the
+        ``highlights`` of matched words as [start, end) offsets into the
+        snippet. ``next_cursor`` is set while more results exist.
+        """
+        try:
+            limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+            query = (query or "").strip()
+            if not query:
+                return False, {"message": "Missing query.", "code": 400}
+            if len(query) > MAX_SEARCH_QUERY:
+                return False, {"message": f"Queries are at most {MAX_SEARCH_QUERY} characters.", "code": 400}
+            try:
+                offset = int(cursor) if cursor else 0
+                if offset < 0:
+                    raise ValueError(cursor)
+            except ValueError:
+                return False, {"message": "Invalid cursor.", "code": 400}
+
+            if discussion_id:
+                meta = self.discussion_meta(discussion_id)
+                if not meta or str(user_id) not in meta["participants"]:
+                    return False, {"message": "Discussion not found.", "code": 404}
+                discussion_ids = [discussion_id]
+            else:
+                discussion_ids = self.get_discussion_ids(user_id)
+
+            limit = min(limit, MAX_SEARCH_RESULTS - offset)
+            hits = self.search.search(query, discussion_ids, offset, limit + 1) if limit > 0 else []
+            # nothing is served past MAX_SEARCH_RESULTS, so no cursor points there
+            has_more = len(hits) > limit and offset + limit < MAX_SEARCH_RESULTS
+            hits = hits[:limit]
+            documents = {}
+            if hits:
+                for message in self.messages.find(
+                    {"_id": {"$in": [message_id for message_id, _ in hits]}}, MESSAGE_PROJECTION
+                ):
+                    documents[message["_id"]] = message
+
+            terms = query_terms(query)
+            results = []
+            for message_id, score in hits:
+                message = documents.get(message_id)
+                # an index may trail a delete by a moment
+                if not message or message.get("deleted"):
+                    continue
+                result = serialize_message(message)
+                result["score"] = round(score, 4)
+                result["snippet"], result["highlights"] = highlight(message["text"], terms)
+                results.append(result)
+
+            return True, {
+                "message": "Successful.",
+                "data": results,
+                "next_cursor": str(offset + limit) if has_more else None,
+            }
+        except Exception as e:
+            logger.exception("Error searching messages: %s", e)
+            return False, {"message": "Error searching messages.", "code": 500}
@@ -0,0 +1,161 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from pymongo import monitoring
+from app.config import config
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+class Metrics:
+    """A small in-process metrics registry rendered in the Prometheus text format."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._meta = {}
+        self._counters = {}
+        self._histograms = {}
+        self._gauges = {}
+
+    def counter(self, name, help_text):
+        self._meta[name] = ("counter", help_text, None)
+
+    def histogram(self, name, help_text, buckets=LATENCY_BUCKETS):
+        self._meta[name] = ("histogram", help_text, buckets)
+
+    def gauge(self, name, help_text, fn):
+        """Register a gauge whose value is read from ``fn`` at scrape time."""
+        self._meta[name] = ("gauge", help_text, None)
+        self._gauges[name] = fn
+
+    def inc(self, metric, value=1, **labels):
+        key = (metric, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, metric, value, **labels):
+        buckets = self._meta[metric][2]
+        key = (metric, tuple(sorted(labels.items())))
+        with self._lock:
+            series = self._histograms.get(key)
+            if series is None:
+                series = self._histograms[key] = [[0] * len(buckets), 0.0, 0]
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def value(self, metric, **labels):
+        with self._lock:
+            return self._counters.get((metric, tuple(sorted(labels.items()))), 0)
+
+    def render(self):
+        lines = []
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: (list(s[0]), s[1], s[2]) for key, s in self._histograms.items()}
+
+        for name, (kind, help_text, buckets) in sorted(self._meta.items()):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            if kind == "counter":
+                for (series, labels), value in counters.items():
+                    if series == name:
+                        lines.append(f"{name}{_labels(labels)} {value}")
+            elif kind == "gauge":
+                try:
+                    values = self._gauges[name]()
+                except Exception as e:
+                    logger.warning("gauge %s failed: %s", name, e)
+                    continue
+                if not isinstance(values, dict):
+                    values = {(): values}
+                for labels, value in values.items():
+                    lines.append(f"{name}{_labels(labels)} {value}")
+            else:
+                for (series, labels), (counts, total, count) in histograms.items():
+                    if series != name:
+                        continue
+                    for bound, bucket_count in zip(buckets, counts):
+                        lines.append(f"{name}_bucket{_labels(labels + (('le', bound),))} {bucket_count}")
+                    lines.append(f"{name}_bucket{_labels(labels + (('le', '+Inf'),))} {count}")
+                    lines.append(f"{name}_sum{_labels(labels)} {total}")
+                    lines.append(f"{name}_count{_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+
+metrics = Metrics()
+metrics.histogram("diskuss_handler_seconds", "Time spent in Socket.IO handlers and REST routes.")
+metrics.counter("diskuss_handler_errors_total", "Handlers that raised an exception.")
+metrics.histogram("diskuss_handler_db_operations", "MongoDB operations issued per handler call.", COUNT_BUCKETS)
+metrics.histogram("diskuss_handler_db_seconds", "Time spent in MongoDB per handler call.")
+metrics.counter("diskuss_db_commands_total", "MongoDB commands by name and outcome.")
+metrics.counter("diskuss_db_command_seconds_total", "Time spent in MongoDB commands by name.")
+
+# per-request (or per-event) MongoDB usage, filled in by the command listener
+_current = threading.local()
+
+
+class CommandTimer(monitoring.CommandListener):
+    """Counts MongoDB commands globally and for the handler currently running."""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        self._record(event, "ok")
+
+    def failed(self, event):
+        self._record(event, "error")
+
+    def _record(self, event, outcome):
+        seconds = event.duration_micros / 1_000_000
+        metrics.inc("diskuss_db_commands_total", command=event.command_name, outcome=outcome)
+        metrics.inc("diskuss_db_command_seconds_total", seconds, command=event.command_name)
+        stats = getattr(_current, "stats", None)
+        if stats is not None:
+            stats["operations"] += 1
+            stats["seconds"] += seconds
+
+
+@contextmanager
+def track(kind, name, db_ops_warning=None):
+    """Time a handler call and count the MongoDB operations it issues."""
+    outer = getattr(_current, "stats", None)
+    stats = _current.stats = {"operations": 0, "seconds": 0.0}
+    start = time.perf_counter()
+    try:
+        yield stats
+    except Exception:
+        metrics.inc("diskuss_handler_errors_total", kind=kind, name=name)
+        raise
+    finally:
+        _current.stats = outer
+        metrics.observe("diskuss_handler_seconds", time.perf_counter() - start, kind=kind, name=name)
+        metrics.observe("diskuss_handler_db_operations", stats["operations"], kind=kind, name=name)
+        metrics.observe("diskuss_handler_db_seconds", stats["seconds"], kind=kind, name=name)
+        if db_ops_warning and stats["operations"] > db_ops_warning:
+            logger.warning("%s %s issued %d MongoDB operations", kind, name, stats["operations"])
+
+
+def timed_event(name):
+    """Instrument a Socket.IO handler; apply below ``@socketio.on``."""
+    def decorator(f):
+        @wraps(f)
+        def wrapped(*args, **kwargs):
+            with track("event", name, config["db_ops_warning"]):
+                return f(*args, **kwargs)
+        return wrapped
+    return decorator
@@ -0,0 +1,79 @@
+import threading
+import bcrypt
+from app.metrics import metrics
+
+metrics.counter("diskuss_password_hashes_total", "bcrypt hashes and checks by operation and result.")
+
+
+class HasherBusy(Exception):
+    """Raised when the hashing pool already has as much work as it may queue."""
+
+
+def thread_runner(async_mode, workers):
+    """``run(fn, *args)`` executing fn on a real OS thread for the given async mode.
+
+    bcrypt releases the GIL, so OS threads run hashes in parallel while the
+    event loop keeps serving sockets. Green threads would not: under eventlet
+    and gevent the hash has to leave the hub's thread.
+    """
+    if async_mode == "eventlet":
+        from eventlet import tpool
+        tpool.set_num_threads(workers)
+        return tpool.execute
+    if async_mode in ("gevent", "gevent_uwsgi"):
+        from gevent.threadpool import ThreadPool
+        pool = ThreadPool(workers)
+        return lambda fn, *args: pool.apply(fn, args)
+
+    from concurrent.futures import ThreadPoolExecutor
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+    return lambda fn, *args: executor.submit(fn, *args).result()
+
+
+class PasswordHasher:
+    """bcrypt hashing and checking on a bounded pool of OS threads.
+
+    At most ``workers`` hashes run at once and ``max_waiting`` more may wait
+    for a thread. Beyond that, calls fail fast with HasherBusy instead of
+    piling up behind a login burst. ``get_async_mode`` is read on first use,
+    once the Socket.IO server has settled on one.
+    """
+
+    def __init__(self, rounds=12, workers=4, max_waiting=32, get_async_mode=lambda: "threading"):
+        self.rounds = rounds
+        self.workers = workers
+        self.get_async_mode = get_async_mode
+        self._slots = threading.BoundedSemaphore(workers + max_waiting)
+        self._run = None
+        self._lock = threading.Lock()
+
+    def _execute(self, operation, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            metrics.inc("diskuss_password_hashes_total", operation=operation, result="rejected")
+            raise HasherBusy()
+        try:
+            if self._run is None:
+                with self._lock:
+                    if self._run is None:
+                        self._run = thread_runner(self.get_async_mode(), self.workers)
+            result = self._run(fn, *args)
+            metrics.inc("diskuss_password_hashes_total", operation=operation, result="done")
+            return result
+        finally:
+            self._slots.release()
+
+    def hash(self, password):
+        salt = bcrypt.gensalt(rounds=self.rounds)
+        return self._execute("hash", bcrypt.hashpw, password.encode("utf-8"), salt).decode("utf-8")
+
+    def check(self, hashed_password, password):
+        return self._execute(
+            "check", bcrypt.checkpw, password.encode("utf-8"), hashed_password.encode("utf-8")
+        )
+
+    def needs_rehash(self, hashed_password):
+        """Whether a stored hash was made with a cost other than the configured one."""
+        try:
+            return int(hashed_password.split("$")[2]) != self.rounds
+        except (IndexError, ValueError):
+            return True
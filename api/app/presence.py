@@ -0,0 +1,255 @@
+import abc
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def discussion_room(discussion_id):
+    """Name of the Socket.IO room the sockets of a discussion's participants join."""
+    return f"discussion:{discussion_id}"
+
+
+class PresenceRegistry(abc.ABC):
+    """Tracks which sockets belong to which connected user."""
+
+    @abc.abstractmethod
+    def connect(self, user_id, socket_id, protocol=None):
+        """Register a socket of ``user_id`` and the wire protocol it negotiated, if any."""
+
+    @abc.abstractmethod
+    def disconnect(self, socket_id):
+        """Remove a socket and return the user it belonged to, if any."""
+
+    @abc.abstractmethod
+    def get_socket_ids(self, user_id):
+        """Ids of the user's open sockets."""
+
+    @abc.abstractmethod
+    def get_socket_protocols(self, user_id):
+        """The user's open sockets, each mapped to its negotiated wire protocol or None."""
+
+    @abc.abstractmethod
+    def get_user_id(self, socket_id):
+        """The user a socket belongs to, or None."""
+
+    def is_online(self, user_id):
+        return bool(self.get_socket_ids(user_id))
+
+    @abc.abstractmethod
+    def count_users(self):
+        """Users with at least one open socket."""
+
+    @abc.abstractmethod
+    def count_sockets(self):
+        """Open sockets."""
+
+
+class InMemoryPresenceRegistry(PresenceRegistry):
+    """Presence for a single worker process, kept in two dicts."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._user_sids = {}
+        self._sid_user = {}
+        self._sid_protocol = {}
+
+    def connect(self, user_id, socket_id, protocol=None):
+        user_id = str(user_id)
+        with self._lock:
+            self._user_sids.setdefault(user_id, set()).add(socket_id)
+            self._sid_user[socket_id] = user_id
+            if protocol:
+                self._sid_protocol[socket_id] = protocol
+
+    def disconnect(self, socket_id):
+        with self._lock:
+            self._sid_protocol.pop(socket_id, None)
+            user_id = self._sid_user.pop(socket_id, None)
+            if user_id is None:
+                return None
+            socket_ids = self._user_sids.get(user_id)
+            if socket_ids is not None:
+                socket_ids.discard(socket_id)
+                if not socket_ids:
+                    del self._user_sids[user_id]
+            return user_id
+
+    def get_socket_ids(self, user_id):
+        with self._lock:
+            return list(self._user_sids.get(str(user_id), ()))
+
+    def get_socket_protocols(self, user_id):
+        with self._lock:
+            return {sid: self._sid_protocol.get(sid) for sid in self._user_sids.get(str(user_id), ())}
+
+    def get_user_id(self, socket_id):
+        with self._lock:
+            return self._sid_user.get(socket_id)
+
+    def count_users(self):
+        with self._lock:
+            return len(self._user_sids)
+
+    def count_sockets(self):
+        with self._lock:
+            return len(self._sid_user)
+
+
+# removes one socket from every key; shared by the disconnect and reap scripts so
+# a socket's user goes offline in the same step as its last socket
+_REMOVE_FUNCTION = """
+local function remove(sid)
+  redis.call('ZREM', KEYS[2], sid)
+  redis.call('HDEL', KEYS[4], sid)
+  local user = redis.call('HGET', KEYS[1], sid)
+  if not user then return false end
+  redis.call('HDEL', KEYS[1], sid)
+  local user_key = ARGV[1] .. user
+  redis.call('SREM', user_key, sid)
+  if redis.call('SCARD', user_key) == 0 then redis.call('SREM', KEYS[3], user) end
+  return user
+end
+"""
+
+_CONNECT_SCRIPT = """
+redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+redis.call('ZADD', KEYS[2], ARGV[3], ARGV[1])
+redis.call('SADD', KEYS[4], ARGV[1])
+redis.call('SADD', KEYS[3], ARGV[2])
+if ARGV[4] ~= '' then redis.call('HSET', KEYS[5], ARGV[1], ARGV[4]) end
+"""
+
+_DISCONNECT_SCRIPT = _REMOVE_FUNCTION + "return remove(ARGV[2])"
+
+_REAP_SCRIPT = _REMOVE_FUNCTION + """
+local expired = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', ARGV[2])
+for _, sid in ipairs(expired) do remove(sid) end
+return #expired
+"""
+
+
+class SharedPresenceRegistry(PresenceRegistry):
+    """Presence shared by several workers through redis.
+
+    Layout: a hash of socket id -> user id, a sorted set of socket id ->
+    expiry time, one set of socket ids per user, a set of online user ids
+    and a hash of socket id -> protocol for sockets that negotiated one,
+    all under ``prefix``. Connect and disconnect are Lua scripts, so a user
+    never shows offline while one of their sockets is registered.
+
+    Sockets expire ``ttl`` seconds after they were last seen. Each worker
+    refreshes the sockets it holds every ``ttl / 3`` seconds and removes
+    expired ones, so the sockets of a worker that died without running
+    their disconnect handlers go away within ``ttl`` seconds.
+    """
+
+    def __init__(self, store, prefix="diskuss:presence", ttl=60):
+        self.store = store
+        self.ttl = ttl
+        self.sids_key = f"{prefix}:sids"
+        self.expiry_key = f"{prefix}:expiry"
+        self.users_key = f"{prefix}:users"
+        self.protocols_key = f"{prefix}:protocols"
+        self.user_prefix = f"{prefix}:user:"
+        self._connect = store.register_script(_CONNECT_SCRIPT)
+        self._disconnect = store.register_script(_DISCONNECT_SCRIPT)
+        self._reap = store.register_script(_REAP_SCRIPT)
+        # sockets of this worker, kept alive by the heartbeat
+        self._local = set()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def _user_key(self, user_id):
+        return f"{self.user_prefix}{user_id}"
+
+    def connect(self, user_id, socket_id, protocol=None):
+        user_id = str(user_id)
+        self._connect(
+            keys=[self.sids_key, self.expiry_key, self.users_key, self._user_key(user_id), self.protocols_key],
+            args=[socket_id, user_id, time.time() + self.ttl, protocol or ""],
+        )
+        with self._lock:
+            self._local.add(socket_id)
+        self._ensure_started()
+
+    def disconnect(self, socket_id):
+        with self._lock:
+            self._local.discard(socket_id)
+        user_id = self._disconnect(
+            keys=[self.sids_key, self.expiry_key, self.users_key, self.protocols_key],
+            args=[self.user_prefix, socket_id],
+        )
+        return _decode(user_id) if user_id is not None else None
+
+    def heartbeat(self):
+        """Extend the sockets of this worker and remove expired ones; returns how many expired."""
+        now = time.time()
+        with self._lock:
+            local = list(self._local)
+        if local:
+            # XX: a socket another worker reaped stays gone
+            self.store.zadd(self.expiry_key, dict.fromkeys(local, now + self.ttl), xx=True)
+        return self._reap(
+            keys=[self.sids_key, self.expiry_key, self.users_key, self.protocols_key], args=[self.user_prefix, now]
+        )
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name="presence-heartbeat", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.ttl / 3)
+            try:
+                expired = self.heartbeat()
+                if expired:
+                    logger.info("Removed %d expired sockets from presence", expired)
+            except Exception as e:
+                logger.exception("Error refreshing presence: %s", e)
+
+    def get_socket_ids(self, user_id):
+        return [_decode(sid) for sid in self.store.smembers(self._user_key(user_id))]
+
+    def get_socket_protocols(self, user_id):
+        socket_ids = self.get_socket_ids(user_id)
+        if not socket_ids:
+            return {}
+        protocols = self.store.hmget(self.protocols_key, socket_ids)
+        return {
+            sid: _decode(protocol) if protocol is not None else None
+            for sid, protocol in zip(socket_ids, protocols)
+        }
+
+    def get_user_id(self, socket_id):
+        user_id = self.store.hget(self.sids_key, socket_id)
+        return _decode(user_id) if user_id is not None else None
+
+    def count_users(self):
+        return self.store.scard(self.users_key)
+
+    def count_sockets(self):
+        return self.store.hlen(self.sids_key)
+
+
+def _decode(value):
+    return value.decode('utf-8') if isinstance(value, bytes) else value
+
+
+def create_presence_registry(backend="memory", redis_url=None, ttl=60):
+    """Build the presence registry selected in the config."""
+    if backend == "memory":
+        return InMemoryPresenceRegistry()
+    if backend == "redis":
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("The redis package is required for the redis presence backend.")
+        return SharedPresenceRegistry(redis.Redis.from_url(redis_url), ttl=ttl)
+    raise ValueError(f"Unknown presence backend: {backend}")
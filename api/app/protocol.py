@@ -0,0 +1,155 @@
+"""Opt-in compact wire format for Socket.IO events.
+
+A client asks for it at connect (``auth={"token": ..., "protocol": "compact"}``)
+and is told the outcome by a ``protocol`` event. Compact sockets receive each
+event payload as one binary frame: a flag byte, then a MessagePack body that
+is zlib-deflated when the flag is 1. Inside the body:
+
+- ObjectId strings become their 12 raw bytes;
+- ISO timestamps become epoch milliseconds;
+- participant profiles are replaced by their ids, and each profile is sent
+  once per payload in a top-level ``users`` list.
+
+Compact sockets join their own variant of every room, so a room emit is
+encoded once per format whatever the number of receivers. Errors and acks
+stay JSON.
+"""
+import threading
+import zlib
+from datetime import datetime, timezone
+from bson import ObjectId
+from app.backpressure import OutboundGuard
+from app.config import config
+from app.sockets import socketio
+
+COMPACT = "compact"
+JSON = "json"
+
+ID_FIELDS = {
+    "_id", "discussion_id", "sender_id", "recipient_id", "message_id",
+    "last_read_message_id", "user_id",
+}
+ID_LIST_FIELDS = {"user_ids"}
+TIME_FIELDS = {
+    "timestamp", "last_message_timestamp", "last_message_at", "edited_at", "deleted_at",
+    "updated_at", "last_login",
+}
+
+FRAME_RAW = b"\x00"
+FRAME_DEFLATE = b"\x01"
+
+# sockets of this worker that speak the compact protocol
+_compact_sids = set()
+_lock = threading.Lock()
+
+
+def compact_available():
+    try:
+        import msgpack  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def negotiate(sid, requested):
+    """Record the protocol of a new socket; returns the one it will get."""
+    if requested == COMPACT and compact_available():
+        with _lock:
+            _compact_sids.add(sid)
+        return COMPACT
+    return JSON
+
+
+def forget(sid):
+    with _lock:
+        _compact_sids.discard(sid)
+
+
+def is_compact(sid):
+    return sid in _compact_sids
+
+
+def compact_room(room):
+    return f"{room}:compact"
+
+
+def room_for(sid, room):
+    """The variant of ``room`` the socket ``sid`` belongs in."""
+    return compact_room(room) if is_compact(sid) else room
+
+
+def _id_bytes(value):
+    return bytes.fromhex(value) if isinstance(value, str) and ObjectId.is_valid(value) else value
+
+
+def _epoch_ms(value):
+    if not isinstance(value, str) or not value:
+        return value
+    try:
+        moment = datetime.fromisoformat(value)
+    except ValueError:
+        return value
+    if moment.tzinfo is None:
+        # MongoDB hands back naive datetimes, which are UTC
+        moment = moment.replace(tzinfo=timezone.utc)
+    return int(moment.timestamp() * 1000)
+
+
+def _compact(value, users):
+    if isinstance(value, list):
+        return [_compact(item, users) for item in value]
+    if not isinstance(value, dict):
+        return value
+    result = {}
+    for key, item in value.items():
+        if key == "participants" and isinstance(item, list):
+            for profile in item:
+                if isinstance(profile, dict):
+                    users.setdefault(profile["_id"], profile)
+            result[key] = [_id_bytes(p["_id"] if isinstance(p, dict) else p) for p in item]
+        elif key in ID_FIELDS:
+            result[key] = _id_bytes(item)
+        elif key in ID_LIST_FIELDS and isinstance(item, list):
+            result[key] = [_id_bytes(uid) for uid in item]
+        elif key in TIME_FIELDS:
+            result[key] = _epoch_ms(item)
+        else:
+            result[key] = _compact(item, users)
+    return result
+
+
+def encode_compact(payload):
+    """One compact frame for a JSON-ready payload."""
+    import msgpack
+
+    users = {}
+    body = _compact(payload, users)
+    if users:
+        table = [_compact(profile, {}) for profile in users.values()]
+        body = {**body, "users": table} if isinstance(body, dict) else {"data": body, "users": table}
+    packed = msgpack.packb(body, use_bin_type=True)
+    if len(packed) >= config["compact_deflate_min_bytes"]:
+        return FRAME_DEFLATE + zlib.compress(packed, 6)
+    return FRAME_RAW + packed
+
+
+def reply(event, payload, sid):
+    """Emit ``payload`` to one socket in its negotiated format."""
+    socketio.emit(event, encode_compact(payload) if is_compact(sid) else payload, to=sid)
+
+
+def broadcast(event, payload, room, latest=False):
+    """Emit ``payload`` to a room, encoded once for each format.
+
+    ``latest`` marks state that the next emit of the event to the room
+    replaces, such as typing; sockets with a backlog get only the newest.
+    """
+    skip = outbound.hold(event, payload, (room, compact_room(room))) if latest else None
+    socketio.emit(event, payload, to=room, skip_sid=skip)
+    # with a message queue, compact sockets may live on another worker
+    if _compact_sids or config["socketio_message_queue"]:
+        socketio.emit(event, encode_compact(payload), to=compact_room(room), skip_sid=skip)
+
+
+# installed on the Socket.IO server by create_app
+outbound = OutboundGuard(config["socket_queue_soft_limit"], config["socket_queue_max"], reply)
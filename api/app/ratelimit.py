@@ -0,0 +1,130 @@
+import math
+import threading
+import time
+from app.metrics import metrics
+
+metrics.counter("diskuss_rate_limited_total", "Requests refused by a rate limit, by limit name.")
+
+
+class MemoryRateLimitStore:
+    """Fixed-window counters and token buckets for a single worker process."""
+
+    def __init__(self, maxsize=100000):
+        self.maxsize = maxsize
+        self._counts = {}
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def incr(self, key, window_id, ttl):
+        with self._lock:
+            count = self._counts.get(key)
+            count = count[1] + 1 if count and count[0] == window_id else 1
+            self._counts[key] = (window_id, count)
+            if len(self._counts) > self.maxsize:
+                # windows that have ended need no counter
+                self._counts = {k: v for k, v in self._counts.items() if v[0] == window_id}
+            return count
+
+    def take(self, key, rate, burst):
+        """Take a token from ``key``'s bucket; returns 0 or the seconds until one is free."""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated, _ = self._buckets.get(key, (burst, now, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            wait = 0.0 if tokens >= 1 else (1 - tokens) / rate
+            if not wait:
+                tokens -= 1
+            self._buckets[key] = (tokens, now, now + (burst - tokens) / rate)
+            if len(self._buckets) > self.maxsize:
+                # a bucket that has refilled is the same as no bucket
+                self._buckets = {k: v for k, v in self._buckets.items() if v[2] > now}
+            return wait
+
+
+# refill and take in one step so workers never race on a bucket
+_TAKE_SCRIPT = """
+local rate, burst = tonumber(ARGV[1]), tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(bucket[1]) or burst
+local updated = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - updated) * rate)
+local wait = 0
+if tokens >= 1 then tokens = tokens - 1 else wait = (1 - tokens) / rate end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return tostring(wait)
+"""
+
+
+class SharedRateLimitStore:
+    """Fixed-window counters and token buckets in redis, shared by every worker."""
+
+    def __init__(self, store, prefix="diskuss:ratelimit"):
+        self.store = store
+        self.prefix = prefix
+        self._take = store.register_script(_TAKE_SCRIPT)
+
+    def incr(self, key, window_id, ttl):
+        key = f"{self.prefix}:{key}:{window_id}"
+        pipe = self.store.pipeline()
+        pipe.incr(key)
+        pipe.expire(key, ttl)
+        return pipe.execute()[0]
+
+    def take(self, key, rate, burst):
+        return float(self._take(keys=[f"{self.prefix}:bucket:{key}"], args=[rate, burst]))
+
+
+class RateLimiter:
+    """Allows ``limit`` hits per key in each ``window`` seconds."""
+
+    def __init__(self, name, store, limit, window):
+        self.name = name
+        self.store = store
+        self.limit = limit
+        self.window = window
+
+    def hit(self, key):
+        """Count a hit; returns 0 if allowed, else the seconds until the window ends."""
+        if self.limit <= 0:
+            return 0
+        now = time.time()
+        window_id = int(now // self.window)
+        if self.store.incr(f"{self.name}:{key}", window_id, math.ceil(self.window)) <= self.limit:
+            return 0
+        metrics.inc("diskuss_rate_limited_total", limit=self.name)
+        return max(1, math.ceil((window_id + 1) * self.window - now))
+
+
+class TokenBucket:
+    """Allows bursts of ``burst`` hits per key, refilled at ``rate`` hits per second."""
+
+    def __init__(self, name, store, rate, burst):
+        self.name = name
+        self.store = store
+        self.rate = rate
+        self.burst = max(1, burst)
+
+    def take(self, key):
+        """Count a hit; returns 0 if allowed, else the seconds until the next one is."""
+        if self.rate <= 0:
+            return 0
+        wait = self.store.take(f"{self.name}:{key}", self.rate, self.burst)
+        if wait:
+            metrics.inc("diskuss_rate_limited_total", limit=self.name)
+        return wait
+
+
+def create_rate_limit_store(backend="memory", redis_url=None):
+    """Build the rate limit store selected in the config."""
+    if backend == "memory":
+        return MemoryRateLimitStore()
+    if backend == "redis":
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("The redis package is required for the redis rate limit backend.")
+        return SharedRateLimitStore(redis.Redis.from_url(redis_url))
+    raise ValueError(f"Unknown rate limit backend: {backend}")
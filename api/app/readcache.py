@@ -0,0 +1,219 @@
+import copy
+import threading
+from collections import OrderedDict
+from bson import json_util
+from app.cache import TTLCache
+from app.metrics import metrics
+
+metrics.counter("diskuss_read_cache_lookups_total", "Read cache lookups by kind and result (hit or miss).")
+
+
+class NullCacheBackend:
+    """Caches nothing; every lookup goes to MongoDB."""
+
+    def get(self, key):
+        return None
+
+    def set(self, key, value):
+        pass
+
+    def delete(self, *keys):
+        pass
+
+    def version(self, key):
+        return 0
+
+    def bump(self, key):
+        pass
+
+
+class MemoryCacheBackend:
+    """Bounded per-process cache. Only consistent when a single worker serves writes.
+
+    Versions are kept for at most ``max_versions`` keys, least recently used
+    first out. Bumps draw from one counter, and a key whose version was
+    evicted reads the counter's value at the latest eviction, so entries
+    stored under an evicted version are never served again.
+    """
+
+    def __init__(self, maxsize=10000, ttl=300.0, max_versions=None):
+        self.entries = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.max_versions = max_versions or maxsize
+        self._versions = OrderedDict()
+        self._clock = 0
+        self._floor = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        value = self.entries.get(key)
+        # callers serialize results in place, so never hand out the cached object
+        return copy.deepcopy(value) if value is not None else None
+
+    def set(self, key, value):
+        self.entries.set(key, copy.deepcopy(value))
+
+    def delete(self, *keys):
+        for key in keys:
+            self.entries.delete(key)
+
+    def version(self, key):
+        with self._lock:
+            version = self._versions.get(key)
+            if version is None:
+                return self._floor
+            self._versions.move_to_end(key)
+            return version
+
+    def bump(self, key):
+        with self._lock:
+            self._clock += 1
+            self._versions[key] = self._clock
+            self._versions.move_to_end(key)
+            if len(self._versions) > self.max_versions:
+                self._versions.popitem(last=False)
+                self._floor = self._clock
+
+
+class SharedCacheBackend:
+    """Cache in a Redis-compatible store, shared (and invalidated) across workers."""
+
+    def __init__(self, store, prefix="diskuss:cache", ttl=300):
+        self.store = store
+        self.prefix = prefix
+        self.ttl = int(ttl)
+        # a version outlives every entry stored under it; once idle that long it reads as 0 again
+        self.version_ttl = self.ttl * 10
+
+    def _key(self, key):
+        return f"{self.prefix}:{key}"
+
+    def get(self, key):
+        raw = self.store.get(self._key(key))
+        return json_util.loads(raw) if raw is not None else None
+
+    def set(self, key, value):
+        self.store.set(self._key(key), json_util.dumps(value), ex=self.ttl)
+
+    def delete(self, *keys):
+        if keys:
+            self.store.delete(*(self._key(key) for key in keys))
+
+    def version(self, key):
+        return int(self.store.get(self._key(f"version:{key}")) or 0)
+
+    def bump(self, key):
+        key = self._key(f"version:{key}")
+        pipe = self.store.pipeline()
+        pipe.incr(key)
+        pipe.expire(key, self.version_ttl)
+        pipe.execute()
+
+
+class ReadCache:
+    """Read-through cache for discussion metadata, profiles and inbox pages.
+
+    Discussion metadata (participants, is_group) never changes once created.
+    Everything else is stored under a version that the writes changing it
+    bump: a reader keeps the version it saw before querying MongoDB and stores
+    its result under that version, so a result that raced with a write is
+    never served afterwards.
+    """
+
+    def __init__(self, backend=None):
+        self.backend = backend or NullCacheBackend()
+        self.hits = {}
+        self.misses = {}
+        self._lock = threading.Lock()
+
+    def _get(self, kind, key):
+        value = self.backend.get(f"{kind}:{key}")
+        counts = self.misses if value is None else self.hits
+        with self._lock:
+            counts[kind] = counts.get(kind, 0) + 1
+        metrics.inc("diskuss_read_cache_lookups_total", kind=kind, result="miss" if value is None else "hit")
+        return value
+
+    def _get_versioned(self, kind, owner, suffix=""):
+        version = self.backend.version(f"{kind}:{owner}")
+        return self._get(kind, f"{owner}:{version}{suffix}"), version
+
+    def _set_versioned(self, kind, owner, version, value, suffix=""):
+        self.backend.set(f"{kind}:{owner}:{version}{suffix}", value)
+
+    def stats(self):
+        with self._lock:
+            all_hits, all_misses = dict(self.hits), dict(self.misses)
+        result = {}
+        for kind in set(all_hits) | set(all_misses):
+            hits, misses = all_hits.get(kind, 0), all_misses.get(kind, 0)
+            result[kind] = {"hits": hits, "misses": misses, "hit_rate": hits / (hits + misses)}
+        return result
+
+    # discussion metadata: {"participants": [...], "is_group": bool}
+    def get_discussion(self, discussion_id):
+        return self._get("discussion", discussion_id)
+
+    def set_discussion(self, discussion_id, meta):
+        self.backend.set(f"discussion:{discussion_id}", meta)
+
+    # sorted participant ids -> discussion id
+    def get_discussion_id(self, participants):
+        return self._get("participants", ",".join(participants))
+
+    def set_discussion_id(self, participants, discussion_id):
+        self.backend.set(f"participants:{','.join(participants)}", discussion_id)
+
+    # create_or_get_discussion payload, changes with every message
+    def get_summary(self, discussion_id):
+        return self._get_versioned("summary", discussion_id)
+
+    def set_summary(self, discussion_id, version, summary):
+        self._set_versioned("summary", discussion_id, version, summary)
+
+    def get_profiles(self, user_ids):
+        """Cached profiles by user id, the ids that missed, and the versions read."""
+        found, missing, versions = {}, [], {}
+        for user_id in user_ids:
+            profile, versions[user_id] = self._get_versioned("profile", user_id)
+            if profile is None:
+                missing.append(user_id)
+            else:
+                found[user_id] = profile
+        return found, missing, versions
+
+    def set_profile(self, user_id, version, profile):
+        self._set_versioned("profile", user_id, version, profile)
+
+    def get_inbox(self, user_id, limit, before):
+        return self._get_versioned("inbox", user_id, f":{limit}:{before or ''}")
+
+    def set_inbox(self, user_id, version, limit, before, page):
+        self._set_versioned("inbox", user_id, version, page, f":{limit}:{before or ''}")
+
+    def invalidate_profiles(self, user_ids):
+        for user_id in user_ids:
+            self.backend.bump(f"profile:{user_id}")
+
+    def invalidate_inboxes(self, user_ids):
+        for user_id in user_ids:
+            self.backend.bump(f"inbox:{user_id}")
+
+    def invalidate_discussion(self, discussion_id, participants):
+        """Forget everything derived from a discussion's messages."""
+        self.backend.bump(f"summary:{discussion_id}")
+        self.invalidate_inboxes(participants)
+
+
+def create_read_cache(backend="memory", maxsize=10000, ttl=300.0, redis_url=None):
+    """Build the read cache selected in the config."""
+    if backend == "none":
+        return ReadCache(NullCacheBackend())
+    if backend == "memory":
+        return ReadCache(MemoryCacheBackend(maxsize=maxsize, ttl=ttl))
+    if backend == "redis":
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("The redis package is required for the redis cache backend.")
+        return ReadCache(SharedCacheBackend(redis.Redis.from_url(redis_url), ttl=ttl))
+    raise ValueError(f"Unknown cache backend: {backend}")
@@ -1,57 +1,222 @@
-from flask import Blueprint, request, jsonify
+import math
+from functools import wraps
+from flask import Blueprint, Response, request, jsonify, stream_with_context
+from app.auth import retry_later
 from app.config import config
 from app.utils import token_required
-from app.user import user_handler
-from app.messages import message_handler
+from app.extensions import get_services, message_handler, user_handler
+from app.events import broadcast_new_messages, event_limits
+from app.fanout import add_members, publish_delete, publish_edit
+from app.serializers import USER_PROJECTION, serialize_user
+from app.transfer import BATCH_SIZE, export_records, json_array_chunks, ndjson_lines
 import json
 
 routes_bp = Blueprint('diskuss', __name__)
 
+def rate_limited(action):
+    """Answer 429 when the user is over their budget for ``action``; goes after token_required."""
+    def decorator(f):
+        @wraps(f)
+        def wrapped(*args, **kwargs):
+            bucket = event_limits.get(action)
+            retry_after = bucket.take(request.user["user_id"]) if bucket else 0
+            if retry_after:
+                return retry_later('Too many requests', 429, math.ceil(retry_after))
+            return f(*args, **kwargs)
+        return wrapped
+    return decorator
+
 @routes_bp.route('/me', methods=['GET'])
 @token_required
 def get_user():
     """Get user details."""
     user_id = request.user["user_id"]
-    status, user = user_handler.get_user(user_id)
+    status, user = user_handler.get_user(user_id, USER_PROJECTION)
     
     if not status:
         return jsonify({"message": "User not found"}), 404
     
-    user["_id"] = str(user["_id"])
-    del user["password"]
-    return jsonify({"message": "User retrieved successfully", "data": user}), 200
+    return jsonify({"message": "User retrieved successfully", "data": serialize_user(user)}), 200
 
 @routes_bp.route('/users', methods=['GET'])
 @token_required
+@rate_limited('search_users')
 def search_users():
     """Search for users by username."""
     # username in request query
     username = request.args.get("username")
     if not username:
         return jsonify({"message": "Username is required"}), 400
-    users = user_handler.get_users_by_username(username)
+    try:
+        limit = int(request.args.get("limit", 20))
+    except ValueError:
+        return jsonify({"message": "Invalid limit"}), 400
+    users = user_handler.get_users_by_username(
+        username,
+        limit,
+        substring=request.args.get("match") == "substring",
+    )
     return jsonify({"message": "Users retrieved successfully", "data": users}), 200
 
 @routes_bp.route('/discussions', methods=['GET'])
 @token_required
+@rate_limited('get_discussions')
 def get_discussions():
     """Get discussions for the user."""
     user_id = request.user["user_id"]
-    discussions = message_handler.get_discussions(user_id)
-    
-    return jsonify({"message": "Discussions retrieved successfully", "data": discussions}), 200
+    status, response = message_handler.get_discussions(
+        user_id, request.args.get("limit", 20), before=request.args.get("before")
+    )
+    if not status:
+        return jsonify(response), response.get("code", 400)
+    return jsonify(response), 200
+
+@routes_bp.route('/discussions/<discussion_id>/messages', methods=['GET'])
+@token_required
+@rate_limited('get_discussion_messages')
+def get_discussion_messages(discussion_id):
+    """Get a page of messages for a discussion."""
+    user_id = request.user["user_id"]
+    status, response = message_handler.get_discussion_messages(
+        discussion_id,
+        request.args.get("limit", 20),
+        before=request.args.get("before"),
+        after=request.args.get("after"),
+        user_id=user_id,
+    )
+    if not status:
+        return jsonify(response), response.get("code", 400)
+    return jsonify(response), 200
 
 @routes_bp.route('/discussions', methods=['POST'])
 @token_required
+@rate_limited('start_discussion')
 def create_or_get_discussion():
     """Create a new discussion or retrieve existing"""
     user_id = request.user["user_id"]
     data = json.loads(request.data) if request.data else {}
-    print(f"Data: {data}")
     if not data.get("participants"):
         return jsonify({"message": "Participants are required"}), 400
     
-    status, response = message_handler.create_or_get_discussion(user_id=user_id, participants=data["participants"])
+    status, response = message_handler.create_or_get_discussion(
+        user_id=user_id,
+        participants=data["participants"],
+        # the creator plus more than one other participant makes a group
+        is_group=bool(data.get("is_group")) or len(set(data["participants"]) - {user_id}) > 1,
+    )
     if not status:
         return jsonify(response), 400
+    if response.pop("created"):
+        add_members(response["data"]["_id"], response["data"]["participants"], user_handler.presence)
     return jsonify(response), 200
+
+@routes_bp.route('/messages/batch', methods=['POST'])
+@token_required
+@rate_limited('send_messages')
+def send_messages():
+    """Send many messages across one or more discussions."""
+    user_id = request.user["user_id"]
+    data = request.get_json(silent=True) or {}
+    status, response = message_handler.send_messages(user_id, data.get("messages"))
+    if not status:
+        return jsonify(response), response.get("code", 400)
+
+    broadcast_new_messages(response.pop("data"))
+    return jsonify(response), 200
+
+@routes_bp.route('/messages/<message_id>', methods=['PATCH'])
+@token_required
+@rate_limited('edit_message')
+def edit_message(message_id):
+    """Edit the text of one of the user's messages."""
+    data = request.get_json(silent=True) or {}
+    status, response = message_handler.update_message(message_id, data, user_id=request.user["user_id"])
+    if not status:
+        return jsonify(response), response.get("code", 400)
+
+    if "last_message" in response:
+        publish_edit(response["data"], response.pop("last_message"))
+    else:
+        publish_edit(response["data"])
+    return jsonify(response), 200
+
+@routes_bp.route('/messages/<message_id>', methods=['DELETE'])
+@token_required
+@rate_limited('delete_message')
+def delete_message(message_id):
+    """Delete one of the user's messages, leaving a tombstone."""
+    status, response = message_handler.delete_message(message_id, user_id=request.user["user_id"])
+    if not status:
+        return jsonify(response), response.get("code", 400)
+
+    if "last_message" in response:
+        publish_delete(response["data"], response.pop("last_message"))
+    else:
+        publish_delete(response["data"])
+    return jsonify(response), 200
+
+@routes_bp.route('/discussions/<discussion_id>/changes', methods=['GET'])
+@token_required
+@rate_limited('get_discussion_changes')
+def get_discussion_changes(discussion_id):
+    """Get messages edited or deleted since a cursor."""
+    status, response = message_handler.get_discussion_changes(
+        discussion_id,
+        since=request.args.get("since"),
+        limit=request.args.get("limit", 100),
+        user_id=request.user["user_id"],
+    )
+    if not status:
+        return jsonify(response), response.get("code", 400)
+    return jsonify(response), 200
+
+@routes_bp.route('/sync', methods=['GET'])
+@token_required
+@rate_limited('sync')
+def sync():
+    """Get the discussions and messages changed since a sync token."""
+    status, response = message_handler.sync(
+        request.user["user_id"],
+        since=request.args.get("since"),
+        limit=request.args.get("limit", 500),
+    )
+    if not status:
+        return jsonify(response), response.get("code", 400)
+    return jsonify(response), 200
+
+@routes_bp.route('/search', methods=['GET'])
+@token_required
+@rate_limited('search_messages')
+def search_messages():
+    """Search the user's messages, best match first."""
+    status, response = message_handler.search_messages(
+        request.user["user_id"],
+        request.args.get("q"),
+        discussion_id=request.args.get("discussion_id"),
+        limit=request.args.get("limit", 20),
+        cursor=request.args.get("cursor"),
+    )
+    if not status:
+        return jsonify(response), response.get("code", 400)
+    return jsonify(response), 200
+
+@routes_bp.route('/export', methods=['GET'])
+@token_required
+@rate_limited('export')
+def export_discussions():
+    """Stream the user's discussions and messages as NDJSON (default) or a JSON array."""
+    user_id = request.user["user_id"]
+    export_format = request.args.get("format", "ndjson")
+    if export_format not in ("ndjson", "json"):
+        return jsonify({"message": "Format must be ndjson or json"}), 400
+    try:
+        batch_size = max(1, min(int(request.args.get("batch_size", BATCH_SIZE)), BATCH_SIZE))
+        records = export_records(
+            get_services().db, user_id, resume=request.args.get("resume"), batch_size=batch_size
+        )
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
+
+    if export_format == "json":
+        return Response(stream_with_context(json_array_chunks(records)), mimetype="application/json")
+    return Response(stream_with_context(ndjson_lines(records)), mimetype="application/x-ndjson")
@@ -0,0 +1,226 @@
+"""Full-text search over message history.
+
+Two backends answer the same question: which messages of these discussions
+best match a query. Each returns ``(message_id, score)`` pairs, best first,
+and the message handler loads the documents.
+
+- ``mongo``: MongoDB's text index on ``messages.text``, ranked by textScore.
+  Maintained by MongoDB, so it is shared by every worker.
+- ``memory``: an inverted index in this process, ranked by BM25. Loaded from
+  the messages collection at startup and kept up to date by the message
+  handler, so it is only complete with a single worker.
+"""
+import heapq
+import logging
+import math
+import re
+import threading
+from array import array
+from pymongo import ASCENDING, DESCENDING, TEXT
+
+logger = logging.getLogger(__name__)
+
+_WORD = re.compile(r"\w+")
+STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have i if in is it its of on or so that the this to was we "
+    "were will with you".split()
+)
+SNIPPET_WIDTH = 160
+
+
+def query_terms(text):
+    """Lowercased words of ``text`` worth matching on."""
+    return [word for word in _WORD.findall(text.lower()) if word not in STOPWORDS]
+
+
+def _matches(word, terms):
+    # prefixes stand in for stemming: "message" highlights "messages"
+    return any(word.startswith(term) or (len(word) >= 3 and term.startswith(word)) for term in terms)
+
+
+def highlight(text, terms, width=SNIPPET_WIDTH):
+    """A window of ``text`` around the first match, and the [start, end) spans of matched words in it."""
+    spans = [m.span() for m in _WORD.finditer(text) if _matches(m.group().lower(), terms)]
+    if not spans:
+        return text[:width] + ("…" if len(text) > width else ""), []
+    start = max(0, min(spans[0][0] - width // 4, len(text) - width))
+    end = start + width
+    prefix = "…" if start else ""
+    suffix = "…" if end < len(text) else ""
+    shift = len(prefix) - start
+    highlights = [[s + shift, e + shift] for s, e in spans if s >= start and e <= end]
+    return prefix + text[start:end] + suffix, highlights
+
+
+class MongoTextSearch:
+    """Search served by a text index on messages.text."""
+
+    def __init__(self, messages, language="english"):
+        self.messages = messages
+        self.language = language
+
+    def ensure_indexes(self):
+        # discussion_id after the text key lets the index scan drop other discussions' matches
+        self.messages.create_index(
+            [("text", TEXT), ("discussion_id", ASCENDING)], default_language=self.language, name="message_text"
+        )
+
+    def add(self, message):
+        """MongoDB indexes stored messages itself."""
+
+    def remove(self, message_id, version):
+        """Deleted messages have no text left to index."""
+
+    def search(self, query, discussion_ids, skip, limit):
+        cursor = (
+            self.messages.find(
+                {"$text": {"$search": query}, "discussion_id": {"$in": discussion_ids}, "deleted": {"$ne": True}},
+                {"score": {"$meta": "textScore"}},
+            )
+            .sort([("score", {"$meta": "textScore"}), ("_id", DESCENDING)])
+            .skip(skip)
+            .limit(limit)
+        )
+        return [(message["_id"], message["score"]) for message in cursor]
+
+
+class MemorySearchIndex:
+    """BM25 inverted index of message text for a single worker.
+
+    Every indexed text gets a document number. Postings are arrays of
+    numbers and term counts per term, and per-number arrays hold the
+    discussion, length and version, so a million messages fit in a few
+    hundred MB. An edit indexes the new text under a new number; edited and
+    deleted texts keep their number with length 0 until the postings are
+    compacted. Versions decide between a message loaded at startup and the
+    same message sent, edited or deleted meanwhile.
+    """
+
+    k1 = 1.2
+    b = 0.75
+
+    def __init__(self, messages=None):
+        self.messages = messages
+        self._lock = threading.Lock()
+        self._numbers = {}  # message id -> document number
+        self._ids = []
+        self._discussions = array("I")
+        self._lengths = array("I")
+        self._versions = array("q")
+        self._discussion_numbers = {}
+        self._postings = {}  # term -> (document numbers, term counts)
+        self._live = 0
+        self._total_length = 0
+        self._dead_postings = 0
+
+    def ensure_indexes(self):
+        """Load the stored messages."""
+        if self.messages is None:
+            return
+        loaded = 0
+        for message in self.messages.find(
+            {"deleted": {"$ne": True}}, {"discussion_id": 1, "text": 1, "version": 1}
+        ).sort("_id", ASCENDING):
+            self.add(message)
+            loaded += 1
+        logger.info("Search index loaded %d messages", loaded)
+
+    def __len__(self):
+        return self._live
+
+    def add(self, message):
+        """Index a new or edited message; older versions than the one indexed are ignored."""
+        version = message.get("version") or 0
+        counts = {}
+        for term in query_terms(message.get("text") or ""):
+            counts[term] = counts.get(term, 0) + 1
+        with self._lock:
+            number = self._numbers.get(message["_id"])
+            if number is not None:
+                if self._versions[number] >= version:
+                    return
+                self._retire(number, version)
+            if not counts:
+                return
+            number = len(self._ids)
+            discussion = self._discussion_numbers.setdefault(
+                str(message["discussion_id"]), len(self._discussion_numbers)
+            )
+            length = sum(counts.values())
+            self._numbers[message["_id"]] = number
+            self._ids.append(message["_id"])
+            self._discussions.append(discussion)
+            self._lengths.append(length)
+            self._versions.append(version)
+            for term, count in counts.items():
+                postings = self._postings.get(term)
+                if postings is None:
+                    postings = self._postings[term] = (array("I"), array("I"))
+                postings[0].append(number)
+                postings[1].append(count)
+            self._live += 1
+            self._total_length += length
+
+    def remove(self, message_id, version):
+        """Drop a deleted message from the results."""
+        with self._lock:
+            number = self._numbers.get(message_id)
+            if number is not None and self._versions[number] <= version:
+                self._retire(number, version)
+
+    def _retire(self, number, version):
+        self._versions[number] = version
+        length = self._lengths[number]
+        if not length:
+            return
+        self._lengths[number] = 0
+        self._live -= 1
+        self._total_length -= length
+        self._dead_postings += length
+        if self._dead_postings > max(100000, self._total_length // 4):
+            self._compact()
+
+    def _compact(self):
+        lengths = self._lengths
+        for term, (numbers, counts) in list(self._postings.items()):
+            keep = [i for i, number in enumerate(numbers) if lengths[number]]
+            if not keep:
+                del self._postings[term]
+            elif len(keep) < len(numbers):
+                self._postings[term] = (array("I", (numbers[i] for i in keep)), array("I", (counts[i] for i in keep)))
+        self._dead_postings = 0
+
+    def search(self, query, discussion_ids, skip, limit):
+        terms = set(query_terms(query))
+        with self._lock:
+            allowed = {self._discussion_numbers[d] for d in discussion_ids if d in self._discussion_numbers}
+            if not terms or not allowed or not self._live:
+                return []
+            discussions, lengths = self._discussions, self._lengths
+            average = self._total_length / self._live
+            k1, b = self.k1, self.b
+            scores = {}
+            for term in terms:
+                postings = self._postings.get(term)
+                if postings is None:
+                    continue
+                numbers, counts = postings
+                idf = math.log(1 + (self._live - len(numbers) + 0.5) / (len(numbers) + 0.5))
+                for number, count in zip(numbers, counts):
+                    length = lengths[number]
+                    if not length or discussions[number] not in allowed:
+                        continue
+                    weight = idf * count * (k1 + 1) / (count + k1 * (1 - b + b * length / average))
+                    scores[number] = scores.get(number, 0.0) + weight
+            # best score first, then newest
+            best = heapq.nlargest(skip + limit, scores.items(), key=lambda item: (item[1], item[0]))
+            return [(self._ids[number], score) for number, score in best[skip:]]
+
+
+def create_search_index(backend, messages, language="english"):
+    """Build the search backend selected in the config."""
+    if backend == "mongo":
+        return MongoTextSearch(messages, language)
+    if backend == "memory":
+        return MemorySearchIndex(messages)
+    raise ValueError(f"Unknown search backend: {backend}")
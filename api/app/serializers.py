@@ -0,0 +1,145 @@
+"""MongoDB documents to JSON-ready dicts, and the JSON encoder they go out with.
+
+Each kind of document has a field plan, compiled once at import: the stored
+fields that may leave the server and how each is converted. Serializing is
+one pass over the plan into a new dict, so stored and cached documents are
+never mutated. Fields outside the plan, such as password hashes, username
+search keys and message id rings, never reach a client. The matching
+projections keep them in the database in the first place.
+
+``dumps`` and ``loads`` use orjson, and fall back to json with a warning
+when it is not installed.
+"""
+import json
+import logging
+from datetime import datetime
+from flask.json.provider import DefaultJSONProvider
+
+logger = logging.getLogger(__name__)
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+    logger.warning("orjson is not installed; responses and socket packets are encoded with json")
+
+_MISSING = object()
+
+
+def _str(value):
+    return str(value)
+
+
+def _iso(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def compile_plan(*fields):
+    """Build a serializer from ``(name, convert=None, default=_MISSING)`` field specs.
+
+    ``convert`` is skipped for None values. A field missing from the document
+    is left out, or set to ``default`` when one is given.
+    """
+    plan = tuple(spec + (None, _MISSING)[len(spec) - 1:] for spec in fields)
+
+    def serialize(doc):
+        out = {}
+        get = doc.get
+        for name, convert, default in plan:
+            value = get(name, _MISSING)
+            if value is _MISSING:
+                if default is not _MISSING:
+                    out[name] = default
+            elif convert is None or value is None:
+                out[name] = value
+            else:
+                out[name] = convert(value)
+        return out
+
+    serialize.projection = {name: 1 for name, _, _ in plan}
+    return serialize
+
+
+serialize_message = compile_plan(
+    ("_id", _str),
+    ("discussion_id", _str),
+    ("sender_id", _str),
+    # group messages have no single recipient
+    ("recipient_id", lambda value: str(value) if value else None, None),
+    ("text",),
+    ("timestamp", _iso),
+    ("seq",),
+    ("version",),
+    ("edited_at", _iso),
+    ("deleted",),
+    ("deleted_at", _iso),
+    ("updated_at", _iso),
+)
+MESSAGE_PROJECTION = serialize_message.projection
+
+serialize_discussion = compile_plan(
+    ("_id", _str),
+    ("participants",),
+    ("is_group", None, False),
+    ("last_message", serialize_message, None),
+    ("last_message_at", _iso),
+)
+# discussion fields clients need; never pulls the message id ring over the wire
+DISCUSSION_PROJECTION = {name: 1 for name in serialize_discussion.projection if name != "_id"}
+
+serialize_user = compile_plan(
+    ("_id", _str),
+    ("username",),
+    ("last_login", _iso, ""),
+)
+USER_PROJECTION = {"username": 1, "last_login": 1}
+
+
+def serialize_profile(user_id, profile):
+    """A participant as shown in inbox entries; unknown users keep their id only."""
+    last_login = profile.get("last_login")
+    return {
+        "_id": user_id,
+        "username": profile.get("username", ""),
+        "last_login": _iso(last_login) if last_login else "",
+    }
+
+
+if orjson is not None:
+    _ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS
+
+    def dumps(obj, **kwargs):
+        return orjson.dumps(obj, option=_ORJSON_OPTIONS).decode("utf-8")
+
+    def loads(s, **kwargs):
+        return orjson.loads(s)
+else:
+    def dumps(obj, **kwargs):
+        return json.dumps(obj, separators=(",", ":"))
+
+    def loads(s, **kwargs):
+        return json.loads(s)
+
+
+class SocketJSON:
+    """The json module Socket.IO encodes packets with."""
+
+    dumps = staticmethod(dumps)
+    loads = staticmethod(loads)
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask's JSON provider, encoding with orjson when it is installed."""
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None or kwargs.get("indent"):
+            return super().dumps(obj, **kwargs)
+        options = orjson.OPT_NON_STR_KEYS
+        if kwargs.get("sort_keys", self.sort_keys):
+            options |= orjson.OPT_SORT_KEYS
+        return orjson.dumps(obj, default=self.default, option=options).decode("utf-8")
+
+    def loads(self, s, **kwargs):
+        if orjson is None:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
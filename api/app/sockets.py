@@ -1,3 +1,4 @@
 from flask_socketio import SocketIO
+from app.serializers import SocketJSON
 
-socketio = SocketIO(cors_allowed_origins="*")
\ No newline at end of file
+socketio = SocketIO(cors_allowed_origins="*", json=SocketJSON)
\ No newline at end of file
@@ -0,0 +1,275 @@
+"""Streaming export and import of discussions and their messages.
+
+An export is a sequence of records, one JSON object each, in MongoDB
+extended JSON so ids and dates survive the round trip:
+
+    {"type": "discussion", "data": {...}}
+    {"type": "message", "data": {...}}      # the discussion's messages, oldest first
+    {"type": "checkpoint", "resume": "..."}
+    {"type": "end", "discussions": 2, "messages": 120}
+
+Everything is read through MongoDB cursors in batches, so memory stays flat
+however long the histories are. Passing a checkpoint's ``resume`` token to
+a new export continues right after the last record written before it, and
+repeats that discussion's header. An export for one user carries only that
+user's read cursor.
+
+Imports merge into discussions by participant set and renumber messages
+after the target's own, so replaying an overlap after a resume is harmless.
+"""
+import base64
+from bson import ObjectId, json_util
+from pymongo import ASCENDING, UpdateOne
+from pymongo.errors import BulkWriteError
+from app.messages import later_read, participants_key, reserve_numbers
+from app.utils import encode_cursor, decode_cursor
+
+BATCH_SIZE = 1000
+
+# the id ring and the sync change log are derived data, rebuilt by the importing side
+EXPORT_DISCUSSION_PROJECTION = {"messages": 0, "changes": 0}
+# discussion fields numbered, or kept up to date, by the importing database
+IMPORT_DERIVED_FIELDS = ("messages", "changes", "reads", "version", "message_seq", "last_message")
+DUPLICATE_KEY = 11000
+
+
+def encode_resume_token(discussion_id, timestamp=None, message_id=None):
+    """Position after the discussion header and, optionally, one of its messages."""
+    cursor = encode_cursor(timestamp, message_id) if message_id else ""
+    raw = f"{discussion_id}|{cursor}"
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('utf-8')
+
+
+def decode_resume_token(token):
+    """Decode a resume token into (discussion ObjectId, (timestamp, ObjectId) or None)."""
+    try:
+        raw = base64.urlsafe_b64decode(token.encode('utf-8')).decode('utf-8')
+        discussion_id, cursor = raw.split("|", 1)
+        return ObjectId(discussion_id), decode_cursor(cursor) if cursor else None
+    except Exception:
+        raise ValueError("Invalid resume token")
+
+
+def export_records(db, user_id=None, resume=None, batch_size=BATCH_SIZE):
+    """Yield export records, optionally only the discussions ``user_id`` takes part in.
+
+    A checkpoint is emitted every ``batch_size`` records and at the end.
+    Raises ValueError for an invalid ``resume`` token before yielding anything.
+    """
+    position = decode_resume_token(resume) if resume else None
+    return _export(db, user_id, position, batch_size)
+
+
+def _export(db, user_id, position, batch_size):
+    query = {"participants": str(user_id)} if user_id else {}
+    counts = {"discussions": 0, "messages": 0}
+    since_checkpoint = 0
+    last = None
+
+    def discussions():
+        rest = query
+        if position:
+            # finish the discussion the previous export stopped in
+            discussion = db.discussions.find_one({**query, "_id": position[0]}, EXPORT_DISCUSSION_PROJECTION)
+            if discussion:
+                yield discussion, position[1]
+            rest = {**query, "_id": {"$gt": position[0]}}
+        cursor = (
+            db.discussions.find(rest, EXPORT_DISCUSSION_PROJECTION)
+            .sort("_id", ASCENDING)
+            .batch_size(batch_size)
+        )
+        for discussion in cursor:
+            yield discussion, None
+
+    for discussion, after in discussions():
+        discussion_id = discussion["_id"]
+        if user_id and "reads" in discussion:
+            # other participants' read positions are theirs alone
+            read = discussion["reads"].get(str(user_id))
+            discussion["reads"] = {str(user_id): read} if read else {}
+        # a resumed export repeats the header so the import knows where the messages go
+        counts["discussions"] += 1
+        since_checkpoint += 1
+        yield {"type": "discussion", "data": discussion}
+        last = (discussion_id, *(after or (None, None)))
+
+        message_query = {"discussion_id": str(discussion_id)}
+        if after:
+            timestamp, last_id = after
+            message_query["$or"] = [
+                {"timestamp": {"$gt": timestamp}},
+                {"timestamp": timestamp, "_id": {"$gt": last_id}},
+            ]
+        messages = (
+            db.messages.find(message_query)
+            .sort([("timestamp", ASCENDING), ("_id", ASCENDING)])
+            .batch_size(batch_size)
+        )
+        for message in messages:
+            counts["messages"] += 1
+            since_checkpoint += 1
+            yield {"type": "message", "data": message}
+            last = (discussion_id, message["timestamp"], message["_id"])
+            if since_checkpoint >= batch_size:
+                since_checkpoint = 0
+                yield {"type": "checkpoint", "resume": encode_resume_token(*last)}
+
+        if since_checkpoint >= batch_size:
+            since_checkpoint = 0
+            yield {"type": "checkpoint", "resume": encode_resume_token(*last)}
+
+    if last and since_checkpoint:
+        yield {"type": "checkpoint", "resume": encode_resume_token(*last)}
+    yield {"type": "end", **counts}
+
+
+def dumps_record(record):
+    return json_util.dumps(record, json_options=json_util.RELAXED_JSON_OPTIONS)
+
+
+def ndjson_lines(records):
+    """One record per line."""
+    for record in records:
+        yield dumps_record(record) + "\n"
+
+
+def json_array_chunks(records):
+    """The records as a single JSON array, one chunk per record."""
+    separator = "[\n"
+    for record in records:
+        yield separator + dumps_record(record)
+        separator = ",\n"
+    yield "\n]\n" if separator != "[\n" else "[]\n"
+
+
+def _skip_duplicates(error):
+    """Re-raise a bulk write error unless every failure is a key written meanwhile."""
+    if any(failure.get("code") != DUPLICATE_KEY for failure in error.details.get("writeErrors", [])):
+        raise error
+    return error.details.get("nInserted", 0)
+
+
+def import_records(db, lines, batch_size=BATCH_SIZE):
+    """Import NDJSON export lines with batched bulk writes.
+
+    A discussion is matched on its participant set, so one that already
+    exists takes the imported messages. Messages already stored (by
+    ``_id``) are skipped. The others are numbered after the target
+    discussion's own messages and changes, in export order, and the
+    newest becomes the summary when it is newer than the target's.
+    Read cursors follow their message once every message is in. Importing
+    the same lines twice writes nothing the second time.
+
+    Returns the number of discussions and messages written.
+    """
+    counts = {"discussions": 0, "messages": 0}
+    pending = {"discussions": [], "messages": []}
+    # exported discussion id -> id in this database
+    targets = {}
+    # (discussion id in this database, user id) -> exported read cursor
+    reads = {}
+
+    def flush_discussions():
+        batch = pending["discussions"]
+        if not batch:
+            return
+        keys, operations = {}, []
+        for doc in batch:
+            key = participants_key(doc["participants"])
+            keys.setdefault(key, []).append(doc)
+            fields = {name: value for name, value in doc.items() if name not in IMPORT_DERIVED_FIELDS}
+            fields.update(participants_key=key, last_message=None, version=1, message_seq=0)
+            operations.append(UpdateOne({"participants_key": key}, {"$setOnInsert": fields}, upsert=True))
+        try:
+            db.discussions.bulk_write(operations, ordered=False)
+        except BulkWriteError as e:
+            # a concurrent import created the discussion first
+            _skip_duplicates(e)
+        for found in db.discussions.find({"participants_key": {"$in": list(keys)}}, {"participants_key": 1}):
+            for doc in keys[found["participants_key"]]:
+                targets[doc["_id"]] = found["_id"]
+                for user_id, read in (doc.get("reads") or {}).items():
+                    key = (found["_id"], user_id)
+                    reads[key] = later_read(reads[key], read) if key in reads else read
+        counts["discussions"] += len(batch)
+        pending["discussions"] = []
+
+    def flush_messages():
+        batch = pending["messages"]
+        if not batch:
+            return
+        stored = {m["_id"] for m in db.messages.find({"_id": {"$in": [m["_id"] for m in batch]}}, {"_id": 1})}
+        groups = {}
+        for message in batch:
+            if message["_id"] in stored:
+                continue
+            stored.add(message["_id"])
+            target = targets.get(ObjectId(message["discussion_id"]))
+            if target is None:
+                raise ValueError(f"Message {message['_id']} comes before its discussion")
+            groups.setdefault(target, []).append({**message, "discussion_id": str(target)})
+
+        documents = []
+        for target, group in groups.items():
+            latest = next((m for m in reversed(group) if not m.get("deleted")), None)
+            if latest:
+                # the summary is in place before the numbers below publish it
+                summary = {name: value for name, value in latest.items() if name not in ("version", "seq")}
+                db.discussions.update_one(
+                    {"_id": target, "$or": [{"last_message": None}, {"last_message_at": {"$lt": latest["timestamp"]}}]},
+                    {"$set": {"last_message": summary, "last_message_at": latest["timestamp"]}},
+                )
+            version, seq = reserve_numbers(db.discussions, target, group[-1]["_id"], len(group), len(group))
+            for message in group:
+                message["version"], message["seq"] = version, seq
+                version += 1
+                seq += 1
+            documents.extend(group)
+
+        if documents:
+            try:
+                counts["messages"] += len(db.messages.insert_many(documents, ordered=False).inserted_ids)
+            except BulkWriteError as e:
+                counts["messages"] += _skip_duplicates(e)
+        pending["messages"] = []
+
+    for line_number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json_util.loads(line)
+        except ValueError:
+            raise ValueError(f"Line {line_number} is not valid JSON")
+
+        kind = {"discussion": "discussions", "message": "messages"}.get(record.get("type"))
+        if kind is None:
+            continue
+        pending[kind].append(record["data"])
+        if len(pending[kind]) >= batch_size:
+            # discussions go first so every message knows where it goes
+            flush_discussions()
+            flush_messages()
+
+    flush_discussions()
+    flush_messages()
+
+    # read cursors point at messages by id; their seq is the one given here
+    cursors = list(reads.items())
+    for start in range(0, len(cursors), batch_size):
+        chunk = cursors[start:start + batch_size]
+        seqs = {
+            message["_id"]: message["seq"]
+            for message in db.messages.find({"_id": {"$in": [read["message_id"] for _, read in chunk]}}, {"seq": 1})
+        }
+        operations = [
+            UpdateOne(
+                {"_id": discussion_id},
+                {"$max": {f"reads.{user_id}": {"seq": seqs[read["message_id"]], "message_id": read["message_id"]}}},
+            )
+            for (discussion_id, user_id), read in chunk if read["message_id"] in seqs
+        ]
+        if operations:
+            db.discussions.bulk_write(operations, ordered=False)
+    return counts
@@ -1,55 +1,124 @@
+import re
 from bson import ObjectId
 from datetime import datetime, timezone
+from pymongo import ASCENDING
 from app.config import config
+from app.presence import create_presence_registry
+from app.writebehind import WriteBehindQueue
+from app.cache import TTLCache
+
+MAX_SEARCH_RESULTS = 50
+SEARCH_PROJECTION = {"username": 1}
+
+
+def username_trigrams(username):
+    """Distinct lowercase trigrams of a username, used for substring search."""
+    name = username.lower()
+    return sorted({name[i:i + 3] for i in range(len(name) - 2)})
+
+
+def search_fields(username):
+    """Normalized fields stored on each user to serve username search from indexes."""
+    return {"username_lower": username.lower(), "username_trigrams": username_trigrams(username)}
+
 
 class UserHandler:
-    def __init__(self, db):
+    def __init__(self, db, presence=None):
         self.users = db.users
-        self.connected_users = []
+        self.presence = presence or create_presence_registry(
+            config["presence_backend"], config["redis_url"], config["presence_ttl"]
+        )
+        self.pending_updates = WriteBehindQueue(
+            db.users,
+            flush_interval=config["write_behind_flush_interval"],
+            max_pending=config["write_behind_max_pending"],
+        )
+        self.profile_cache = TTLCache(maxsize=config["user_cache_size"], ttl=config["user_cache_ttl"])
+        self.search_cache = TTLCache(maxsize=config["search_cache_size"], ttl=config["search_cache_ttl"])
+
+    def ensure_indexes(self):
+        """Create the indexes the user queries rely on."""
+        # anchored prefix search
+        self.users.create_index([("username_lower", ASCENDING)])
+        # substring search through precomputed trigrams (multikey)
+        self.users.create_index([("username_trigrams", ASCENDING)])
+
+    def create_user(self, username, password_hash):
+        user = {"username": username, "password": password_hash, **search_fields(username)}
+        result = self.users.insert_one(user)
+        # a cached search result may now be missing this user
+        self.search_cache.clear()
+        return result.inserted_id
     
-    def get_user(self, user_id):
-        user = self.users.find_one({"_id": ObjectId(user_id)})
+    def set_password(self, user_id, password_hash):
+        self.users.update_one({"_id": ObjectId(user_id)}, {"$set": {"password": password_hash}})
+
+    def get_user(self, user_id, projection=None):
+        user = self.users.find_one({"_id": ObjectId(user_id)}, projection)
         if user:
             return True, user
         else:
             return False, None
-    
-    def get_users_by_username(self, username):
-        users = self.users.find({"username": {"$regex": username, "$options": "i"}})
-        users = [user for user in users]
-        for user in users:
-            user["_id"] = str(user["_id"])
-            del user["password"]
-        return users
-        
-    def connect_user(self, user_id, socket_id):
-        # add to connected users with the user_id as key and socket_id as value in a dict
-        for user in self.connected_users:
-            if user.get(user_id):
-                user[user_id].append(socket_id)
-                break
-        else:
-            self.connected_users.append({user_id: [socket_id]})
 
-        self.users.update_one({"_id": ObjectId(user_id)}, {"$set": {"last_login": datetime.now(timezone.utc)}})
-        return self.connected_users
-    
-    def disconnect_user(self, socket_id):
-        # remove the socket_id from the connected users
-        for user in self.connected_users:
-            for user_id, socket_ids in user.items():
-                if socket_id in socket_ids:
-                    socket_ids.remove(socket_id)
-                    if not socket_ids:
-                        self.connected_users.remove(user)
+    def get_user_by_username(self, username):
+        return self.users.find_one({"username": username})
+
+    def get_user_profile(self, user_id):
+        """Cached public profile of a user.
+
+        The profile is only the username, which never changes once the user
+        exists, so entries are left to expire.
+        """
+        user_id = str(user_id)
+        profile = self.profile_cache.get(user_id)
+        if profile is None:
+            profile = self.users.find_one({"_id": ObjectId(user_id)}, {"username": 1})
+            if not profile:
+                return False, None
+            profile["_id"] = str(profile["_id"])
+            self.profile_cache.set(user_id, profile)
+        return True, dict(profile)
+
+    def get_users_by_username(self, username, limit=20, substring=False):
+        """Search users by username prefix, or by substring when ``substring`` is set.
+
+        Both modes are served from indexes on the normalized fields; substring
+        queries shorter than a trigram fall back to prefix matching.
+        """
+        term = username.strip().lower()
+        limit = max(1, min(int(limit), MAX_SEARCH_RESULTS))
+        substring = substring and len(term) >= 3
+        cache_key = (term, limit, substring)
+
+        users = self.search_cache.get(cache_key)
+        if users is None:
+            if substring:
+                query = {"username_trigrams": {"$all": username_trigrams(term)}}
+            else:
+                query = {"username_lower": {"$regex": f"^{re.escape(term)}"}}
+
+            cursor = self.users.find(query, SEARCH_PROJECTION).sort("username_lower", ASCENDING)
+            if not substring:
+                cursor = cursor.limit(limit)
+            users = []
+            for user in cursor:
+                # trigrams can match names that only share the pieces, so confirm
+                if substring and term not in user["username"].lower():
+                    continue
+                users.append({"_id": str(user["_id"]), "username": user["username"]})
+                if len(users) >= limit:
                     break
-        return self.connected_users
-    
-    def get_user_socket_ids(self, user_id):
-        for user in self.connected_users:
-            if user.get(user_id):
-                return user[user_id]
-        return []
+            self.search_cache.set(cache_key, users)
+        return [dict(user) for user in users]
 
+    def connect_user(self, user_id, socket_id, protocol=None):
+        self.presence.connect(user_id, socket_id, protocol)
+        self.touch_last_login(user_id)
 
-user_handler = UserHandler(config['db'])
\ No newline at end of file
+    def touch_last_login(self, user_id):
+        """Record a login without blocking; repeated logins are coalesced per user."""
+        self.pending_updates.set_fields(ObjectId(user_id), {"last_login": datetime.now(timezone.utc)})
+
+    def disconnect_user(self, socket_id):
+        """Remove the socket from the registry and return its user id."""
+        return self.presence.disconnect(socket_id)
\ No newline at end of file
@@ -1,16 +1,36 @@
 import jwt
+import json
+import time
+import zlib
+import base64
+import hashlib
 from functools import wraps
+from datetime import datetime
 from bson import ObjectId
 from flask import request
 from app.config import config
+from app.cache import TTLCache
 
-def decode_jwt_token(token):
+# verified claims keyed by a hash of the token, so raw tokens are never kept
+token_cache = TTLCache(maxsize=config['jwt_cache_size'], ttl=config['jwt_cache_ttl'])
+
+def decode_jwt_token(token, use_cache=True):
     if not token:
         return None, 'No token provided'
-    
+
+    key = hashlib.sha256(token.encode('utf-8')).digest()
+    if use_cache:
+        claims = token_cache.get(key)
+        if claims is not None:
+            return dict(claims), None
+
     try:
         data = jwt.decode(token, config['secret_key'], algorithms=["HS256"])
-        return data, None
+        if use_cache:
+            # never serve the claims past the token's own expiry
+            ttl = data['exp'] - time.time() if 'exp' in data else None
+            token_cache.set(key, data, ttl=ttl)
+        return dict(data), None
     except jwt.ExpiredSignatureError:
         return None, 'Token has expired'
     except jwt.InvalidTokenError:
@@ -33,21 +53,33 @@ def token_required(f):
     
     return decorated
     
-def serialize_mongo_doc(doc):
-    for key, value in doc.items():
-        if isinstance(value, ObjectId):
-            doc[key] = str(value)
-        elif isinstance(value, list):
-            doc[key] = [str(item) if isinstance(item, ObjectId) else item for item in value]
-    return doc
-
-from datetime import datetime, timezone
-
-def serialize_datetime_fields(doc):
-    """Recursively convert all datetime fields in a dict to ISO 8601 strings."""
-    for k, v in doc.items():
-        if isinstance(v, datetime):
-            doc[k] = v.isoformat()
-        elif isinstance(v, dict):
-            serialize_datetime_fields(v)
-    return doc
+def encode_cursor(timestamp, object_id):
+    """Encode a (timestamp, _id) pair into an opaque pagination cursor."""
+    raw = f"{timestamp.isoformat()}|{object_id}"
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('utf-8')
+
+def decode_cursor(cursor):
+    """Decode a pagination cursor back into a (timestamp, ObjectId) pair."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode('utf-8')).decode('utf-8')
+        timestamp, object_id = raw.split("|", 1)
+        return datetime.fromisoformat(timestamp), ObjectId(object_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+def encode_sync_token(versions):
+    """Encode {discussion id: version} into an opaque sync token."""
+    raw = json.dumps(versions, separators=(",", ":"), sort_keys=True).encode('utf-8')
+    return base64.urlsafe_b64encode(zlib.compress(raw)).decode('utf-8')
+
+def decode_sync_token(token):
+    """Decode a sync token back into {discussion id: version}."""
+    try:
+        versions = json.loads(zlib.decompress(base64.urlsafe_b64decode(token.encode('utf-8'))))
+    except Exception:
+        raise ValueError("Invalid token")
+    if not isinstance(versions, dict) or not all(
+        isinstance(version, int) and not isinstance(version, bool) for version in versions.values()
+    ):
+        raise ValueError("Invalid token")
+    return versions
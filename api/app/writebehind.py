@@ -0,0 +1,136 @@
+import atexit
+import logging
+import threading
+import time
+from pymongo import UpdateOne
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBehindQueue:
+    """Buffers non-critical field updates and flushes them in the background.
+
+    Updates for the same document are coalesced, so a user reconnecting a
+    hundred times between flushes costs a single write. Pending updates are
+    flushed every ``flush_interval`` seconds, as soon as ``max_pending``
+    documents are waiting, and once more on shutdown. ``on_flush`` is called
+    with the updates written, a dict of fields by document id, e.g. to
+    invalidate caches of them.
+
+    Fields are written with ``operator`` ($set by default). When a field is
+    queued twice before a flush, ``combine(old, new)`` picks the value kept;
+    by default the newest wins.
+    """
+
+    def __init__(self, collection, flush_interval=1.0, max_pending=500, on_flush=None,
+                 operator="$set", combine=None):
+        self.collection = collection
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.on_flush = on_flush
+        self.operator = operator
+        self.combine = combine
+
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+        self.flush_count = 0
+        self.flushed_updates = 0
+        self.failed_flushes = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+
+    def set_fields(self, doc_id, fields):
+        """Queue an update of ``fields`` on the document with ``doc_id``."""
+        with self._lock:
+            self._merge(self._pending.setdefault(doc_id, {}), fields)
+            depth = len(self._pending)
+        self._ensure_started()
+        if depth >= self.max_pending:
+            self._wakeup.set()
+
+    def _merge(self, pending, fields):
+        if self.combine is None:
+            pending.update(fields)
+            return
+        for key, value in fields.items():
+            pending[key] = self.combine(pending[key], value) if key in pending else value
+
+    def depth(self):
+        with self._lock:
+            return len(self._pending)
+
+    def metrics(self):
+        return {
+            "depth": self.depth(),
+            "flush_count": self.flush_count,
+            "flushed_updates": self.flushed_updates,
+            "failed_flushes": self.failed_flushes,
+            "last_flush_ms": self.last_flush_ms,
+            "max_flush_ms": self.max_flush_ms,
+        }
+
+    def flush(self):
+        """Write every pending update with one unordered bulk_write."""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            if not pending:
+                return 0
+
+            start = time.perf_counter()
+            try:
+                self.collection.bulk_write(
+                    [UpdateOne({"_id": doc_id}, {self.operator: fields}) for doc_id, fields in pending.items()],
+                    ordered=False,
+                )
+            except Exception as e:
+                self.failed_flushes += 1
+                logger.exception("Error flushing write-behind queue: %s", e)
+                # put the batch back, merged with whatever arrived meanwhile
+                with self._lock:
+                    for doc_id, fields in pending.items():
+                        newer = self._pending.get(doc_id, {})
+                        self._pending[doc_id] = fields
+                        self._merge(fields, newer)
+                return 0
+
+            elapsed = (time.perf_counter() - start) * 1000
+            self.flush_count += 1
+            self.flushed_updates += len(pending)
+            self.last_flush_ms = elapsed
+            self.max_flush_ms = max(self.max_flush_ms, elapsed)
+            if self.on_flush is not None:
+                try:
+                    self.on_flush(pending)
+                except Exception as e:
+                    logger.exception("Error in write-behind flush callback: %s", e)
+            return len(pending)
+
+    def stop(self):
+        """Stop the background flusher and write whatever is still pending."""
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.flush_interval * 5)
+        self.flush()
+
+    def _ensure_started(self):
+        if self._thread is not None or self._stopped.is_set():
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+            self._thread.start()
+        atexit.register(self.stop)
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
@@ -0,0 +1,44 @@
+"""Per-event authentication overhead with and without the claims cache.
+
+Compares a full jwt.decode per event (the old socket_jwt_required path),
+decode_jwt_token served from the token cache, and the session check that
+socket_jwt_required does now that the token is verified once at connect.
+
+    python -m benchmarks.bench_auth
+"""
+import time
+
+import jwt
+
+from app.config import config
+from app.utils import decode_jwt_token, token_cache
+from benchmarks.common import measure, print_table
+
+EVENTS = 10_000
+
+
+def main():
+    token = jwt.encode(
+        {"user_id": "0" * 24, "username": "bench", "exp": time.time() + 3600},
+        config["secret_key"], algorithm="HS256",
+    )
+    session = {"user": {"user_id": "0" * 24}, "token_exp": time.time() + 3600}
+    token_cache.clear()
+
+    def session_check():
+        return session.get("user") and session["token_exp"] > time.time()
+
+    cases = [
+        ("jwt.decode per event", lambda: decode_jwt_token(token, use_cache=False)),
+        ("cached claims", lambda: decode_jwt_token(token)),
+        ("session check", session_check),
+    ]
+    rows = []
+    for name, fn in cases:
+        stats = measure(fn, repeat=EVENTS)
+        rows.append((name, f"{stats['mean'] * 1000:.2f}", f"{stats['p99'] * 1000:.2f}"))
+    print_table(["path", "mean us/event", "p99 us/event"], rows)
+
+
+if __name__ == "__main__":
+    main()
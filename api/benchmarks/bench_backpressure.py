@@ -0,0 +1,189 @@
+"""Event budgets and slow-consumer limits, checked end to end.
+
+Flood: one client sends get_discussion_messages as fast as it can while
+another sends get_discussions every 20 ms, with the event budgets on and
+off. Reports how many flood events were served and refused, and the other
+client's latency.
+
+Slow consumer: a socket connects over long-polling and then stops polling,
+so everything sent to it stays queued in the server. Its discussion gets a
+burst of messages past SOCKET_QUEUE_SOFT_LIMIT and a stream of typing
+updates, then a burst past SOCKET_QUEUE_MAX, with the limits on and off.
+Reports the peak queue, typing updates queued and whether the socket was
+dropped. Exits non-zero when a limit did not hold.
+
+    python -m benchmarks.bench_backpressure --mongo memory
+"""
+import argparse
+import json
+import sys
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import jwt
+
+from app import create_app, events, socketio
+from app.config import config
+from app.presence import discussion_room
+from app.protocol import broadcast, outbound
+from benchmarks.common import disable_rate_limits, print_table, summarize
+from benchmarks.suite import open_db
+
+
+def token_for(user_id):
+    expires = datetime.now(timezone.utc) + timedelta(hours=1)
+    return jwt.encode({"user_id": user_id, "exp": expires}, config["secret_key"], algorithm="HS256")
+
+
+def pair(services, name):
+    users = [str(services.user_handler.create_user(f"{name}_{i}", "not-a-real-hash")) for i in range(2)]
+    _, response = services.message_handler.create_or_get_discussion(users[0], {"recipient_id": users[1]})
+    return users, response["data"]["_id"]
+
+
+def flood(app, services, label, seconds, history):
+    users, discussion_id = pair(services, f"flood_{label}")
+    for i in range(history):
+        services.message_handler.send_message({"discussion_id": discussion_id, "sender_id": users[0], "text": f"m{i}"})
+    flooder = socketio.test_client(app, auth={"token": token_for(users[0])})
+    victim = socketio.test_client(app, auth={"token": token_for(users[1])})
+    flooder.get_received()
+    victim.get_received()
+
+    served, refused, latencies = 0, 0, []
+    stop = time.perf_counter() + seconds
+
+    def hammer():
+        nonlocal served, refused
+        while time.perf_counter() < stop:
+            flooder.emit("get_discussion_messages", {"discussion_id": discussion_id, "limit": 50})
+            for packet in flooder.get_received():
+                if packet["name"] == "error":
+                    refused += 1
+                else:
+                    served += 1
+
+    thread = threading.Thread(target=hammer)
+    thread.start()
+    while time.perf_counter() < stop:
+        start = time.perf_counter()
+        victim.emit("get_discussions", {}, callback=True)
+        latencies.append((time.perf_counter() - start) * 1000)
+        victim.get_received()
+        time.sleep(0.02)
+    thread.join()
+    flooder.disconnect()
+    victim.disconnect()
+    latency = summarize(latencies)
+    return (label, served, refused, f"{served / seconds:.0f}", f"{latency['p50']:.2f}", f"{latency['p99']:.2f}")
+
+
+def polling_socket(app, user_id):
+    """Connect over long-polling; returns the engine.io sid and an HTTP client to poll with."""
+    http = app.test_client()
+    handshake = http.get("/socket.io/?EIO=4&transport=polling").get_data(as_text=True)
+    sid = json.loads(handshake[1:])["sid"]
+    http.post(f"/socket.io/?EIO=4&transport=polling&sid={sid}", data="40" + json.dumps({"token": token_for(user_id)}))
+    # the namespace connect ack confirms the handler ran and joined the rooms
+    connected = http.get(f"/socket.io/?EIO=4&transport=polling&sid={sid}").get_data(as_text=True)
+    if not connected.startswith("40"):
+        raise RuntimeError(f"socket did not connect: {connected}")
+    return sid, http
+
+
+def poll(http, sid):
+    body = http.get(f"/socket.io/?EIO=4&transport=polling&sid={sid}").get_data(as_text=True)
+    return [json.loads(p[2:]) for p in body.split("\x1e") if p.startswith("42")]
+
+
+def slow_consumer(app, services, label, soft_limit, max_queued, typing_updates):
+    outbound.soft_limit, outbound.max_queued = soft_limit, max_queued
+    users, discussion_id = pair(services, f"slow_{label}")
+    sid, http = polling_socket(app, users[1])
+    room = discussion_room(discussion_id)
+    message = {"discussion_id": discussion_id, "sender_id": users[0], "text": "x" * 100}
+    sockets = socketio.server.eio.sockets
+    peak = 0
+
+    def send(count):
+        nonlocal peak
+        for _ in range(count):
+            broadcast("receive_message", message, room)
+            if sid in sockets:
+                peak = max(peak, sockets[sid].queue.qsize())
+
+    # past the soft limit, then a stream of typing state
+    send(soft_limit + 10)
+    for i in range(typing_updates):
+        broadcast("typing", {"discussion_id": discussion_id, "user_ids": [users[0]], "n": i}, room, latest=True)
+    queued_typing = sum(1 for event, _ in poll(http, sid) if event == "typing")
+    # the client caught up; the newest typing state follows
+    time.sleep(outbound.interval * 3)
+    caught_up = [payload["n"] for event, payload in poll(http, sid) if event == "typing"] if soft_limit else []
+
+    send(max_queued + 100 if max_queued else 2000)
+    time.sleep(0.1)
+    dropped = sid not in sockets
+    return {
+        "label": label, "peak": peak, "queued_typing": queued_typing,
+        "caught_up": caught_up, "dropped": dropped, "last_typing": typing_updates - 1,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mongo", choices=["memory", "local"], default="memory")
+    parser.add_argument("--seconds", type=float, default=3.0)
+    parser.add_argument("--history", type=int, default=200, help="messages in the flooded discussion")
+    parser.add_argument("--typing", type=int, default=500, help="typing updates sent to the slow socket")
+    args = parser.parse_args()
+
+    config["ensure_indexes"] = False
+    db = open_db(args.mongo)
+
+    # raw sockets first: test clients take over the server's send path
+    app = create_app(db)
+    services = app.extensions["diskuss"]
+    services.ensure_indexes()
+    soft_limit, max_queued = config["socket_queue_soft_limit"], config["socket_queue_max"]
+    slow = [
+        slow_consumer(app, services, "limits", soft_limit, max_queued, args.typing),
+        slow_consumer(app, services, "none", 0, 0, args.typing),
+    ]
+    outbound.soft_limit, outbound.max_queued = soft_limit, max_queued
+
+    app = create_app(db)
+    services = app.extensions["diskuss"]
+    rows = [flood(app, services, "budgets", args.seconds, args.history)]
+    disable_rate_limits()
+    rows.append(flood(app, services, "none", args.seconds, args.history))
+
+    print(f"flood: get_discussion_messages for {args.seconds:.0f}s from one client")
+    print_table(["limits", "served", "refused", "served/s", "other p50 ms", "other p99 ms"], rows)
+    print(f"\nslow consumer: soft limit {soft_limit}, max {max_queued} packets")
+    print_table(
+        ["limits", "peak queue", "typing queued", "typing after catch-up", "dropped"],
+        [(r["label"], r["peak"], r["queued_typing"], r["caught_up"], r["dropped"]) for r in slow],
+    )
+    if args.mongo == "local":
+        db.client.drop_database(db.name)
+
+    limited = slow[0]
+    failures = []
+    if limited["peak"] > max_queued:
+        failures.append(f"queue reached {limited['peak']} packets")
+    if not limited["dropped"]:
+        failures.append("slow socket was not dropped")
+    if limited["caught_up"] != [limited["last_typing"]]:
+        failures.append(f"caught-up socket got typing {limited['caught_up']}, not only the latest")
+    if rows[0][2] == 0:
+        failures.append("flood was never refused")
+    if failures:
+        print("\n" + "\n".join(failures))
+        sys.exit(1)
+    print("\nbudgets refused the flood, the slow socket stayed bounded and got the latest typing state")
+
+
+if __name__ == "__main__":
+    main()
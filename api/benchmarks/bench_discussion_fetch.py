@@ -0,0 +1,49 @@
+"""Discussion fetch latency against message count, with and without the embedded array.
+
+"before" is a discussion document carrying one id per message, read in full
+as send_message used to. "after" is the bounded document read with the
+projection the handlers now use. Needs a reachable MongoDB (MONGO_URI).
+
+    python -m benchmarks.bench_discussion_fetch
+"""
+from datetime import datetime, timezone
+
+from bson import ObjectId
+
+from app.serializers import DISCUSSION_PROJECTION
+from benchmarks.common import bench_db, measure, print_table
+
+MESSAGE_COUNTS = [0, 1_000, 10_000, 100_000]
+
+
+def main():
+    db = bench_db()
+    rows = []
+    for count in MESSAGE_COUNTS:
+        summary = {
+            "participants": [str(ObjectId()), str(ObjectId())],
+            "is_group": False,
+            "last_message": None,
+            "last_message_at": datetime.now(timezone.utc),
+        }
+        before_id = db.discussions.insert_one(
+            {**summary, "messages": [ObjectId() for _ in range(count)]}
+        ).inserted_id
+        after_id = db.discussions.insert_one(dict(summary)).inserted_id
+
+        before = measure(lambda: db.discussions.find_one({"_id": before_id}))
+        after = measure(lambda: db.discussions.find_one({"_id": after_id}, DISCUSSION_PROJECTION))
+        rows.append((
+            count,
+            f"{before['p50']:.3f}", f"{before['p95']:.3f}",
+            f"{after['p50']:.3f}", f"{after['p95']:.3f}",
+        ))
+
+    print_table(
+        ["messages", "before p50 ms", "before p95 ms", "after p50 ms", "after p95 ms"], rows
+    )
+    db.client.drop_database(db.name)
+
+
+if __name__ == "__main__":
+    main()
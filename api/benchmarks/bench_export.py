@@ -0,0 +1,113 @@
+"""Export and import throughput and memory against history size.
+
+For each size, seeds one discussion with that many messages and then:
+
+- "materialized" loads the whole history into a list, as tooling walking
+  get_discussion_messages would;
+- "export" streams it through app.transfer to a discarding sink;
+- "import" replays the NDJSON export into an empty database.
+
+Peak memory is the Python allocation peak measured with tracemalloc. Use
+--mongo local: mongomock materializes every query itself, so its memory
+numbers say nothing about cursors.
+
+    python -m benchmarks.bench_export --mongo local
+"""
+import argparse
+import io
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+
+from bson import ObjectId
+
+from app.transfer import export_records, import_records, ndjson_lines
+from benchmarks.common import bench_db, print_table
+from benchmarks.suite import open_db
+
+HISTORY_SIZES = [1_000, 10_000, 100_000]
+SEED_BATCH = 5_000
+
+
+def seed(db, size):
+    sender, recipient = str(ObjectId()), str(ObjectId())
+    discussion_id = db.discussions.insert_one({
+        "participants": sorted([sender, recipient]),
+        "is_group": False,
+        "last_message": None,
+        "last_message_at": datetime.now(timezone.utc),
+    }).inserted_id
+    start = datetime.now(timezone.utc) - timedelta(seconds=size)
+    for offset in range(0, size, SEED_BATCH):
+        db.messages.insert_many([
+            {
+                "discussion_id": str(discussion_id),
+                "sender_id": sender,
+                "recipient_id": recipient,
+                "text": f"message number {i} with a little padding to look like chat",
+                "timestamp": start + timedelta(seconds=i),
+            }
+            for i in range(offset, min(offset + SEED_BATCH, size))
+        ])
+    return discussion_id
+
+
+def profile(fn):
+    """Run fn and return (result, seconds, peak MB of Python allocations)."""
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, peak / 1024 / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mongo", choices=["memory", "local"], default="local")
+    parser.add_argument("--sizes", type=int, nargs="+", default=HISTORY_SIZES)
+    args = parser.parse_args()
+
+    rows = []
+    for size in args.sizes:
+        db = open_db(args.mongo)
+        discussion_id = seed(db, size)
+
+        _, materialized_s, materialized_mb = profile(
+            lambda: list(db.messages.find({"discussion_id": str(discussion_id)}).sort("timestamp", 1))
+        )
+
+        sink = io.StringIO()
+
+        def export():
+            # drop each line so the sink does not grow with the history
+            for line in ndjson_lines(export_records(db)):
+                sink.write(line)
+                sink.seek(0)
+                sink.truncate()
+        _, export_s, export_mb = profile(export)
+
+        lines = list(ndjson_lines(export_records(db)))
+        target = open_db(args.mongo) if args.mongo == "memory" else bench_db("diskuss_bench_import")
+        counts, import_s, _ = profile(lambda: import_records(target, iter(lines)))
+        assert counts["messages"] == size, counts
+
+        rows.append((
+            size,
+            f"{materialized_mb:.1f}", f"{materialized_s:.2f}",
+            f"{export_mb:.1f}", f"{size / export_s:,.0f}",
+            f"{size / import_s:,.0f}",
+        ))
+        if args.mongo == "local":
+            db.client.drop_database(db.name)
+            db.client.drop_database(target.name)
+
+    print_table(
+        ["messages", "materialized MB", "materialized s", "export MB", "export msg/s", "import msg/s"],
+        rows,
+    )
+
+
+if __name__ == "__main__":
+    main()
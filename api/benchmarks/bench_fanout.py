@@ -0,0 +1,111 @@
+"""Group message fan-out cost against group size.
+
+For groups of 10, 100 and 1000 members, each with one connected Socket.IO
+test client, compares:
+
+- "per member": the old delivery, a receive_message and a discussion_updated
+  emit to every socket of every member, encoded once per socket;
+- "room": app.fanout.publish_message, one emit to the discussion room plus
+  a batched inbox delta;
+- "send_message": the whole event, from the sender's emit to its ack.
+
+Also checks that every member receives each message exactly once.
+
+    python -m benchmarks.bench_fanout --mongo memory
+"""
+import argparse
+import sys
+from datetime import datetime, timedelta, timezone
+
+import jwt
+
+from app import create_app, socketio
+from app.config import config
+from app.fanout import publish_message
+from benchmarks.common import disable_rate_limits, measure, print_table
+from benchmarks.suite import open_db
+
+GROUP_SIZES = [10, 100, 1000]
+
+
+def token_for(user_id):
+    expires = datetime.now(timezone.utc) + timedelta(hours=1)
+    return jwt.encode({"user_id": user_id, "exp": expires}, config["secret_key"], algorithm="HS256")
+
+
+def drain(clients):
+    return [client.get_received() for client in clients]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mongo", choices=["memory", "local"], default="memory")
+    parser.add_argument("--sizes", type=int, nargs="+", default=GROUP_SIZES)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    config["ensure_indexes"] = False
+    app = create_app(open_db(args.mongo))
+    services = app.extensions["diskuss"]
+    services.ensure_indexes()
+    disable_rate_limits()
+
+    rows, failures = [], []
+    for size in args.sizes:
+        members = [
+            str(services.user_handler.create_user(f"fanout_{size}_{i}", "not-a-real-hash"))
+            for i in range(size)
+        ]
+        _, response = services.message_handler.create_or_get_discussion(
+            members[0], participants=members[1:], is_group=True
+        )
+        discussion_id = response["data"]["_id"]
+        clients = [socketio.test_client(app, auth={"token": token_for(member)}) for member in members]
+        drain(clients)
+
+        _, sent = services.message_handler.send_message(
+            {"discussion_id": discussion_id, "sender_id": members[0], "text": "hello group"}
+        )
+        message = sent["data"]
+        update = {"discussion_id": discussion_id, "last_message": message, "last_message_timestamp": message["timestamp"]}
+
+        def per_member():
+            for member in members:
+                for sid in services.user_handler.presence.get_socket_ids(member):
+                    socketio.emit("receive_message", message, to=sid)
+                    socketio.emit("discussion_updated", update, to=sid)
+
+        legacy = measure(per_member, args.repeat)
+        drain(clients)
+        room = measure(lambda: publish_message(message), args.repeat)
+        drain(clients)
+
+        sender = clients[0]
+        event = measure(
+            lambda: sender.emit("send_message", {"discussion_id": discussion_id, "text": "hi"}, callback=True),
+            args.repeat,
+        )
+        received = drain(clients)
+        counts = {sum(1 for packet in packets if packet["name"] == "receive_message") for packets in received}
+        if counts != {args.repeat}:
+            failures.append(f"{size} members: receive_message counts {sorted(counts)}, expected {args.repeat}")
+
+        rows.append((
+            size,
+            f"{legacy['p50']:.3f}", f"{room['p50']:.3f}",
+            f"{event['p50']:.3f}", f"{event['p95']:.3f}",
+        ))
+        for client in clients:
+            client.disconnect()
+
+    print_table(
+        ["members", "per member p50 ms", "room p50 ms", "send_message p50 ms", "send_message p95 ms"],
+        rows,
+    )
+    if failures:
+        print("\n" + "\n".join(failures))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""Socket event latency during a burst of logins.
+
+One connected Socket.IO client sends get_discussions every 10 ms while a
+burst of concurrent POST /api/auth/login requests is served, twice:
+
+- "inline": bcrypt on the request's own thread, as before the hashing pool;
+- "pool": app.passwords.PasswordHasher on its bounded pool of OS threads.
+
+An event's latency runs from when it was due to when its reply came back,
+so time spent waiting for a blocked event loop counts. The difference shows
+under eventlet, where an inline hash stalls every green thread:
+
+    ASYNC_MODE=eventlet python -m benchmarks.bench_logins --mongo memory
+    python -m benchmarks.bench_logins --mongo memory          # threading
+"""
+import os
+
+async_mode = os.getenv("ASYNC_MODE", "threading")
+if async_mode == "eventlet":
+    import eventlet
+    eventlet.monkey_patch()
+elif async_mode == "gevent":
+    from gevent import monkey
+    monkey.patch_all()
+os.environ["ASYNC_MODE"] = async_mode
+
+import argparse
+import time
+from datetime import datetime, timedelta, timezone
+
+import bcrypt
+import jwt
+
+from app import auth, create_app, socketio
+from app.config import config
+from benchmarks.common import disable_rate_limits, print_table, summarize
+from benchmarks.suite import open_db
+
+
+def token_for(user_id):
+    expires = datetime.now(timezone.utc) + timedelta(hours=1)
+    return jwt.encode({"user_id": user_id, "exp": expires}, config["secret_key"], algorithm="HS256")
+
+
+def run(app, users, logins, interval):
+    """Serve ``logins`` logins at once; returns event latencies and login latencies in ms."""
+    client = socketio.test_client(app, auth={"token": token_for(users[0][0])})
+    client.get_received()
+    http = app.test_client()
+    login_ms, done = [], []
+
+    def login(username):
+        start = time.perf_counter()
+        response = http.post("/api/auth/login", json={"username": username, "password": "password"})
+        login_ms.append((time.perf_counter() - start) * 1000)
+        done.append(response.status_code)
+
+    for i in range(logins):
+        socketio.start_background_task(login, users[i % len(users)][1])
+
+    event_ms = []
+    while len(done) < logins:
+        due = time.perf_counter() + interval
+        socketio.sleep(interval)
+        client.emit("get_discussions", {}, callback=True)
+        event_ms.append((time.perf_counter() - due) * 1000)
+        client.get_received()
+    client.disconnect()
+    return event_ms, login_ms, done
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mongo", choices=["memory", "local"], default="memory")
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--logins", type=int, default=30)
+    parser.add_argument("--rounds", type=int, default=config["bcrypt_rounds"])
+    parser.add_argument("--interval", type=float, default=0.01, help="seconds between socket events")
+    args = parser.parse_args()
+
+    config["ensure_indexes"] = False
+    app = create_app(open_db(args.mongo))
+    services = app.extensions["diskuss"]
+    services.ensure_indexes()
+    disable_rate_limits()
+    password_hash = bcrypt.hashpw(b"password", bcrypt.gensalt(rounds=args.rounds)).decode("utf-8")
+    users = [
+        (str(services.user_handler.create_user(f"login_{i}", password_hash)), f"login_{i}")
+        for i in range(args.users)
+    ]
+    auth.hasher.rounds = args.rounds
+    # the burst comes from one address; the limits are not what is measured here
+    auth.login_ip_limit.limit = auth.login_username_limit.limit = 0
+
+    pooled = auth.hasher._run
+    rows, statuses = [], set()
+    for label in ("inline", "pool"):
+        auth.hasher._run = (lambda fn, *fn_args: fn(*fn_args)) if label == "inline" else pooled
+        event_ms, login_ms, done = run(app, users, args.logins, args.interval)
+        statuses.update(done)
+        events, logins = summarize(event_ms), summarize(login_ms)
+        rows.append((
+            label, events["count"], f"{events['p50']:.2f}", f"{events['p99']:.2f}",
+            f"{max(event_ms):.2f}", f"{logins['p50']:.1f}", f"{logins['p99']:.1f}",
+        ))
+    auth.hasher._run = pooled
+
+    print(f"async_mode={socketio.async_mode} rounds={args.rounds} logins={args.logins} "
+          f"workers={auth.hasher.workers}")
+    print_table(
+        ["bcrypt", "events", "event p50 ms", "event p99 ms", "event max ms", "login p50 ms", "login p99 ms"],
+        rows,
+    )
+    print(f"\nlogin statuses: {sorted(statuses)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Bytes per event and encoding CPU: JSON against the compact protocol.
+
+Encodes real payloads of the busiest events, taken from seeded data, the way
+Socket.IO encodes JSON (compact separators) and with
+app.protocol.encode_compact. benchmarks.suite runs this after its load run
+and stores the table under "protocol"; standalone it seeds its own data:
+
+    python -m benchmarks.bench_protocol --mongo memory
+"""
+import argparse
+import json
+import time
+
+from app.protocol import encode_compact
+from app.utils import encode_sync_token
+from benchmarks.common import print_table
+
+
+def encode_json(payload):
+    return json.dumps(payload, separators=(",", ":")).encode("utf-8")
+
+
+def sample_payloads(message_handler, user_id, discussion_id):
+    """Payloads of the main events, as the handlers produce them for ``user_id``."""
+    _, inbox = message_handler.get_discussions(user_id, limit=20)
+    _, page = message_handler.get_discussion_messages(discussion_id, limit=20, user_id=user_id)
+    _, changes = message_handler.sync(user_id, encode_sync_token({}), limit=100)
+    message = page["data"][-1]
+    return {
+        "get_discussions": inbox,
+        "get_discussion_messages": page,
+        "sync": changes,
+        "receive_message": message,
+        "discussion_updated": {
+            "discussion_id": discussion_id, "last_message": message,
+            "last_message_timestamp": message["timestamp"],
+        },
+    }
+
+
+def measure_protocol(payloads, repeat=200):
+    """Size and encoding time of each payload in both formats."""
+    results = {}
+    for event, payload in payloads.items():
+        row = {}
+        for name, encode in (("json", encode_json), ("compact", encode_compact)):
+            start = time.perf_counter()
+            for _ in range(repeat):
+                frame = encode(payload)
+            row[f"{name}_bytes"] = len(frame)
+            row[f"{name}_us"] = (time.perf_counter() - start) / repeat * 1e6
+        results[event] = row
+    return results
+
+
+def print_protocol(results):
+    print_table(
+        ["event", "json bytes", "compact bytes", "ratio", "json us", "compact us"],
+        [
+            (event, r["json_bytes"], r["compact_bytes"], f"{r['compact_bytes'] / r['json_bytes']:.2f}",
+             f"{r['json_us']:.1f}", f"{r['compact_us']:.1f}")
+            for event, r in results.items()
+        ],
+    )
+
+
+def main():
+    from app import create_app
+    from app.config import config
+    from benchmarks.suite import open_db, seed
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mongo", choices=["memory", "local"], default="memory")
+    parser.add_argument("--users", type=int, default=30)
+    parser.add_argument("--discussions-per-user", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    config["ensure_indexes"] = False
+    app = create_app(open_db(args.mongo))
+    services = app.extensions["diskuss"]
+    services.ensure_indexes()
+    user_ids, discussions = seed(services, args.users, args.discussions_per_user)
+    discussion_id, members = next(iter(discussions.items()))
+    payloads = sample_payloads(services.message_handler, members[0], discussion_id)
+    print_protocol(measure_protocol(payloads, args.repeat))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""Read cache hit rate, latency and staleness check.
+
+Seeds users and discussions, then compares get_discussions and
+create_or_get_discussion through the cached handlers with an uncached
+MessageHandler on the same database:
+
+- latency of repeated inbox reads with and without the cache;
+- after every send, edit, delete, new discussion and last_login flush, every
+  affected inbox read through the cache must equal the uncached one;
+- readers hammer the cache while a writer sends messages, and once the
+  writer stops every inbox must again match the database.
+
+Exits non-zero if a stale inbox or discussion was served.
+
+    python -m benchmarks.bench_read_cache --mongo memory
+    python -m benchmarks.bench_read_cache --mongo local
+"""
+import argparse
+import random
+import sys
+import threading
+
+from app.config import config
+from app.extensions import Services
+from app.messages import MessageHandler
+from benchmarks.common import measure, print_table
+from benchmarks.suite import open_db
+
+
+def seed(services, users, discussions):
+    user_ids = [
+        str(services.user_handler.create_user(f"cache_user_{i}", "not-a-real-hash"))
+        for i in range(users)
+    ]
+    discussion_ids = []
+    for _ in range(discussions):
+        sender, recipient = random.sample(user_ids, 2)
+        _, response = services.message_handler.create_or_get_discussion(sender, {"recipient_id": recipient})
+        discussion_ids.append(response["data"]["_id"])
+    return user_ids, discussion_ids
+
+
+def check(cached, uncached, user_ids, label, stale):
+    # land queued read cursors now, not between the two reads being compared
+    cached.pending_reads.flush()
+    for user_id in user_ids:
+        if cached.get_discussions(user_id) != uncached.get_discussions(user_id):
+            stale.append(f"{label}: inbox of {user_id}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mongo", choices=["memory", "local"], default="memory")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--discussions", type=int, default=60)
+    parser.add_argument("--writes", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    config["cache_backend"] = "memory"
+    db = open_db(args.mongo)
+    services = Services(db)
+    services.ensure_indexes()
+    cached, uncached = services.message_handler, MessageHandler(db)
+    user_ids, discussion_ids = seed(services, args.users, args.discussions)
+
+    stale = []
+    sent = []
+    for i in range(args.writes):
+        discussion_id = random.choice(discussion_ids)
+        participants = cached.discussion_meta(discussion_id)["participants"]
+        operation = random.random()
+        if operation < 0.6 or not sent:
+            _, response = cached.send_message({
+                "discussion_id": discussion_id, "sender_id": participants[0], "text": f"message {i}",
+            })
+            sent.append((response["data"]["_id"], participants))
+            label = "send_message"
+        elif operation < 0.75:
+            message_id, participants = random.choice(sent)
+            cached.update_message(message_id, {"text": f"edited {i}"})
+            label = "update_message"
+        elif operation < 0.9:
+            message_id, participants = sent.pop(random.randrange(len(sent)))
+            cached.delete_message(message_id)
+            label = "delete_message"
+        else:
+            sender, recipient = random.sample(user_ids, 2)
+            _, response = cached.create_or_get_discussion(sender, {"recipient_id": recipient})
+            discussion_ids.append(response["data"]["_id"])
+            participants = [sender, recipient]
+            label = "create_or_get_discussion"
+        check(cached, uncached, participants, label, stale)
+
+    for user_id in random.sample(user_ids, min(5, len(user_ids))):
+        services.user_handler.touch_last_login(user_id)
+    services.user_handler.pending_updates.flush()
+    check(cached, uncached, user_ids, "last_login flush", stale)
+
+    # a cached discussion summary must follow the message sent after it was cached
+    for discussion_id in discussion_ids:
+        sender, *others = cached.discussion_meta(discussion_id)["participants"]
+        request = {"recipient_id": others[0] if others else sender}
+        cached.create_or_get_discussion(sender, request)
+        cached.send_message({"discussion_id": discussion_id, "sender_id": sender, "text": "summary"})
+        if cached.create_or_get_discussion(sender, request) != uncached.create_or_get_discussion(sender, request):
+            stale.append(f"create_or_get_discussion: {discussion_id}")
+
+    # readers racing a writer may see old pages while it runs, never after it stops
+    done = threading.Event()
+
+    def reader():
+        while not done.is_set():
+            cached.get_discussions(random.choice(user_ids))
+
+    readers = [threading.Thread(target=reader) for _ in range(4)]
+    for thread in readers:
+        thread.start()
+    for i in range(args.writes):
+        discussion_id = random.choice(discussion_ids)
+        sender = cached.discussion_meta(discussion_id)["participants"][0]
+        cached.send_message({"discussion_id": discussion_id, "sender_id": sender, "text": f"race {i}"})
+    done.set()
+    for thread in readers:
+        thread.join()
+    check(cached, uncached, user_ids, "after concurrent writes", stale)
+
+    user_id = user_ids[0]
+    cached.get_discussions(user_id)
+    rows = [
+        ("get_discussions", f"{measure(lambda: uncached.get_discussions(user_id))['p50']:.3f}",
+         f"{measure(lambda: cached.get_discussions(user_id))['p50']:.3f}"),
+    ]
+    print_table(["operation", "uncached p50 ms", "cached p50 ms"], rows)
+    print()
+    print_table(
+        ["kind", "hits", "misses", "hit rate"],
+        [
+            (kind, s["hits"], s["misses"], f"{s['hit_rate']:.2%}")
+            for kind, s in sorted(services.cache.stats().items())
+        ],
+    )
+
+    if args.mongo == "local":
+        db.client.drop_database(db.name)
+    if stale:
+        print(f"\n{len(stale)} stale reads:")
+        for entry in stale[:20]:
+            print(f"  {entry}")
+        sys.exit(1)
+    print("\nno stale reads")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""Message search latency at a million messages.
+
+Generates MESSAGES messages spread over DISCUSSIONS discussions, with
+words drawn from a Zipf-like vocabulary, and indexes them with one search
+backend:
+
+- memory: app.search.MemorySearchIndex, fed directly, no database needed;
+- mongo: app.search.MongoTextSearch over a scratch MongoDB database
+  (--mongo local), messages inserted in batches and the text index built.
+
+Then it times ranked first pages of 20 for one user's discussions and for a
+single discussion, with a common, a mid-frequency and a rare word, and a
+two-word query. Reports indexing time, memory and p50/p95/p99 per query kind.
+
+    python -m benchmarks.bench_search --backend memory --messages 1000000
+    python -m benchmarks.bench_search --backend mongo --messages 1000000
+"""
+import argparse
+import random
+import time
+
+from bson import ObjectId
+
+from app.search import MemorySearchIndex, MongoTextSearch
+from benchmarks.common import measure, print_table
+from benchmarks.suite import rss_mb
+
+VOCABULARY = 20000
+QUERIES = {"common word": "w10", "mid word": "w300", "rare word": "w5000", "two words": "w300 w5000"}
+
+
+def messages(count, discussions, seed):
+    """Synthetic message documents, oldest first."""
+    rng = random.Random(seed)
+    words = [f"w{rank}" for rank in range(1, VOCABULARY + 1)]
+    weights, total = [], 0.0
+    for rank in range(1, VOCABULARY + 1):
+        total += 1 / rank
+        weights.append(total)
+    discussion_ids = [str(ObjectId()) for _ in range(discussions)]
+    for version in range(1, count + 1):
+        yield {
+            "_id": ObjectId(),
+            "discussion_id": discussion_ids[rng.randrange(discussions)],
+            "text": " ".join(rng.choices(words, cum_weights=weights, k=rng.randint(4, 20))),
+            "version": version,
+        }
+
+
+def build_memory(args):
+    index = MemorySearchIndex()
+    discussion_ids = []
+    for message in messages(args.messages, args.discussions, args.seed):
+        index.add(message)
+        if len(discussion_ids) < args.user_discussions and message["discussion_id"] not in discussion_ids:
+            discussion_ids.append(message["discussion_id"])
+    return index, discussion_ids, lambda: None
+
+
+def build_mongo(args):
+    from benchmarks.common import bench_db
+
+    db = bench_db()
+    batch, discussion_ids = [], []
+    for message in messages(args.messages, args.discussions, args.seed):
+        batch.append(message)
+        if len(discussion_ids) < args.user_discussions and message["discussion_id"] not in discussion_ids:
+            discussion_ids.append(message["discussion_id"])
+        if len(batch) == 10000:
+            db.messages.insert_many(batch, ordered=False)
+            batch = []
+    if batch:
+        db.messages.insert_many(batch, ordered=False)
+    index = MongoTextSearch(db.messages, language="none")
+    index.ensure_indexes()
+    return index, discussion_ids, lambda: db.client.drop_database(db.name)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backend", choices=["memory", "mongo"], default="memory")
+    parser.add_argument("--messages", type=int, default=1000000)
+    parser.add_argument("--discussions", type=int, default=20000)
+    parser.add_argument("--user-discussions", type=int, default=200, help="discussions the searching user is in")
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rss_start, start = rss_mb(), time.perf_counter()
+    index, discussion_ids, cleanup = (build_memory if args.backend == "memory" else build_mongo)(args)
+    build_seconds, rss = time.perf_counter() - start, rss_mb() - rss_start
+
+    rows = []
+    for scope, scoped_ids in (("user", discussion_ids), ("discussion", discussion_ids[:1])):
+        for kind, query in QUERIES.items():
+            hits = len(index.search(query, scoped_ids, 0, 20))
+            latency = measure(lambda: index.search(query, scoped_ids, 0, 20), args.repeat)
+            rows.append((
+                scope, kind, hits, f"{latency['p50']:.2f}", f"{latency['p95']:.2f}", f"{latency['p99']:.2f}",
+            ))
+    cleanup()
+
+    print(f"{args.backend}: {args.messages:,} messages in {args.discussions:,} discussions, "
+          f"indexed in {build_seconds:.1f}s" + (f", {rss:.0f} MB" if args.backend == "memory" else ""))
+    print(f"user scope: {len(discussion_ids)} discussions\n")
+    print_table(["scope", "query", "hits", "p50 ms", "p95 ms", "p99 ms"], rows)
+
+
+if __name__ == "__main__":
+    main()
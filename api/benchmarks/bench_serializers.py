@@ -0,0 +1,95 @@
+"""Messages serialized and encoded per second.
+
+Builds MESSAGES message documents as they come out of MongoDB and turns
+them into JSON text, ROUNDS times, two ways:
+
+- "legacy": the in-place field loop and json.dumps the handlers used before
+  app.serializers (each round works on fresh copies, since it mutates);
+- "plan": app.serializers.serialize_message and app.serializers.dumps
+  (orjson when installed).
+
+No database is involved. Exits non-zero when the plan path falls below
+--min-rate messages per second:
+
+    python -m benchmarks.bench_serializers --messages 10000 --min-rate 10000
+"""
+import argparse
+import json
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+from bson import ObjectId
+
+from app.serializers import dumps, orjson, serialize_message
+from benchmarks.common import print_table
+
+
+def make_messages(count):
+    discussion_id, sender_id, recipient_id = ObjectId(), ObjectId(), ObjectId()
+    start = datetime.now(timezone.utc)
+    messages = []
+    for i in range(count):
+        timestamp = start + timedelta(milliseconds=i)
+        message = {
+            "_id": ObjectId(), "discussion_id": discussion_id, "sender_id": sender_id,
+            "recipient_id": recipient_id, "text": f"message number {i} " * 4,
+            "timestamp": timestamp, "seq": i + 1, "version": i + 1, "updated_at": timestamp,
+        }
+        if i % 10 == 0:
+            message["edited_at"] = timestamp
+        messages.append(message)
+    return messages
+
+
+def legacy_serialize(msg):
+    msg["_id"] = str(msg["_id"])
+    msg["discussion_id"] = str(msg["discussion_id"])
+    msg["sender_id"] = str(msg["sender_id"])
+    msg["recipient_id"] = str(msg["recipient_id"]) if msg.get("recipient_id") else None
+    msg["timestamp"] = msg["timestamp"].isoformat()
+    for field in ("edited_at", "deleted_at", "updated_at"):
+        if msg.get(field):
+            msg[field] = msg[field].isoformat()
+    return msg
+
+
+def legacy(messages):
+    return json.dumps([legacy_serialize(dict(m)) for m in messages])
+
+
+def plan(messages):
+    return dumps([serialize_message(m) for m in messages])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=10000)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--min-rate", type=float, default=10000, help="messages per second the plan path must reach")
+    args = parser.parse_args()
+
+    messages = make_messages(args.messages)
+    if json.loads(legacy(messages)) != json.loads(plan(messages)):
+        print("legacy and plan output differ")
+        sys.exit(1)
+
+    rows, rates = [], {}
+    for label, encode in (("legacy", legacy), ("plan", plan)):
+        best = float("inf")
+        for _ in range(args.rounds):
+            start = time.perf_counter()
+            encode(messages)
+            best = min(best, time.perf_counter() - start)
+        rates[label] = args.messages / best
+        rows.append((label, args.messages, f"{best * 1000:.1f}", f"{rates[label]:,.0f}"))
+
+    print(f"encoder={'orjson' if orjson is not None else 'json'}")
+    print_table(["path", "messages", "best ms", "messages/s"], rows)
+    if rates["plan"] < args.min_rate:
+        print(f"\nplan path below {args.min_rate:,.0f} messages/s")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""Concurrency check for start_discussion.
+
+CLIENTS connected Socket.IO clients, one per thread, all emit
+start_discussion for the same few participant sets at once, ROUNDS times.
+Every participant set must end up with exactly one discussion, and every
+client must have been handed that one. Also reports start_discussion
+latency. Exits non-zero on a duplicate.
+
+    python -m benchmarks.bench_start_discussion --mongo local --clients 32
+"""
+import argparse
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+import jwt
+
+from app import create_app, socketio
+from app.config import config
+from app.messages import participants_key
+from benchmarks.common import disable_rate_limits, print_table, summarize
+from benchmarks.suite import open_db
+
+
+def token_for(user_id):
+    expires = datetime.now(timezone.utc) + timedelta(hours=1)
+    return jwt.encode({"user_id": user_id, "exp": expires}, config["secret_key"], algorithm="HS256")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mongo", choices=["memory", "local"], default="memory")
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--sets", type=int, default=4, help="participant sets everyone races on")
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+
+    config["ensure_indexes"] = False
+    db = open_db(args.mongo)
+    app = create_app(db)
+    services = app.extensions["diskuss"]
+    services.ensure_indexes()
+    disable_rate_limits()
+
+    users = [str(services.user_handler.create_user(f"race_{i}", "not-a-real-hash")) for i in range(args.clients)]
+    # pairs with a fixed partner, and one group of everyone
+    partners = users[:args.sets]
+    clients = [socketio.test_client(app, auth={"token": token_for(user)}) for user in users]
+    for client in clients:
+        client.get_received()
+
+    latencies, handed = [], Counter()
+    lock = threading.Lock()
+    barrier = threading.Barrier(args.clients)
+
+    def hammer(index):
+        client, samples, seen = clients[index], [], []
+        for round_ in range(args.rounds):
+            barrier.wait()
+            if round_ % 2:
+                request = {"participants": users}
+            else:
+                request = {"recipient_id": partners[round_ // 2 % len(partners)]}
+            start = time.perf_counter()
+            client.emit("start_discussion", request)
+            samples.append((time.perf_counter() - start) * 1000)
+            for packet in client.get_received():
+                if packet["name"] == "start_discussion":
+                    data = packet["args"][0]["data"]
+                    seen.append((participants_key(data["participants"]), data["_id"]))
+        with lock:
+            latencies.extend(samples)
+            handed.update(seen)
+
+    threads = [threading.Thread(target=hammer, args=(i,)) for i in range(args.clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for client in clients:
+        client.disconnect()
+
+    stored = Counter(d["participants_key"] for d in db.discussions.find({}, {"participants_key": 1}))
+    ids_per_key = Counter(key for key, _ in handed)
+    duplicates = {key: count for key, count in stored.items() if count > 1}
+    split = {key for key in ids_per_key if len({d for k, d in handed if k == key}) > 1}
+
+    latency = summarize(latencies)
+    print_table(
+        ["clients", "calls", "discussions", "p50 ms", "p95 ms", "p99 ms"],
+        [(args.clients, latency["count"], len(stored),
+          f"{latency['p50']:.3f}", f"{latency['p95']:.3f}", f"{latency['p99']:.3f}")],
+    )
+    if args.mongo == "local":
+        db.client.drop_database(db.name)
+    if duplicates or split:
+        print(f"\n{len(duplicates)} participant sets stored twice, {len(split)} handed out under several ids")
+        sys.exit(1)
+    print("\nevery participant set has exactly one discussion")
+
+
+if __name__ == "__main__":
+    main()
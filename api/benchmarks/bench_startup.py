@@ -0,0 +1,67 @@
+"""Import-time and first-request budget, checked without a reachable database.
+
+Runs each measurement in a fresh interpreter with MONGO_URI pointing at a
+closed port, so any blocking network call during import or create_app shows
+up as a blown budget. Exits non-zero when a budget is exceeded, so it can
+run as a regression check in CI.
+
+    python -m benchmarks.bench_startup
+"""
+import json
+import os
+import subprocess
+import sys
+
+from benchmarks.common import print_table
+
+# milliseconds
+BUDGETS = {"import": 1500, "create_app": 250, "first_request": 250}
+RUNS = 5
+
+PROBE = """
+import json, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+flask_app = app.create_app()
+created = time.perf_counter()
+response = flask_app.test_client().get("/health/live")
+assert response.status_code == 200, response.status_code
+done = time.perf_counter()
+print(json.dumps({
+    "import": (imported - start) * 1000,
+    "create_app": (created - imported) * 1000,
+    "first_request": (done - created) * 1000,
+}))
+"""
+
+
+def measure_once():
+    env = {
+        **os.environ,
+        "MONGO_URI": "mongodb://127.0.0.1:1/diskuss",
+        "SECRET_KEY": os.getenv("SECRET_KEY", "startup-benchmark-secret-key-0000"),
+    }
+    api_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE], cwd=api_dir, env=env,
+        capture_output=True, text=True, timeout=60, check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    runs = [measure_once() for _ in range(RUNS)]
+    rows, failed = [], False
+    for phase, budget in BUDGETS.items():
+        worst = max(run[phase] for run in runs)
+        best = min(run[phase] for run in runs)
+        ok = worst <= budget
+        failed |= not ok
+        rows.append((phase, f"{best:.1f}", f"{worst:.1f}", budget, "ok" if ok else "OVER"))
+    print_table(["phase", "best ms", "worst ms", "budget ms", "status"], rows)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
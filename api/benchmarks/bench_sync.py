@@ -0,0 +1,141 @@
+"""Reconnect storm: full reload against incremental sync.
+
+Seeds users with discussions and some history, records every user's sync
+token, then sends, edits and deletes a few messages while they are "offline".
+Every user then reconnects at once and catches up either by:
+
+- "full reload": get_discussions plus a page of get_discussion_messages for
+  each of their discussions, what clients did before sync existed;
+- "sync": one call of MessageHandler.sync with their token.
+
+Reports the storm's wall time, per-user latency and the payload size, and
+checks that sync delivered every change to every participant.
+
+    python -m benchmarks.bench_sync --mongo memory
+    python -m benchmarks.bench_sync --mongo local --users 1000 --threads 32
+"""
+import argparse
+import json
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app.extensions import Services
+from app.messages import MessageHandler
+from benchmarks.common import print_table, summarize
+from benchmarks.suite import open_db
+
+
+def seed(services, users, discussions_per_user, history):
+    user_ids = [
+        str(services.user_handler.create_user(f"sync_user_{i}", "not-a-real-hash"))
+        for i in range(users)
+    ]
+    discussions = {}
+    for index, user_id in enumerate(user_ids):
+        for offset in range(1, discussions_per_user + 1):
+            recipient = user_ids[(index + offset) % users]
+            _, response = services.message_handler.create_or_get_discussion(user_id, {"recipient_id": recipient})
+            discussions[response["data"]["_id"]] = [user_id, recipient]
+    for discussion_id, (sender, _) in discussions.items():
+        services.message_handler.send_messages(
+            sender, [{"discussion_id": discussion_id, "text": f"history {i}"} for i in range(history)]
+        )
+    return user_ids, discussions
+
+
+def storm(fn, user_ids, threads):
+    """Run fn for every user at once; returns wall ms, per-user latencies and payload bytes."""
+    def one(user_id):
+        start = time.perf_counter()
+        payload = fn(user_id)
+        return (time.perf_counter() - start) * 1000, len(json.dumps(payload, default=str))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        results = list(pool.map(one, user_ids))
+    wall = (time.perf_counter() - start) * 1000
+    return wall, summarize([ms for ms, _ in results]), sum(size for _, size in results)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mongo", choices=["memory", "local"], default="memory")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--discussions", type=int, default=4, help="discussions started per user")
+    parser.add_argument("--history", type=int, default=30, help="messages per discussion")
+    parser.add_argument("--changes", type=int, default=50, help="messages sent while offline")
+    parser.add_argument("--threads", type=int, default=1, help="concurrent reconnects (mongomock needs 1)")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    db = open_db(args.mongo)
+    services = Services(db)
+    services.ensure_indexes()
+    handler = MessageHandler(db)
+    user_ids, discussions = seed(services, args.users, args.discussions, args.history)
+    tokens = {user_id: handler.sync(user_id)[1]["token"] for user_id in user_ids}
+
+    # what happens while everyone is offline
+    expected = {user_id: set() for user_id in user_ids}
+    sent = []
+    for i in range(args.changes):
+        discussion_id = random.choice(list(discussions))
+        sender = random.choice(discussions[discussion_id])
+        _, response = services.message_handler.send_message(
+            {"discussion_id": discussion_id, "sender_id": sender, "text": f"offline {i}"}
+        )
+        sent.append((response["data"]["_id"], discussion_id, sender))
+    for message_id, discussion_id, sender in random.sample(sent, len(sent) // 5):
+        if random.random() < 0.5:
+            services.message_handler.update_message(message_id, {"text": "edited"}, sender)
+        else:
+            services.message_handler.delete_message(message_id, sender)
+    for message_id, discussion_id, _ in sent:
+        for participant in discussions[discussion_id]:
+            expected[participant].add(message_id)
+
+    user_discussions = {user_id: [] for user_id in user_ids}
+    for discussion_id, participants in discussions.items():
+        for participant in participants:
+            user_discussions[participant].append(discussion_id)
+
+    def full_reload(user_id):
+        payload = [handler.get_discussions(user_id, limit=100)[1]]
+        for discussion_id in user_discussions[user_id]:
+            payload.append(handler.get_discussion_messages(discussion_id, limit=50, user_id=user_id)[1])
+        return payload
+
+    missing = []
+
+    def sync(user_id):
+        payload, token = [], tokens[user_id]
+        while True:
+            _, response = handler.sync(user_id, token)
+            payload.append(response)
+            token = response["token"]
+            if not response["has_more"]:
+                break
+        delivered = {message["_id"] for page in payload for message in page["messages"]}
+        if expected[user_id] - delivered:
+            missing.append(user_id)
+        return payload
+
+    rows = []
+    for label, fn in (("full reload", full_reload), ("sync", sync)):
+        wall, latency, size = storm(fn, user_ids, args.threads)
+        rows.append((label, f"{wall:.1f}", f"{latency['p50']:.3f}", f"{latency['p95']:.3f}", f"{size / 1024:.1f}"))
+    print_table(["reconnect", "storm ms", "p50 ms", "p95 ms", "payload KiB"], rows)
+
+    if args.mongo == "local":
+        db.client.drop_database(db.name)
+    if missing:
+        print(f"\nsync missed changes for {len(missing)} users")
+        sys.exit(1)
+    print(f"\n{args.users} users caught up on {args.changes} offline messages")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""Helpers shared by the benchmark scripts."""
+import os
+import statistics
+import time
+
+from pymongo import MongoClient
+
+
+def bench_db(name="diskuss_bench"):
+    """A scratch database next to the configured one; dropped before use."""
+    client = MongoClient(os.getenv("MONGO_URI", "mongodb://localhost:27017/diskuss"))
+    client.drop_database(name)
+    return client[name]
+
+
+def summarize(samples):
+    """Latency percentiles of a list of millisecond samples."""
+    samples = sorted(samples)
+    if not samples:
+        return {"count": 0, "p50": 0.0, "p95": 0.0, "p99": 0.0, "mean": 0.0}
+    at = lambda fraction: samples[min(len(samples) - 1, int(len(samples) * fraction))]
+    return {
+        "count": len(samples),
+        "p50": statistics.median(samples),
+        "p95": at(0.95),
+        "p99": at(0.99),
+        "mean": statistics.fmean(samples),
+    }
+
+
+def measure(fn, repeat=200):
+    """Call fn repeatedly and return latency percentiles in milliseconds."""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return summarize(samples)
+
+
+def print_table(headers, rows):
+    widths = [max(len(str(h)), *(len(str(r[i])) for r in rows)) for i, h in enumerate(headers)]
+    print("  ".join(str(h).rjust(w) for h, w in zip(headers, widths)))
+    for row in rows:
+        print("  ".join(str(c).rjust(w) for c, w in zip(row, widths)))
+
+
+def disable_rate_limits():
+    """Lift the per-user and per-socket event budgets; benchmarks measure the work, not the limits."""
+    from app import events
+
+    events.event_limits.clear()
+    events.socket_limit.rate = 0
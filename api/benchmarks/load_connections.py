@@ -0,0 +1,96 @@
+"""Concurrent-connection capacity of a running diskuss api.
+
+Signs up throwaway users, opens CONNECTIONS Socket.IO clients in waves of
+RAMP per second and, once they are all up, times a get_discussions round
+trip on every socket. Point it at the dev server (python run.py) and at
+the production server (./start_prod.sh) to compare them. Start the server with
+SIGNUP_LIMIT_PER_IP=0: every throwaway user signs up from the same address.
+
+    pip install "python-socketio[asyncio_client]" aiohttp
+    python -m benchmarks.load_connections --url http://localhost:5100 --connections 2000
+"""
+import argparse
+import asyncio
+import time
+import uuid
+
+import aiohttp
+import socketio
+
+from benchmarks.common import print_table
+
+
+async def signup(session, url, username):
+    async with session.post(f"{url}/api/auth/signup", json={"username": username, "password": "bench"}) as response:
+        return (await response.json())["token"]
+
+
+async def open_client(url, token, connect_times, failures):
+    client = socketio.AsyncClient(reconnection=False)
+    start = time.perf_counter()
+    try:
+        await client.connect(url, auth={"token": token}, transports=["websocket"], wait_timeout=30)
+        connect_times.append((time.perf_counter() - start) * 1000)
+        return client
+    except Exception:
+        failures.append(token)
+        return None
+
+
+async def round_trip(client, latencies):
+    done = asyncio.get_running_loop().create_future()
+    client.on("get_discussions", lambda data: done.done() or done.set_result(True))
+    start = time.perf_counter()
+    await client.emit("get_discussions", {})
+    try:
+        await asyncio.wait_for(done, timeout=30)
+        latencies.append((time.perf_counter() - start) * 1000)
+    except asyncio.TimeoutError:
+        pass
+
+
+def percentile(samples, fraction):
+    if not samples:
+        return float("nan")
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+async def main(url, connections, ramp, users):
+    run = uuid.uuid4().hex[:8]
+    async with aiohttp.ClientSession() as session:
+        tokens = await asyncio.gather(*(signup(session, url, f"load_{run}_{i}") for i in range(users)))
+
+    connect_times, failures, clients = [], [], []
+    started = time.perf_counter()
+    for wave in range(0, connections, ramp):
+        batch = [
+            open_client(url, tokens[i % users], connect_times, failures)
+            for i in range(wave, min(wave + ramp, connections))
+        ]
+        clients += [c for c in await asyncio.gather(*batch) if c]
+        await asyncio.sleep(1)
+    ramp_seconds = time.perf_counter() - started
+
+    latencies = []
+    await asyncio.gather(*(round_trip(client, latencies) for client in clients))
+    await asyncio.gather(*(client.disconnect() for client in clients))
+
+    print_table(
+        ["target", "connected", "failed", "ramp s", "connect p50 ms", "connect p99 ms", "event p50 ms", "event p99 ms"],
+        [(
+            connections, len(clients), len(failures), f"{ramp_seconds:.1f}",
+            f"{percentile(connect_times, 0.5):.1f}", f"{percentile(connect_times, 0.99):.1f}",
+            f"{percentile(latencies, 0.5):.1f}", f"{percentile(latencies, 0.99):.1f}",
+        )],
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://localhost:5100")
+    parser.add_argument("--connections", type=int, default=1000)
+    parser.add_argument("--ramp", type=int, default=200, help="new connections per second")
+    parser.add_argument("--users", type=int, default=100, help="distinct users to spread sockets over")
+    args = parser.parse_args()
+    asyncio.run(main(args.url, args.connections, args.ramp, args.users))
@@ -0,0 +1,266 @@
+"""Load and latency suite for the Socket.IO events and REST routes.
+
+Builds the app in-process against either a scratch MongoDB database or an
+in-memory stand-in (mongomock), seeds users and discussions with realistic
+history sizes, then runs CLIENTS concurrent simulated users. Each one
+connects a Socket.IO client and loops over start_discussion, send_message,
+get_discussions and get_discussion_messages, plus the REST routes.
+
+Reports p50/p95/p99 per operation, messages/sec, server memory and the
+bytes and encoding time of the main events in JSON and in the compact
+protocol, and writes everything to JSON so runs can be compared across commits:
+
+    python -m benchmarks.suite --mongo memory --clients 20 --iterations 50
+    python -m benchmarks.suite --mongo local --compare benchmarks/results/<baseline>.json
+
+The in-memory stand-in needs ``pip install mongomock`` and is only useful
+for comparing runs with each other; use ``--mongo local`` for real numbers.
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+import jwt
+
+from app import create_app, socketio
+from app.config import config
+from benchmarks.bench_protocol import measure_protocol, print_protocol, sample_payloads
+from benchmarks.common import disable_rate_limits, print_table, summarize
+
+# messages already in each seeded discussion; most chats are short, a few are long
+HISTORY_SIZES = [10, 10, 50, 100, 500, 2_000]
+PASSWORD_HASH = "not-a-real-hash"
+
+
+def open_db(kind):
+    if kind == "memory":
+        try:
+            import mongomock
+        except ImportError:
+            sys.exit("--mongo memory needs mongomock: pip install mongomock")
+        return mongomock.MongoClient().diskuss_bench
+    from benchmarks.common import bench_db
+    return bench_db()
+
+
+def rss_mb():
+    with open("/proc/self/statm") as statm:
+        pages = int(statm.read().split()[1])
+    return pages * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return "unknown"
+
+
+def token_for(user_id):
+    return jwt.encode(
+        {"user_id": user_id, "username": user_id, "exp": time.time() + 24 * 3600},
+        config["secret_key"], algorithm="HS256",
+    )
+
+
+class Recorder:
+    """Collects latency samples per operation from all client threads."""
+
+    def __init__(self):
+        self.samples = {}
+        self.lock = threading.Lock()
+
+    def time(self, operation, fn):
+        start = time.perf_counter()
+        result = fn()
+        elapsed = (time.perf_counter() - start) * 1000
+        with self.lock:
+            self.samples.setdefault(operation, []).append(elapsed)
+        return result
+
+
+def seed(services, users, discussions_per_user):
+    user_ids = [
+        str(services.user_handler.create_user(f"bench_user_{i}", PASSWORD_HASH)) for i in range(users)
+    ]
+    discussions = {}
+    for i, user_id in enumerate(user_ids):
+        for peer in random.sample(user_ids[:i] + user_ids[i + 1:], discussions_per_user):
+            _, response = services.message_handler.create_or_get_discussion(user_id, {"recipient_id": peer})
+            discussion_id = response["data"]["_id"]
+            if discussion_id in discussions:
+                continue
+            discussions[discussion_id] = (user_id, peer)
+            history = random.choice(HISTORY_SIZES)
+            for start in range(0, history, 500):
+                batch = [
+                    {"discussion_id": discussion_id, "text": f"seed message {n}"}
+                    for n in range(start, min(start + 500, history))
+                ]
+                services.message_handler.send_messages(random.choice((user_id, peer)), batch)
+    return user_ids, discussions
+
+
+def run_client(app, recorder, user_id, user_ids, own_discussions, iterations, errors):
+    token = token_for(user_id)
+    headers = {"Authorization": f"Bearer {token}"}
+    http = app.test_client()
+    try:
+        client = recorder.time("connect", lambda: socketio.test_client(
+            app, auth={"token": token}, headers={"Authorization": token}
+        ))
+        for _ in range(iterations):
+            peer = random.choice([u for u in user_ids if u != user_id])
+            recorder.time("start_discussion", lambda: client.emit("start_discussion", {"recipient_id": peer}))
+            discussion_id = random.choice(own_discussions) if own_discussions else None
+            if discussion_id:
+                recorder.time("send_message", lambda: client.emit(
+                    "send_message", {"discussion_id": discussion_id, "text": "benchmark message"}, callback=True
+                ))
+                recorder.time("get_discussion_messages", lambda: client.emit(
+                    "get_discussion_messages", {"discussion_id": discussion_id, "limit": 50}
+                ))
+                recorder.time("GET /discussions/<id>/messages", lambda: http.get(
+                    f"/api/diskuss/discussions/{discussion_id}/messages?limit=50", headers=headers
+                ))
+            recorder.time("get_discussions", lambda: client.emit("get_discussions", {}))
+            recorder.time("GET /discussions", lambda: http.get("/api/diskuss/discussions", headers=headers))
+            recorder.time("GET /users", lambda: http.get("/api/diskuss/users?username=bench_user_1", headers=headers))
+            recorder.time("GET /me", lambda: http.get("/api/diskuss/me", headers=headers))
+            # drop what the server pushed so client queues stay small
+            client.get_received()
+        client.disconnect()
+    except Exception as e:
+        errors.append(repr(e))
+
+
+def compare(results, baseline_path, max_regression):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    rows, regressed = [], False
+    for operation, stats in sorted(results["operations"].items()):
+        before = baseline["operations"].get(operation)
+        if not before or not before["p95"]:
+            continue
+        change = stats["p95"] / before["p95"] - 1
+        bad = change > max_regression
+        regressed |= bad
+        rows.append((operation, f"{before['p95']:.2f}", f"{stats['p95']:.2f}", f"{change:+.0%}", "REGRESSED" if bad else "ok"))
+    print(f"\ncompared with {baseline_path} ({baseline['meta']['commit']})")
+    print_table(["operation", "base p95 ms", "p95 ms", "change", "status"], rows)
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mongo", choices=["memory", "local"], default="memory")
+    parser.add_argument("--clients", type=int, default=20)
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--discussions-per-user", type=int, default=5)
+    parser.add_argument("--output", help="JSON results path (default benchmarks/results/<commit>-<time>.json)")
+    parser.add_argument("--compare", help="baseline JSON to compare p95 latencies against")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="allowed p95 slowdown, 0.2 = 20%%")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    config["ensure_indexes"] = False
+    app = create_app(open_db(args.mongo))
+    services = app.extensions["diskuss"]
+    services.ensure_indexes()
+    disable_rate_limits()
+
+    rss_start = rss_mb()
+    seed_start = time.perf_counter()
+    user_ids, discussions = seed(services, args.users, args.discussions_per_user)
+    seed_seconds = time.perf_counter() - seed_start
+
+    by_user = {}
+    for discussion_id, members in discussions.items():
+        for member in members:
+            by_user.setdefault(member, []).append(discussion_id)
+
+    recorder, errors = Recorder(), []
+    threads = [
+        threading.Thread(target=run_client, args=(
+            app, recorder, user_ids[i % len(user_ids)], user_ids,
+            by_user.get(user_ids[i % len(user_ids)], []), args.iterations, errors,
+        ))
+        for i in range(args.clients)
+    ]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    operations = {op: summarize(samples) for op, samples in recorder.samples.items()}
+    discussion_id, members = next(iter(discussions.items()))
+    protocol = measure_protocol(sample_payloads(services.message_handler, members[0], discussion_id))
+    total_ops = sum(stats["count"] for stats in operations.values())
+    results = {
+        "meta": {
+            "commit": git_commit(),
+            "time": datetime.now(timezone.utc).isoformat(),
+            "mongo": args.mongo,
+            "clients": args.clients,
+            "iterations": args.iterations,
+            "users": args.users,
+            "discussions": len(discussions),
+            "seed_seconds": seed_seconds,
+        },
+        "operations": operations,
+        "throughput": {
+            "elapsed_seconds": elapsed,
+            "ops_per_sec": total_ops / elapsed,
+            "messages_per_sec": operations.get("send_message", {"count": 0})["count"] / elapsed,
+        },
+        "memory": {
+            "rss_start_mb": rss_start,
+            "rss_end_mb": rss_mb(),
+            "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        },
+        "read_cache": services.cache.stats(),
+        "protocol": protocol,
+        "errors": errors,
+    }
+
+    print_table(
+        ["operation", "count", "p50 ms", "p95 ms", "p99 ms"],
+        [
+            (op, s["count"], f"{s['p50']:.2f}", f"{s['p95']:.2f}", f"{s['p99']:.2f}")
+            for op, s in sorted(operations.items())
+        ],
+    )
+    print()
+    print_protocol(protocol)
+    print(f"\n{results['throughput']['messages_per_sec']:.1f} messages/sec, "
+          f"{results['throughput']['ops_per_sec']:.1f} ops/sec, "
+          f"peak RSS {results['memory']['peak_rss_mb']:.0f} MB, {len(errors)} client errors")
+
+    output = args.output or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "results",
+        f"{results['meta']['commit']}-{datetime.now().strftime('%Y%m%d%H%M%S')}.json",
+    )
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"results written to {output}")
+
+    if args.compare and compare(results, args.compare, args.max_regression):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,23 @@
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5100')}"
+
+# Socket.IO long-polling needs sticky sessions, so more than one worker also
+# needs a sticky load balancer in front and SOCKETIO_MESSAGE_QUEUE set so
+# emits reach sockets held by other workers.
+workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+
+_async_mode = os.getenv("ASYNC_MODE", "eventlet")
+if _async_mode == "gevent":
+  worker_class = "geventwebsocket.gunicorn.workers.GeventWebSocketWorker"
+else:
+  worker_class = "eventlet"
+
+# concurrent greenlets (i.e. sockets) per worker
+worker_connections = int(os.getenv("WORKER_CONNECTIONS", "1000"))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "60"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+keepalive = 5
+
+accesslog = "-"
+errorlog = "-"
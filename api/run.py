@@ -1,3 +1,4 @@
+import os
 from dotenv import load_dotenv
 from app import create_app, socketio
 
@@ -6,4 +7,10 @@ load_dotenv()
 app = create_app()
 
 if __name__ == "__main__":
-  socketio.run(app, host='0.0.0.0', port=5100, debug=True)
\ No newline at end of file
+  # development server only; production runs wsgi.py under gunicorn (see start_prod.sh)
+  socketio.run(
+    app,
+    host=os.getenv("HOST", "0.0.0.0"),
+    port=int(os.getenv("PORT", "5100")),
+    debug=os.getenv("FLASK_DEBUG", "1") == "1",
+  )
@@ -0,0 +1,44 @@
+"""Backfill last_message / last_message_at on existing discussions.
+
+Run from the api directory:
+
+    python -m scripts.backfill_discussion_summaries
+"""
+from pymongo import DESCENDING, UpdateOne
+from app.config import config, get_db
+from app.messages import MessageHandler
+
+BATCH_SIZE = 500
+
+
+def backfill(db, batch_size=BATCH_SIZE):
+    updates = []
+    updated = 0
+
+    for discussion in db.discussions.find({"last_message_at": {"$exists": False}}, {"_id": 1}):
+        latest = db.messages.find_one(
+            {"discussion_id": str(discussion["_id"])},
+            sort=[("timestamp", DESCENDING), ("_id", DESCENDING)],
+        )
+        last_message_at = (
+            latest["timestamp"] if latest
+            else discussion["_id"].generation_time.replace(tzinfo=None)
+        )
+        updates.append(UpdateOne(
+            {"_id": discussion["_id"]},
+            {"$set": {"last_message": latest, "last_message_at": last_message_at}},
+        ))
+
+        if len(updates) >= batch_size:
+            updated += db.discussions.bulk_write(updates, ordered=False).modified_count
+            updates = []
+
+    if updates:
+        updated += db.discussions.bulk_write(updates, ordered=False).modified_count
+    return updated
+
+
+if __name__ == "__main__":
+    db = get_db()
+    MessageHandler(db, config["discussion_recent_messages"]).ensure_indexes()
+    print(f"Backfilled {backfill(db)} discussions.")
@@ -0,0 +1,44 @@
+"""Number existing messages and set each discussion's message counter.
+
+Messages sent before read receipts existed have no ``seq``, so they can not
+be marked read and do not count as unread. Run from the api directory,
+ideally while no messages are being sent:
+
+    python -m scripts.backfill_message_seq
+"""
+from pymongo import ASCENDING, UpdateOne
+from app.config import config, get_db
+from app.messages import MessageHandler
+
+BATCH_SIZE = 500
+
+
+def backfill(db, batch_size=BATCH_SIZE):
+    numbered = 0
+
+    for discussion in db.discussions.find({"message_seq": {"$exists": False}}, {"_id": 1}):
+        updates = []
+        seq = 0
+        cursor = (
+            db.messages.find({"discussion_id": str(discussion["_id"])}, {"_id": 1})
+            .sort([("timestamp", ASCENDING), ("_id", ASCENDING)])
+            .batch_size(batch_size)
+        )
+        for message in cursor:
+            seq += 1
+            updates.append(UpdateOne({"_id": message["_id"]}, {"$set": {"seq": seq}}))
+            if len(updates) >= batch_size:
+                db.messages.bulk_write(updates, ordered=False)
+                updates = []
+
+        if updates:
+            db.messages.bulk_write(updates, ordered=False)
+        db.discussions.update_one({"_id": discussion["_id"]}, {"$set": {"message_seq": seq}})
+        numbered += seq
+    return numbered
+
+
+if __name__ == "__main__":
+    db = get_db()
+    MessageHandler(db, config["discussion_recent_messages"]).ensure_indexes()
+    print(f"Numbered {backfill(db)} messages.")
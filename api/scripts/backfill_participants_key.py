@@ -0,0 +1,55 @@
+"""Key existing discussions by their participant set.
+
+Discussions created before the participants_key index existed have no key,
+so create_or_get_discussion can not find them and would start new ones. Run
+from the api directory:
+
+    python -m scripts.backfill_participants_key
+
+When earlier races left several discussions for one participant set, the
+oldest gets the key and the others are listed; they stay readable by id.
+"""
+from pymongo import ASCENDING, UpdateOne
+from app.config import config, get_db
+from app.messages import MessageHandler, participants_key
+
+BATCH_SIZE = 500
+
+
+def backfill(db, batch_size=BATCH_SIZE):
+    keyed, duplicates = 0, []
+    taken = {
+        discussion["participants_key"]
+        for discussion in db.discussions.find({"participants_key": {"$exists": True}}, {"participants_key": 1})
+    }
+    updates = []
+    cursor = (
+        db.discussions.find({"participants_key": {"$exists": False}}, {"participants": 1})
+        .sort("_id", ASCENDING)
+        .batch_size(batch_size)
+    )
+    for discussion in cursor:
+        key = participants_key(discussion["participants"])
+        if key in taken:
+            duplicates.append(discussion["_id"])
+            continue
+        taken.add(key)
+        updates.append(UpdateOne({"_id": discussion["_id"]}, {"$set": {"participants_key": key}}))
+        if len(updates) >= batch_size:
+            db.discussions.bulk_write(updates, ordered=False)
+            keyed += len(updates)
+            updates = []
+
+    if updates:
+        db.discussions.bulk_write(updates, ordered=False)
+        keyed += len(updates)
+    return keyed, duplicates
+
+
+if __name__ == "__main__":
+    db = get_db()
+    MessageHandler(db, config["discussion_recent_messages"]).ensure_indexes()
+    keyed, duplicates = backfill(db)
+    print(f"Keyed {keyed} discussions.")
+    for discussion_id in duplicates:
+        print(f"Duplicate discussion left without a key: {discussion_id}")
@@ -0,0 +1,33 @@
+"""Backfill the normalized username search fields on existing users.
+
+Run from the api directory:
+
+    python -m scripts.backfill_username_search
+"""
+from pymongo import UpdateOne
+from app.config import get_db
+from app.user import UserHandler, search_fields
+
+BATCH_SIZE = 500
+
+
+def backfill(db, batch_size=BATCH_SIZE):
+    updates = []
+    updated = 0
+
+    for user in db.users.find({"username_trigrams": {"$exists": False}}, {"username": 1}):
+        updates.append(UpdateOne({"_id": user["_id"]}, {"$set": search_fields(user["username"])}))
+
+        if len(updates) >= batch_size:
+            updated += db.users.bulk_write(updates, ordered=False).modified_count
+            updates = []
+
+    if updates:
+        updated += db.users.bulk_write(updates, ordered=False).modified_count
+    return updated
+
+
+if __name__ == "__main__":
+    db = get_db()
+    UserHandler(db).ensure_indexes()
+    print(f"Backfilled {backfill(db)} users.")
@@ -0,0 +1,42 @@
+"""Stream discussions and their messages to a file or stdout.
+
+Run from the api directory:
+
+    python -m scripts.export_discussions > export.ndjson
+    python -m scripts.export_discussions --user <user id> --format json -o export.json
+    python -m scripts.export_discussions --resume <token from the last checkpoint> >> export.ndjson
+
+Output is NDJSON by default; see app/transfer.py for the record format.
+"""
+import argparse
+import sys
+from app.config import get_db
+from app.transfer import BATCH_SIZE, export_records, json_array_chunks, ndjson_lines
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--user", help="only the discussions this user id takes part in")
+    parser.add_argument("--format", choices=["ndjson", "json"], default="ndjson")
+    parser.add_argument("--resume", help="resume token of a checkpoint record")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("-o", "--output", help="file to write (default stdout)")
+    args = parser.parse_args()
+
+    try:
+        records = export_records(get_db(), args.user, resume=args.resume, batch_size=args.batch_size)
+    except ValueError as e:
+        sys.exit(str(e))
+
+    chunks = json_array_chunks(records) if args.format == "json" else ndjson_lines(records)
+    output = open(args.output, "w") if args.output else sys.stdout
+    try:
+        for chunk in chunks:
+            output.write(chunk)
+    finally:
+        if args.output:
+            output.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+"""Import an NDJSON export into the configured database.
+
+Run from the api directory:
+
+    python -m scripts.import_discussions export.ndjson
+    python -m scripts.import_discussions - < export.ndjson
+
+Discussions are merged by participant set and messages already present are
+skipped, so an import can be re-run or fed an overlapping resumed export.
+Restart the API afterwards (or wait CACHE_TTL) so its read cache picks up
+the imported discussions.
+"""
+import argparse
+import sys
+from app.config import config, get_db
+from app.messages import MessageHandler
+from app.transfer import BATCH_SIZE, import_records
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("path", help="NDJSON file, or - for stdin")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    args = parser.parse_args()
+
+    db = get_db()
+    MessageHandler(db, config["discussion_recent_messages"]).ensure_indexes()
+    lines = sys.stdin if args.path == "-" else open(args.path)
+    try:
+        counts = import_records(db, lines, batch_size=args.batch_size)
+    except ValueError as e:
+        sys.exit(str(e))
+    finally:
+        if lines is not sys.stdin:
+            lines.close()
+    print(f"Imported {counts['discussions']} discussions and {counts['messages']} messages.")
+
+
+if __name__ == "__main__":
+    main()
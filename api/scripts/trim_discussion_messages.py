@@ -0,0 +1,25 @@
+"""Trim the embedded messages array on existing discussions.
+
+Keeps the last DISCUSSION_RECENT_MESSAGES ids (or drops the array when it
+is 0). Run from the api directory:
+
+    python -m scripts.trim_discussion_messages
+"""
+from app.config import config, get_db
+
+
+def trim(db, keep):
+    if keep:
+        result = db.discussions.update_many(
+            {f"messages.{keep}": {"$exists": True}},
+            {"$push": {"messages": {"$each": [], "$slice": -keep}}},
+        )
+    else:
+        result = db.discussions.update_many(
+            {"messages": {"$exists": True}}, {"$unset": {"messages": ""}}
+        )
+    return result.modified_count
+
+
+if __name__ == "__main__":
+    print(f"Trimmed {trim(get_db(), config['discussion_recent_messages'])} discussions.")
@@ -0,0 +1,5 @@
+#!/bin/bash
+# Activate the virtual environment
+source .venv/bin/activate
+# Run the application under gunicorn with an async worker
+exec gunicorn -c gunicorn.conf.py wsgi:app
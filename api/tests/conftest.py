@@ -0,0 +1,75 @@
+import os
+from datetime import datetime, timedelta, timezone
+
+# app.config refuses to load without one
+os.environ.setdefault("SECRET_KEY", "test-secret-of-at-least-32-bytes!")
+
+import jwt
+import mongomock
+import pytest
+
+from app.config import config
+
+# mongomock predates the sort option pymongo now passes for UpdateOne and ReplaceOne
+for _name in ("add_update", "add_replace"):
+    def _drop_sort(self, *args, _add=getattr(mongomock.collection.BulkOperationBuilder, _name), sort=None, **kwargs):
+        return _add(self, *args, **kwargs)
+    setattr(mongomock.collection.BulkOperationBuilder, _name, _drop_sort)
+
+
+# and compares embedded documents with Python's max; MongoDB compares them field by field
+def _max_updater(doc, field_name, value, _max=mongomock.collection._max_updater):
+    current = doc.get(field_name)
+    if isinstance(value, dict):
+        if current is None or list(value.items()) > list(current.items()):
+            doc[field_name] = value
+        return
+    _max(doc, field_name, value)
+
+
+mongomock.collection._updaters["$max"] = _max_updater
+
+
+@pytest.fixture
+def db():
+    return mongomock.MongoClient().diskuss
+
+
+@pytest.fixture
+def app(db, monkeypatch):
+    from app import create_app, events
+
+    monkeypatch.setitem(config, "ensure_indexes", False)
+    # the test clients drive the server from plain threads
+    monkeypatch.setitem(config, "async_mode", "threading")
+    # tests exercise the handlers, not the event budgets
+    for bucket in [events.socket_limit, *events.event_limits.values()]:
+        monkeypatch.setattr(bucket, "rate", 0)
+    app = create_app(db)
+    app.extensions["diskuss"].ensure_indexes()
+    return app
+
+
+@pytest.fixture
+def services(app):
+    return app.extensions["diskuss"]
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def make_token(user_id):
+    expires = datetime.now(timezone.utc) + timedelta(hours=1)
+    return jwt.encode({"user_id": str(user_id), "exp": expires}, config["secret_key"], algorithm="HS256")
+
+
+def auth_header(user_id):
+    return {"Authorization": f"Bearer {make_token(user_id)}"}
+
+
+def start(services, *usernames):
+    users = [str(services.user_handler.create_user(name, "not-a-real-hash")) for name in usernames]
+    _, response = services.message_handler.create_or_get_discussion(users[0], participants=users[1:])
+    return users, response["data"]["_id"]
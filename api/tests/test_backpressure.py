@@ -0,0 +1,90 @@
+import types
+
+from app.backpressure import OutboundGuard
+
+
+class FakeSocket:
+    def __init__(self):
+        self.queued = 0
+        self.closed = False
+        self.queue = types.SimpleNamespace(qsize=lambda: self.queued)
+
+    def close(self, wait=True, abort=False):
+        self.closed = True
+
+
+class FakeServer:
+    """Engine.IO sockets whose queue lengths the test sets, one namespace, one room."""
+
+    def __init__(self):
+        self.sent = []
+        self.eio = types.SimpleNamespace(
+            sockets={}, send_packet=lambda eio_sid, pkt: self.sent.append((eio_sid, pkt))
+        )
+        self.manager = types.SimpleNamespace(
+            get_participants=lambda namespace, rooms: [(f"s-{e}", e) for e in list(self.eio.sockets)],
+            eio_sid_from_sid=lambda sid, namespace: sid[2:] if sid[2:] in self.eio.sockets else None,
+        )
+        self.tasks = []
+        # the drain loop sleeps between checks; the client catches up meanwhile
+        self.on_sleep = lambda: None
+
+    def start_background_task(self, target, *args):
+        self.tasks.append((target, args))
+
+    def run_tasks(self):
+        while self.tasks:
+            target, args = self.tasks.pop(0)
+            target(*args)
+
+    def sleep(self, seconds):
+        self.on_sleep()
+
+
+def guarded(soft_limit=5, max_queued=10):
+    server, resent = FakeServer(), []
+    guard = OutboundGuard(soft_limit, max_queued, lambda event, payload, sid: resent.append((event, payload, sid)))
+    guard.install(server)
+    socket = server.eio.sockets["e1"] = FakeSocket()
+    return guard, server, socket, resent
+
+
+def test_packets_pass_under_the_limits():
+    guard, server, _, _ = guarded()
+
+    server.eio.send_packet("e1", "packet")
+
+    assert server.sent == [("e1", "packet")]
+    assert guard.hold("typing", {}, ("room", "room:compact")) is None
+
+
+def test_backlogged_socket_gets_only_the_latest_state_after_catching_up():
+    guard, server, socket, resent = guarded()
+    socket.queued = 5
+    server.eio.send_packet("e1", "message")
+
+    assert guard.hold("typing", {"n": 1}, ("room", "room:compact")) == ["s-e1"]
+    assert guard.hold("typing", {"n": 2}, ("room", "room:compact")) == ["s-e1"]
+    assert resent == []
+
+    def catch_up():
+        socket.queued = 0
+    server.on_sleep = catch_up
+    server.run_tasks()
+
+    assert resent == [("typing", {"n": 2}, "s-e1")]
+    assert guard.hold("typing", {"n": 3}, ("room", "room:compact")) is None
+
+
+def test_socket_at_the_max_is_dropped():
+    guard, server, socket, _ = guarded()
+    socket.queued = 10
+
+    server.eio.send_packet("e1", "one too many")
+    server.eio.send_packet("e1", "and another")
+
+    assert server.sent == []
+    assert len(server.tasks) == 1
+    server.run_tasks()
+    assert socket.closed
+    assert "e1" not in server.eio.sockets
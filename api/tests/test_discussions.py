@@ -0,0 +1,61 @@
+import threading
+
+from conftest import start
+
+THREADS = 16
+
+
+class RacingUpserts:
+    """Discussions whose upserts look up and insert in two steps, as concurrent MongoDB upserts may.
+
+    Every caller finds nothing before any of them inserts, so only the
+    unique index on participants_key keeps the set to one discussion.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.barrier = threading.Barrier(THREADS, timeout=5)
+
+    def __getattr__(self, name):
+        return getattr(self.collection, name)
+
+    def find_one_and_update(self, query, update, upsert=False, **kwargs):
+        if upsert and self.collection.find_one(query) is None:
+            self.barrier.wait()
+            self.collection.insert_one({**query, **update["$setOnInsert"]})
+        return self.collection.find_one_and_update(query, update, upsert=upsert, **kwargs)
+
+
+def test_concurrent_starts_share_one_discussion(services, db, monkeypatch):
+    handler = services.message_handler
+    monkeypatch.setattr(handler, "discussions", RacingUpserts(db.discussions))
+    users = [str(services.user_handler.create_user(f"user{i}", "not-a-real-hash")) for i in range(3)]
+    ids = []
+
+    def start_discussion(index):
+        # the same set, listed from each participant's side
+        participants = users[index % 3:] + users[:index % 3]
+        _, response = handler.create_or_get_discussion(participants[0], participants=participants[1:])
+        ids.append(response["data"]["_id"])
+
+    workers = [threading.Thread(target=start_discussion, args=(i,)) for i in range(THREADS)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    assert len(ids) == THREADS
+    assert len(set(ids)) == 1
+    assert db.discussions.count_documents({}) == 1
+
+
+def test_discussion_by_id_is_only_returned_to_participants(services):
+    handler = services.message_handler
+    (alice, _), discussion_id = start(services, "alice", "bob")
+    mallory = str(services.user_handler.create_user("mallory", "not-a-real-hash"))
+
+    # once from the database, once with the summary cached by the participant's call
+    for _ in range(2):
+        status, response = handler.create_or_get_discussion(mallory, {"discussion_id": discussion_id})
+        assert not status and response["code"] == 404
+        assert handler.create_or_get_discussion(alice, {"discussion_id": discussion_id})[0]
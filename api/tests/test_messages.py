@@ -0,0 +1,37 @@
+from conftest import make_token, start
+
+
+def test_send_messages_numbers_and_summarizes_each_discussion(services, db):
+    (alice, bob), first = start(services, "alice", "bob")
+    _, second = services.message_handler.create_or_get_discussion(alice, participants=[
+        str(services.user_handler.create_user("carol", "not-a-real-hash")),
+    ])
+    second = second["data"]["_id"]
+
+    status, response = services.message_handler.send_messages(alice, [
+        {"discussion_id": first, "text": "one"},
+        {"discussion_id": second, "text": "two"},
+        {"discussion_id": first, "text": "three"},
+        {"discussion_id": "not-an-id", "text": "lost"},
+    ])
+
+    assert status
+    assert [result["status"] for result in response["results"]] == ["ok", "ok", "ok", "error"]
+    assert [(m["text"], m["seq"]) for m in response["data"]] == [("one", 1), ("two", 1), ("three", 2)]
+    summaries = {str(d["_id"]): d for d in db.discussions.find()}
+    assert summaries[first]["last_message"]["text"] == "three"
+    assert summaries[first]["message_seq"] == 2
+    assert summaries[second]["last_message"]["text"] == "two"
+
+
+def test_send_messages_event_without_data(app):
+    from app import socketio
+
+    (alice, _), _ = start(app.extensions["diskuss"], "alice", "bob")
+    client = socketio.test_client(app, auth={"token": make_token(alice)})
+    client.get_received()
+
+    client.emit("send_messages", None)
+
+    assert [packet["name"] for packet in client.get_received()] == ["error"]
+    client.disconnect()
@@ -0,0 +1,97 @@
+import types
+import time
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+
+from app import presence
+from app.presence import InMemoryPresenceRegistry, PresenceRegistry, SharedPresenceRegistry
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(presence, "time", types.SimpleNamespace(time=lambda: now[0], sleep=time.sleep))
+    return now
+
+
+@pytest.fixture(params=["memory", "redis"])
+def registry(request, clock):
+    if request.param == "memory":
+        return InMemoryPresenceRegistry()
+    return SharedPresenceRegistry(fakeredis.FakeRedis())
+
+
+def test_registry_is_abstract():
+    with pytest.raises(TypeError):
+        PresenceRegistry()
+
+
+def test_connect_and_disconnect(registry):
+    registry.connect("u1", "s1")
+    registry.connect("u1", "s2")
+    registry.connect("u2", "s3")
+
+    assert sorted(registry.get_socket_ids("u1")) == ["s1", "s2"]
+    assert registry.get_user_id("s3") == "u2"
+    assert (registry.count_users(), registry.count_sockets()) == (2, 3)
+
+    assert registry.disconnect("s1") == "u1"
+    assert registry.is_online("u1")
+    assert registry.disconnect("s2") == "u1"
+    assert not registry.is_online("u1")
+    assert registry.get_user_id("s2") is None
+    assert (registry.count_users(), registry.count_sockets()) == (1, 1)
+
+
+def test_disconnect_unknown_socket(registry):
+    assert registry.disconnect("missing") is None
+    assert registry.count_sockets() == 0
+
+
+def test_dead_workers_sockets_expire(clock):
+    store = fakeredis.FakeRedis()
+    dead = SharedPresenceRegistry(store, ttl=60)
+    alive = SharedPresenceRegistry(store, ttl=60)
+    dead.connect("u1", "s1")
+    alive.connect("u1", "s2")
+    alive.connect("u2", "s3")
+
+    clock[0] += 61
+    # only the live worker refreshed its sockets
+    assert alive.heartbeat() == 1
+
+    assert alive.get_socket_ids("u1") == ["s2"]
+    assert dead.get_user_id("s1") is None
+    assert (alive.count_users(), alive.count_sockets()) == (2, 2)
+
+    alive.disconnect("s2")
+    clock[0] += 61
+    assert alive.heartbeat() == 0
+    assert alive.count_users() == 1
+
+
+def test_reaped_socket_is_not_revived_by_its_worker(clock):
+    store = fakeredis.FakeRedis()
+    registry = SharedPresenceRegistry(store, ttl=60)
+    registry.connect("u1", "s1")
+
+    clock[0] += 61
+    SharedPresenceRegistry(store, ttl=60).heartbeat()
+    registry.heartbeat()
+
+    assert not registry.is_online("u1")
+    assert registry.count_sockets() == 0
+
+
+def test_protocols_follow_their_sockets(registry):
+    registry.connect("u1", "s1", "compact")
+    registry.connect("u1", "s2")
+
+    assert registry.get_socket_protocols("u1") == {"s1": "compact", "s2": None}
+    assert registry.get_socket_protocols("u2") == {}
+
+    registry.disconnect("s1")
+    registry.connect("u1", "s1")
+    assert registry.get_socket_protocols("u1") == {"s1": None, "s2": None}
@@ -0,0 +1,53 @@
+import time
+from datetime import datetime, timezone
+
+import pytest
+
+from app import fanout
+from app.presence import InMemoryPresenceRegistry, discussion_room
+from app.protocol import _epoch_ms
+from conftest import start
+
+
+@pytest.fixture
+def new_york(monkeypatch):
+    monkeypatch.setenv("TZ", "America/New_York")
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+
+def test_naive_times_are_utc():
+    aware = datetime(2024, 5, 1, 12, 30, tzinfo=timezone.utc)
+
+    assert _epoch_ms(aware.replace(tzinfo=None).isoformat()) == _epoch_ms(aware.isoformat())
+    assert _epoch_ms(aware.isoformat()) == int(aware.timestamp() * 1000)
+
+
+def test_new_members_join_the_room_variant_of_their_protocol(app, monkeypatch):
+    # sockets of another worker: this one has no record of their protocol
+    presence = InMemoryPresenceRegistry()
+    presence.connect("u1", "compact-sid", "compact")
+    presence.connect("u2", "json-sid")
+    joined = []
+    monkeypatch.setattr(
+        fanout.socketio.server, "enter_room", lambda sid, room, namespace=None: joined.append((sid, room))
+    )
+
+    fanout.add_members("d1", ["u1", "u2"], presence)
+
+    room = discussion_room("d1")
+    assert sorted(joined) == [("compact-sid", f"{room}:compact"), ("json-sid", room)]
+
+
+def test_message_times_encode_as_now_outside_utc(services, new_york):
+    handler = services.message_handler
+    (alice, _), discussion_id = start(services, "alice", "bob")
+    now_ms = time.time() * 1000
+
+    _, sent = handler.send_message({"discussion_id": discussion_id, "sender_id": alice, "text": "hi"})
+    _, page = handler.get_discussion_messages(discussion_id, user_id=alice)
+
+    for message in (sent["data"], page["data"][-1]):
+        assert abs(_epoch_ms(message["timestamp"]) - now_ms) < 60 * 1000
@@ -0,0 +1,72 @@
+import types
+
+import pytest
+
+from app import events, ratelimit, socketio
+from app.ratelimit import MemoryRateLimitStore, SharedRateLimitStore, TokenBucket
+from conftest import auth_header, make_token
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(ratelimit, "time", types.SimpleNamespace(monotonic=lambda: now[0], time=lambda: now[0]))
+    return now
+
+
+def test_bucket_allows_a_burst_then_refills(clock):
+    bucket = TokenBucket("test", MemoryRateLimitStore(), rate=2, burst=3)
+
+    assert [bucket.take("u1") for _ in range(3)] == [0, 0, 0]
+    assert bucket.take("u1") == pytest.approx(0.5)
+    # other keys have their own bucket
+    assert bucket.take("u2") == 0
+
+    clock[0] += 0.5
+    assert bucket.take("u1") == 0
+    assert bucket.take("u1") == pytest.approx(0.5)
+
+    # a long pause refills no further than the burst
+    clock[0] += 60
+    assert [bucket.take("u1") for _ in range(4)][-1] == pytest.approx(0.5)
+
+
+def test_bucket_without_a_rate_never_refuses():
+    bucket = TokenBucket("test", MemoryRateLimitStore(), rate=0, burst=1)
+
+    assert all(bucket.take("u1") == 0 for _ in range(100))
+
+
+def test_shared_bucket_refuses_past_the_burst():
+    fakeredis = pytest.importorskip("fakeredis")
+    bucket = TokenBucket("test", SharedRateLimitStore(fakeredis.FakeRedis()), rate=0.01, burst=2)
+
+    assert [bucket.take("u1") for _ in range(2)] == [0, 0]
+    assert bucket.take("u1") > 90
+
+
+def test_socket_event_over_budget_gets_429(app, services, monkeypatch):
+    monkeypatch.setattr(events.event_limits["sync"], "rate", 0.01)
+    user_id = str(services.user_handler.create_user("alice", "not-a-real-hash"))
+    client = socketio.test_client(app, auth={"token": make_token(user_id)})
+    client.get_received()
+
+    burst = events.event_limits["sync"].burst
+    for _ in range(burst + 1):
+        client.emit("sync", {})
+    received = client.get_received()
+
+    assert [packet["name"] for packet in received] == ["sync"] * burst + ["error"]
+    error = received[-1]["args"][0]
+    assert error["code"] == 429 and error["retry_after"] > 0
+
+
+def test_route_over_budget_gets_429(client, services, monkeypatch):
+    monkeypatch.setattr(events.event_limits["sync"], "rate", 0.01)
+    user_id = services.user_handler.create_user("alice", "not-a-real-hash")
+
+    burst = events.event_limits["sync"].burst
+    responses = [client.get("/api/diskuss/sync", headers=auth_header(user_id)) for _ in range(burst + 1)]
+
+    assert [response.status_code for response in responses] == [200] * burst + [429]
+    assert int(responses[-1].headers["Retry-After"]) > 0
@@ -0,0 +1,121 @@
+import pytest
+
+from app.readcache import MemoryCacheBackend, ReadCache, SharedCacheBackend
+
+
+def start(services):
+    alice = str(services.user_handler.create_user("alice", "not-a-real-hash"))
+    bob = str(services.user_handler.create_user("bob", "not-a-real-hash"))
+    _, response = services.message_handler.create_or_get_discussion(alice, {"recipient_id": bob})
+    return alice, bob, response["data"]["_id"]
+
+
+def inbox(handler, user_id):
+    status, response = handler.get_discussions(user_id)
+    assert status
+    return response["data"][0]
+
+
+def summary(handler, user_id, discussion_id):
+    status, response = handler.create_or_get_discussion(user_id, {"discussion_id": discussion_id})
+    assert status
+    return response["data"]
+
+
+def send(handler, discussion_id, sender_id, text):
+    status, response = handler.send_message({"discussion_id": discussion_id, "sender_id": sender_id, "text": text})
+    assert status
+    return response["data"]
+
+
+def test_send_invalidates_inbox_and_summary(services):
+    handler = services.message_handler
+    alice, bob, discussion_id = start(services)
+    send(handler, discussion_id, alice, "first")
+    assert inbox(handler, bob)["last_message"]["text"] == "first"
+    summary(handler, bob, discussion_id)
+    hits = handler.cache.stats()["inbox"]["hits"]
+    assert inbox(handler, bob)["last_message"]["text"] == "first"
+    assert handler.cache.stats()["inbox"]["hits"] == hits + 1
+
+    send(handler, discussion_id, alice, "second")
+
+    assert inbox(handler, bob)["last_message"]["text"] == "second"
+    assert inbox(handler, bob)["unread_count"] == 2
+    assert summary(handler, bob, discussion_id)["last_message"]["text"] == "second"
+
+
+def test_edit_invalidates_inbox_and_summary(services):
+    handler = services.message_handler
+    alice, bob, discussion_id = start(services)
+    message = send(handler, discussion_id, alice, "typo")
+    inbox(handler, bob)
+    summary(handler, bob, discussion_id)
+
+    status, _ = handler.update_message(message["_id"], {"text": "fixed"}, user_id=alice)
+
+    assert status
+    assert inbox(handler, bob)["last_message"]["text"] == "fixed"
+    assert summary(handler, bob, discussion_id)["last_message"]["text"] == "fixed"
+
+
+def test_delete_invalidates_inbox_and_summary(services):
+    handler = services.message_handler
+    alice, bob, discussion_id = start(services)
+    send(handler, discussion_id, alice, "kept")
+    message = send(handler, discussion_id, alice, "regretted")
+    inbox(handler, bob)
+    summary(handler, bob, discussion_id)
+
+    status, _ = handler.delete_message(message["_id"], user_id=alice)
+
+    assert status
+    assert inbox(handler, bob)["last_message"]["text"] == "kept"
+    assert summary(handler, bob, discussion_id)["last_message"]["text"] == "kept"
+
+
+def test_mark_read_invalidates_unread_count(services):
+    handler = services.message_handler
+    alice, bob, discussion_id = start(services)
+    send(handler, discussion_id, alice, "one")
+    message = send(handler, discussion_id, alice, "two")
+    assert inbox(handler, bob)["unread_count"] == 2
+
+    status, _ = handler.mark_read(bob, discussion_id, message["_id"])
+    handler.pending_reads.flush()
+
+    assert status
+    assert inbox(handler, bob)["unread_count"] == 0
+
+
+def test_versions_are_bounded_and_evictions_never_serve_stale_entries():
+    backend = MemoryCacheBackend(maxsize=100, max_versions=3)
+    cache = ReadCache(backend)
+    cache.set_summary("never-bumped", cache.get_summary("never-bumped")[1], {"text": "old"})
+
+    for i in range(10):
+        cache.invalidate_inboxes([f"user{i}"])
+
+    assert len(backend._versions) == 3
+    # the eviction moved every unversioned key past what was stored for it
+    assert cache.get_summary("never-bumped")[0] is None
+    page, version = cache.get_inbox("user0", 20, None)
+    cache.set_inbox("user0", version, 20, None, {"discussions": []})
+    assert cache.get_inbox("user0", 20, None)[0] == {"discussions": []}
+    cache.invalidate_inboxes(["user0"])
+    assert cache.get_inbox("user0", 20, None)[0] is None
+
+
+def test_shared_versions_expire_after_their_entries():
+    fakeredis = pytest.importorskip("fakeredis")
+    store = fakeredis.FakeRedis()
+    backend = SharedCacheBackend(store, ttl=60)
+
+    assert backend.version("inbox:user0") == 0
+    backend.bump("inbox:user0")
+    backend.bump("inbox:user0")
+
+    assert backend.version("inbox:user0") == 2
+    assert 60 < store.ttl("diskuss:cache:version:inbox:user0") <= backend.version_ttl
+    store.delete("diskuss:cache:version:inbox:user0")
+    assert backend.version("inbox:user0") == 0
@@ -0,0 +1,103 @@
+import pytest
+
+from conftest import auth_header, start
+
+
+def test_search_users_rejects_bad_limit(client, services):
+    user_id = services.user_handler.create_user("alice", "not-a-real-hash")
+
+    response = client.get("/api/diskuss/users?username=al&limit=abc", headers=auth_header(user_id))
+
+    assert response.status_code == 400
+
+
+def test_search_users_clamps_limit(client, services):
+    user_id = services.user_handler.create_user("alice", "not-a-real-hash")
+    services.user_handler.create_user("alfred", "not-a-real-hash")
+
+    response = client.get("/api/diskuss/users?username=al&limit=1", headers=auth_header(user_id))
+
+    assert response.status_code == 200
+    assert [user["username"] for user in response.get_json()["data"]] == ["alfred"]
+
+
+def sent_message(services):
+    (alice, bob), discussion_id = start(services, "alice", "bob")
+    _, response = services.message_handler.send_message(
+        {"discussion_id": discussion_id, "sender_id": alice, "text": "original"}
+    )
+    return alice, bob, response["data"]["_id"]
+
+
+def test_only_the_sender_edits_or_deletes(client, services, db):
+    alice, bob, message_id = sent_message(services)
+
+    edit = client.patch(f"/api/diskuss/messages/{message_id}", json={"text": "forged"}, headers=auth_header(bob))
+    delete = client.delete(f"/api/diskuss/messages/{message_id}", headers=auth_header(bob))
+
+    assert (edit.status_code, delete.status_code) == (404, 404)
+    stored = db.messages.find_one()
+    assert stored["text"] == "original" and not stored.get("deleted")
+    assert client.patch(
+        f"/api/diskuss/messages/{message_id}", json={"text": "edited"}, headers=auth_header(alice)
+    ).status_code == 200
+
+
+def test_deleted_message_cannot_be_edited_or_deleted_again(client, services):
+    alice, _, message_id = sent_message(services)
+    assert client.delete(f"/api/diskuss/messages/{message_id}", headers=auth_header(alice)).status_code == 200
+
+    edit = client.patch(f"/api/diskuss/messages/{message_id}", json={"text": "back"}, headers=auth_header(alice))
+    delete = client.delete(f"/api/diskuss/messages/{message_id}", headers=auth_header(alice))
+
+    assert (edit.status_code, delete.status_code) == (404, 404)
+
+
+@pytest.fixture
+def auth(monkeypatch):
+    from app import auth
+
+    # cheap hashes, and no per-IP limit carried over between tests from the same address
+    monkeypatch.setattr(auth.hasher, "hash", lambda password: f"hashed:{password}")
+    monkeypatch.setattr(auth.hasher, "check", lambda hashed, password: hashed == f"hashed:{password}")
+    monkeypatch.setattr(auth.hasher, "needs_rehash", lambda hashed: False)
+    for limit in (auth.login_ip_limit, auth.signup_ip_limit):
+        monkeypatch.setattr(limit, "limit", 0)
+    return auth
+
+
+def test_signup_is_limited_per_username(client, auth, monkeypatch):
+    monkeypatch.setattr(auth.signup_username_limit, "limit", 2)
+    credentials = {"username": "limited_signup", "password": "secret"}
+
+    statuses = [client.post("/api/auth/signup", json=credentials).status_code for _ in range(3)]
+
+    assert statuses == [200, 400, 429]
+    assert client.post("/api/auth/signup", json={**credentials, "username": "other_name"}).status_code == 200
+
+
+def test_login_is_limited_per_username(client, auth, monkeypatch):
+    monkeypatch.setattr(auth.login_username_limit, "limit", 2)
+    client.post("/api/auth/signup", json={"username": "limited_login", "password": "secret"})
+    wrong = {"username": "limited_login", "password": "guess"}
+
+    statuses = [client.post("/api/auth/login", json=wrong).status_code for _ in range(3)]
+
+    assert statuses == [401, 401, 429]
+    assert int(client.post("/api/auth/login", json=wrong).headers["Retry-After"]) > 0
+
+
+def test_busy_hasher_answers_503(client, auth, monkeypatch):
+    from app.passwords import HasherBusy
+
+    client.post("/api/auth/signup", json={"username": "busy_login", "password": "secret"})
+
+    def busy(*args):
+        raise HasherBusy()
+    monkeypatch.setattr(auth.hasher, "hash", busy)
+    monkeypatch.setattr(auth.hasher, "check", busy)
+
+    for path, username in (("/api/auth/signup", "busy_signup"), ("/api/auth/login", "busy_login")):
+        response = client.post(path, json={"username": username, "password": "secret"})
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "1"
@@ -0,0 +1,110 @@
+import pytest
+from bson import ObjectId
+
+from app import messages
+from app.config import config
+from app.search import MemorySearchIndex
+from conftest import start
+
+
+@pytest.fixture(autouse=True)
+def memory_search(monkeypatch):
+    # mongomock has no text index; the in-process backend answers the same questions
+    monkeypatch.setitem(config, "search_backend", "memory")
+
+
+def send(handler, discussion_id, sender, text):
+    return handler.send_message({"discussion_id": discussion_id, "sender_id": sender, "text": text})[1]["data"]
+
+
+def search(handler, user_id, query, **kwargs):
+    status, response = handler.search_messages(user_id, query, **kwargs)
+    assert status, response
+    return response
+
+
+def test_results_are_ranked_and_highlighted(services):
+    handler = services.message_handler
+    (alice, _), discussion_id = start(services, "alice", "bob")
+    once = send(handler, discussion_id, alice, "apple banana")
+    thrice = send(handler, discussion_id, alice, "apple apple apple cherry")
+    send(handler, discussion_id, alice, "banana split")
+
+    results = search(handler, alice, "apple")["data"]
+
+    assert [r["_id"] for r in results] == [thrice["_id"], once["_id"]]
+    assert results[0]["score"] > results[1]["score"]
+    assert results[1]["snippet"] == "apple banana"
+    assert results[1]["highlights"] == [[0, 5]]
+
+
+def test_only_the_callers_discussions_are_searched(services):
+    handler = services.message_handler
+    (alice, bob), discussion_id = start(services, "alice", "bob")
+    mallory = str(services.user_handler.create_user("mallory", "not-a-real-hash"))
+    send(handler, discussion_id, alice, "the launch code is secret")
+
+    assert [r["text"] for r in search(handler, bob, "secret")["data"]] == ["the launch code is secret"]
+    assert search(handler, mallory, "secret")["data"] == []
+    status, response = handler.search_messages(mallory, "secret", discussion_id=discussion_id)
+    assert not status and response["code"] == 404
+
+
+def test_edits_and_deletes_replace_indexed_text(services):
+    handler = services.message_handler
+    (alice, _), discussion_id = start(services, "alice", "bob")
+    edited = send(handler, discussion_id, alice, "meet at noon")
+    deleted = send(handler, discussion_id, alice, "meet at dawn")
+
+    handler.update_message(edited["_id"], {"text": "gather at dusk"}, alice)
+    handler.delete_message(deleted["_id"], alice)
+
+    assert search(handler, alice, "meet")["data"] == []
+    assert [r["_id"] for r in search(handler, alice, "dusk")["data"]] == [edited["_id"]]
+
+
+def test_older_versions_do_not_overwrite_newer_ones():
+    index = MemorySearchIndex()
+    message_id = ObjectId()
+
+    index.add({"_id": message_id, "discussion_id": "d1", "text": "fresh words", "version": 5})
+    # a startup load that read the message before the edit
+    index.add({"_id": message_id, "discussion_id": "d1", "text": "stale words", "version": 3})
+    index.remove(message_id, 4)
+
+    assert [hit for hit, _ in index.search("fresh", ["d1"], 0, 10)] == [message_id]
+    assert index.search("stale", ["d1"], 0, 10) == []
+
+    index.remove(message_id, 6)
+    assert index.search("fresh", ["d1"], 0, 10) == []
+    assert len(index) == 0
+
+
+def test_dead_postings_are_compacted():
+    index = MemorySearchIndex()
+    long_id, short_id = ObjectId(), ObjectId()
+    index.add({"_id": long_id, "discussion_id": "d1", "text": "filler " * 100001, "version": 1})
+    index.add({"_id": short_id, "discussion_id": "d1", "text": "filler kept", "version": 2})
+
+    index.remove(long_id, 3)
+
+    assert index._dead_postings == 0
+    assert list(index._postings["filler"][0]) == [1]
+    assert [message_id for message_id, _ in index.search("filler", ["d1"], 0, 10)] == [short_id]
+
+
+def test_cursor_stops_at_the_deepest_result(services, monkeypatch):
+    monkeypatch.setattr(messages, "MAX_SEARCH_RESULTS", 3)
+    handler = services.message_handler
+    (alice, _), discussion_id = start(services, "alice", "bob")
+    for i in range(5):
+        send(handler, discussion_id, alice, f"report {i}")
+
+    first = search(handler, alice, "report", limit=2)
+    second = search(handler, alice, "report", limit=2, cursor=first["next_cursor"])
+
+    assert (len(first["data"]), first["next_cursor"]) == (2, "2")
+    assert (len(second["data"]), second["next_cursor"]) == (1, None)
+    assert search(handler, alice, "report", cursor="3")["data"] == []
+    status, response = handler.search_messages(alice, "report", cursor="-1")
+    assert not status and response["code"] == 400
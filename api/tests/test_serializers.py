@@ -0,0 +1,23 @@
+import os
+import subprocess
+import sys
+
+# a fresh interpreter where importing orjson fails
+PROBE = """
+import sys
+sys.modules["orjson"] = None
+from app.serializers import dumps, loads
+print(dumps({"a": [1, "x"]}))
+assert loads(dumps({"a": 1})) == {"a": 1}
+"""
+
+
+def test_json_fallback_works_and_warns():
+    api_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    result = subprocess.run(
+        [sys.executable, "-c", PROBE], cwd=api_dir, env=os.environ,
+        capture_output=True, text=True, timeout=60, check=True,
+    )
+
+    assert result.stdout.strip() == '{"a":[1,"x"]}'
+    assert "orjson is not installed" in result.stderr
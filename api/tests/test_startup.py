@@ -0,0 +1,55 @@
+import json
+import os
+import subprocess
+import sys
+
+# runs in a fresh interpreter so the app is imported from scratch
+PROBE = """
+import json
+import pymongo
+from pymongo import monitoring
+
+clients, commands = [], []
+
+class RecordingClient(pymongo.MongoClient):
+    def __init__(self, *args, **kwargs):
+        clients.append(args)
+        super().__init__(*args, **kwargs)
+
+class Commands(monitoring.CommandListener):
+    def started(self, event):
+        commands.append(event.command_name)
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+pymongo.MongoClient = RecordingClient
+monitoring.register(Commands())
+
+import app
+imported = len(clients)
+flask_app = app.create_app()
+live = flask_app.test_client().get("/health/live").status_code
+print(json.dumps({"clients_at_import": imported, "commands": commands, "live": live}))
+"""
+
+
+def test_import_and_create_app_do_not_touch_mongo():
+    env = {
+        **os.environ,
+        # nothing listens here; any operation would block on server selection and fail
+        "MONGO_URI": "mongodb://127.0.0.1:1/diskuss",
+        "MONGO_SERVER_SELECTION_TIMEOUT_MS": "100",
+        "ENSURE_INDEXES": "0",
+    }
+    api_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE], cwd=api_dir, env=env,
+        capture_output=True, text=True, timeout=60, check=True,
+    ).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+
+    assert result == {"clients_at_import": 0, "commands": [], "live": 200}
@@ -0,0 +1,99 @@
+from datetime import datetime, timezone
+
+from bson import ObjectId
+
+from app import messages
+from conftest import start
+
+
+def sync_all(handler, user_id, token, limit=500):
+    pages = []
+    while True:
+        status, response = handler.sync(user_id, token, limit=limit)
+        assert status
+        pages.append(response)
+        token = response["token"]
+        if not response["has_more"]:
+            return pages, token
+
+
+def send(handler, discussion_id, sender, text):
+    return handler.send_message({"discussion_id": discussion_id, "sender_id": sender, "text": text})[1]["data"]
+
+
+def test_sync_returns_changes_after_the_token(services):
+    handler = services.message_handler
+    (alice, bob), discussion_id = start(services, "alice", "bob")
+    kept = send(handler, discussion_id, alice, "kept")
+    _, reset = handler.sync(bob)
+    assert reset["reset"]
+
+    edited = send(handler, discussion_id, alice, "before")
+    deleted = send(handler, discussion_id, bob, "gone")
+    handler.update_message(edited["_id"], {"text": "after"}, alice)
+    handler.delete_message(deleted["_id"], bob)
+
+    pages, token = sync_all(handler, bob, reset["token"])
+    changes = {m["_id"]: m for page in pages for m in page["messages"]}
+    assert kept["_id"] not in changes
+    assert changes[edited["_id"]]["text"] == "after"
+    assert changes[deleted["_id"]]["deleted"]
+    assert pages[0]["discussions"][0]["last_message"]["text"] == "after"
+
+    _, again = handler.sync(bob, token)
+    assert again["messages"] == [] and again["discussions"] == []
+
+
+def test_sync_pages_through_discussions(services):
+    handler = services.message_handler
+    (alice, bob), first = start(services, "alice", "bob")
+    _, second = handler.create_or_get_discussion(bob, participants=[alice, str(
+        services.user_handler.create_user("carol", "not-a-real-hash")
+    )])
+    second = second["data"]["_id"]
+    _, reset = handler.sync(bob)
+    sent = {send(handler, d, alice, f"m{i}")["_id"] for i in range(5) for d in (first, second)}
+
+    pages, _ = sync_all(handler, bob, reset["token"], limit=3)
+
+    assert len(pages) > 1
+    assert sent <= {m["_id"] for page in pages for m in page["messages"]}
+
+
+def test_sync_holds_the_token_before_a_message_still_being_written(services, db, monkeypatch):
+    handler = services.message_handler
+    (alice, bob), discussion_id = start(services, "alice", "bob")
+    _, reset = handler.sync(bob)
+
+    # a send that took its version but has not inserted yet, overtaken by another
+    slow_id = ObjectId()
+    version, seq = handler._reserve(discussion_id, slow_id, 1, 1)
+    fast = send(handler, discussion_id, alice, "fast")
+    _, first = handler.sync(bob, reset["token"])
+    assert [m["_id"] for m in first["messages"]] == [fast["_id"]]
+
+    db.messages.insert_one({
+        "_id": slow_id, "discussion_id": discussion_id, "sender_id": alice, "recipient_id": bob,
+        "text": "slow", "timestamp": datetime.now(timezone.utc), "version": version, "seq": seq,
+    })
+    _, second = handler.sync(bob, first["token"])
+    assert str(slow_id) in [m["_id"] for m in second["messages"]]
+
+    # a write that never lands stops holding the token back after a while
+    handler._reserve(discussion_id, ObjectId())
+    send(handler, discussion_id, alice, "after a failed write")
+    _, held = handler.sync(bob, second["token"])
+    _, still = handler.sync(bob, held["token"])
+    assert still["messages"]
+    monkeypatch.setattr(messages, "IN_FLIGHT_SECONDS", 0)
+    _, settled = handler.sync(bob, still["token"])
+    _, done = handler.sync(bob, settled["token"])
+    assert done["messages"] == []
+
+
+def test_sync_rejects_a_bad_token(services):
+    (alice, _), _ = start(services, "alice", "bob")
+
+    status, response = services.message_handler.sync(alice, "not-a-token")
+
+    assert not status and response["code"] == 400
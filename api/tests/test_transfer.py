@@ -0,0 +1,79 @@
+import mongomock
+
+from app.messages import MessageHandler
+from app.transfer import export_records, import_records, ndjson_lines
+from conftest import start
+
+
+def send(handler, discussion_id, sender, text):
+    return handler.send_message({"discussion_id": discussion_id, "sender_id": sender, "text": text})[1]["data"]
+
+
+def exported(db, user_id=None, resume=None, batch_size=1000):
+    return list(ndjson_lines(export_records(db, user_id, resume=resume, batch_size=batch_size)))
+
+
+def test_user_export_keeps_only_their_read_cursor(services, db):
+    handler = services.message_handler
+    (alice, bob), discussion_id = start(services, "alice", "bob")
+    send(handler, discussion_id, alice, "hi")
+    send(handler, discussion_id, bob, "hello")
+    handler.pending_reads.flush()
+
+    records = list(export_records(db, alice))
+
+    discussion = records[0]["data"]
+    assert set(discussion["reads"]) == {alice}
+    assert "changes" not in discussion
+
+
+def test_import_merges_into_the_discussion_of_the_same_participants(services, db):
+    handler = services.message_handler
+    (alice, bob), discussion_id = start(services, "alice", "bob")
+    first = send(handler, discussion_id, alice, "one")
+    send(handler, discussion_id, alice, "two")
+    handler.mark_read(bob, discussion_id, first["_id"])
+    handler.pending_reads.flush()
+    lines = exported(db)
+
+    target = mongomock.MongoClient().target
+    target_handler = MessageHandler(target)
+    target_handler.ensure_indexes()
+    existing, _ = target_handler._upsert_discussion(sorted([alice, bob]), False)
+    existing_id = str(existing["_id"])
+    send(target_handler, existing_id, bob, "already here")
+
+    counts = import_records(target, iter(lines))
+
+    assert counts == {"discussions": 1, "messages": 2}
+    assert target.discussions.count_documents({}) == 1
+    stored = list(target.messages.find({}, sort=[("seq", 1)]))
+    assert [(m["text"], m["seq"]) for m in stored] == [("already here", 1), ("one", 2), ("two", 3)]
+    assert all(m["discussion_id"] == existing_id for m in stored)
+    assert len({m["version"] for m in stored}) == 3
+    discussion = target.discussions.find_one()
+    assert discussion["message_seq"] == 3
+    # the target's own message is newer, so it stays the summary
+    assert discussion["last_message"]["text"] == "already here"
+    assert discussion["reads"][bob]["seq"] == 2
+
+    assert import_records(target, iter(lines))["messages"] == 0
+    assert target.messages.count_documents({}) == 3
+    assert target.discussions.find_one()["message_seq"] == 3
+
+
+def test_resumed_export_imports_on_its_own(services, db):
+    handler = services.message_handler
+    (alice, _), discussion_id = start(services, "alice", "bob")
+    for i in range(5):
+        send(handler, discussion_id, alice, f"m{i}")
+    records = list(export_records(db, batch_size=3))
+    resume = next(r["resume"] for r in records if r["type"] == "checkpoint")
+
+    target = mongomock.MongoClient().target
+    MessageHandler(target).ensure_indexes()
+    counts = import_records(target, iter(exported(db, resume=resume)))
+
+    assert counts == {"discussions": 1, "messages": 3}
+    assert [m["seq"] for m in target.messages.find({}, sort=[("seq", 1)])] == [1, 2, 3]
+    assert target.discussions.find_one()["last_message"]["text"] == "m4"
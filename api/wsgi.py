@@ -0,0 +1,26 @@
+"""Production entry point: gunicorn -c gunicorn.conf.py wsgi:app"""
+import os
+
+# the async library has to patch the standard library before anything else is imported
+async_mode = os.getenv("ASYNC_MODE", "eventlet")
+if async_mode == "eventlet":
+  import eventlet
+  eventlet.monkey_patch()
+elif async_mode == "gevent":
+  from gevent import monkey
+  monkey.patch_all()
+os.environ["ASYNC_MODE"] = async_mode
+
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+started = time.perf_counter()
+from app import create_app
+
+app = create_app()
+app.logger.info(
+  "diskuss api ready in %.0f ms (async_mode=%s, pid=%d)",
+  (time.perf_counter() - started) * 1000, async_mode, os.getpid(),
+)
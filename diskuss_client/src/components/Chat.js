@@ -1,7 +1,7 @@
 import React, { useRef, useState, useEffect } from 'react';
 import MessageInput from './MessageInput';
 
-const Chat = ({ discussion, user, socket, onNewMessage }) => {
+const Chat = ({ discussion, user, socket }) => {
   const socketRef = useRef(null);
   const bottomRef = useRef(null);
   const [messages, setMessages] = useState([]);
@@ -24,8 +24,8 @@ const Chat = ({ discussion, user, socket, onNewMessage }) => {
       offset,
     });
 
-    socket.on('get_discussion_messages', (data) => {
-      setMessages(data);
+    socket.on('get_discussion_messages', (response) => {
+      setMessages(response.data);
       setLoading(false);
     });
 
@@ -46,13 +46,25 @@ const Chat = ({ discussion, user, socket, onNewMessage }) => {
     if (!socket) return;
 
     const handleReceiveMessage = (message) => {
-      setMessages((prevMessages) => [...message.data]);
+      if (message.discussion_id !== discussion_id) return;
+      setMessages((prevMessages) => [...prevMessages, message]);
+      bottomRef.current?.scrollIntoView({ behavior: 'smooth' });
+    };
+
+    const handleReceiveMessages = (batch) => {
+      if (batch.discussion_id !== discussion_id) return;
+      setMessages((prevMessages) => [...prevMessages, ...batch.data]);
       bottomRef.current?.scrollIntoView({ behavior: 'smooth' });
     };
 
     socket.on("receive_message", handleReceiveMessage);
+    socket.on("receive_messages", handleReceiveMessages);
 
-  }, [socket]);
+    return () => {
+      socket.off("receive_message", handleReceiveMessage);
+      socket.off("receive_messages", handleReceiveMessages);
+    };
+  }, [socket, discussion_id]);
 
   return (
     <div className="flex flex-col h-full p-4">
@@ -98,7 +110,6 @@ const Chat = ({ discussion, user, socket, onNewMessage }) => {
         socket={socket}
         discussion_id={discussion_id}
         recipient_id={discussion.participants.find(p => p._id !== user._id)._id}
-        onNewMessage={onNewMessage}
       />
     </div>
   );
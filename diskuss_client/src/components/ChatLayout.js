@@ -58,6 +58,29 @@ const ChatLayout = ({ user }) => {
     };
   }, [user, navigate]);
 
+  useEffect(() => {
+    if (!socket) return;
+
+    const handleDiscussionUpdated = (update) => {
+      setDiscussions((prev) => {
+        const target = prev.find((disc) => disc._id === update.discussion_id);
+        if (!target) return prev;
+        const updated = {
+          ...target,
+          last_message: update.last_message,
+          last_message_timestamp: update.last_message_timestamp,
+        };
+        return [updated, ...prev.filter((disc) => disc._id !== update.discussion_id)];
+      });
+    };
+
+    socket.on("discussion_updated", handleDiscussionUpdated);
+
+    return () => {
+      socket.off("discussion_updated", handleDiscussionUpdated);
+    };
+  }, [socket]);
+
   if (!socketReady) {
     return <div className="p-4 text-center">Connecting to chat...</div>;
   }
@@ -142,9 +165,6 @@ const ChatLayout = ({ user }) => {
               user={user}
               discussion={activeDiscussion}
               socket={socket}
-              onNewMessage={(discussions) => {
-                setDiscussions(discussions);
-              }}
             />
           ) : (
             <div className="flex items-center justify-center h-full">
@@ -1,6 +1,6 @@
-import React, { useEffect, useState } from 'react';
+import React, { useState } from 'react';
 
-const MessageInput = ({ socket, discussion_id, recipient_id, onNewMessage}) => {
+const MessageInput = ({ socket, discussion_id, recipient_id }) => {
   const [text, setText] = useState('');
 
   const handleSubmit = (e) => {
@@ -12,15 +12,8 @@ const MessageInput = ({ socket, discussion_id, recipient_id, onNewMessage}) => {
 
     socket.emit('send_message', messagePayload);
     setText('');
-    socket.emit('get_discussions', {discussion_id});
   };
 
-  useEffect(() => {
-    socket.on('get_discussions', (data) => {
-      onNewMessage(data);
-    });
-  }, [onNewMessage, socket]);
-
   return (
     <form
       onSubmit={handleSubmit}